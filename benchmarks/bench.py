@@ -0,0 +1,462 @@
+#!/bin/python
+"""
+Micro-benchmarks of the verification hot paths, each stage in isolation.
+
+    reservoir_load      opening a model's reservoir file
+    reservoir_sampling  tmb.reservoir_sampling: Algorithm R offer, pwrite and fit cache update
+    gcc_compile         building the reference stats_verify binary (skipped without GSL)
+    stats_verify        statsVerify, the in-process port, reading and fitting the reservoir file
+    stats_verify_binary one run of the compiled binary (skipped without GSL)
+    fit_cache_verify    the cached fit /finished evaluates
+    export_signature    export_signature.sh (only with --export, needs a TPM and sudo)
+    ima_parse           full_verify's walk of the IMA log, ima-ng templates decoded
+    boot_parse          walk of the TCG2 firmware event log
+    ima_replay          replay_measurements: template checks and PCR 10-12 replay
+    boot_replay         full_verify.verify_boot_log: command line check and PCR 0-9 replay
+    pcr_extend_many     PCRVerifier.extend_many over a raw sha1 digest chain
+    audit_verify        verify_audit_log from scratch, and resumed after a grown log (still O(n))
+    full_verify         verify_bundle end to end on a signed synthetic bundle
+
+Fixtures come from fixtures.py at sizes from the smallest to realistic
+(reservoirs of 10 to 100k rows, IMA logs of 1k to 1M records). Each run is
+appended to a JSON-lines history with the commit and host it ran on, and
+compared stage by stage with an earlier run, so optimisation work can be
+judged against a baseline:
+
+    python benchmarks/bench.py                       # run all, compare with the previous run
+    python benchmarks/bench.py --quick --stages ima_replay,pcr_extend_many
+    python benchmarks/bench.py --baseline 2ede648    # compare with the last run of that commit
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import shlex
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Iterator, NamedTuple, Optional
+
+benchDir = os.path.dirname(os.path.abspath(__file__))
+repoDir = os.path.dirname(benchDir)
+DEFAULT_HISTORY = os.path.join(benchDir, "results.jsonl")
+
+RESERVOIR_SIZES = (10, 1_000, 100_000)
+IMA_SIZES = (1_000, 10_000, 100_000, 1_000_000)
+BOOT_SIZES = (100, 1_000, 10_000)
+AUDIT_SIZES = (1_000, 10_000, 100_000)
+BUNDLE_SIZES = (1_000, 100_000)
+QUICK_LIMIT = 10_000
+# samples offered per reservoir_sampling measurement
+SAMPLING_BATCH = 200
+# fast cases are measured until this many seconds are spent, to keep their median stable
+MIN_TIME = 0.5
+MAX_RUNS = 1000
+
+
+class Case(NamedTuple):
+    size: Optional[int]
+    # items processed per call, for the rate column
+    items: int
+    unit: str
+    run: Callable[[], object]
+
+
+class Skip(Exception):
+    pass
+
+
+class Context(NamedTuple):
+    workDir: str
+    quick: bool
+    export: bool
+
+    def sizes(self, sizes: tuple) -> list:
+        return [size for size in sizes if not self.quick or size <= QUICK_LIMIT]
+
+
+STAGES: dict[str, Callable[[Context], Iterator[Case]]] = {}
+
+
+def stage(name: str):
+    def register(function):
+        STAGES[name] = function
+        return function
+
+    return register
+
+
+# ------------------------------------------------------------
+# tmb server
+# ------------------------------------------------------------
+def reservoir_file(ctx: Context, size: int) -> str:
+    import fixtures
+
+    path = os.path.join(ctx.workDir, f"reservoir_{size}", "bench_storage.csv")
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path))
+        fixtures.write_reservoir(path, size)
+    return path
+
+
+@stage("reservoir_load")
+def reservoir_load(ctx: Context):
+    from reservoir import Reservoir
+
+    for size in ctx.sizes(RESERVOIR_SIZES):
+        path = reservoir_file(ctx, size)
+        yield Case(size, size, "rows", lambda path=path, size=size: Reservoir(path, size))
+
+
+@stage("reservoir_sampling")
+def reservoir_sampling(ctx: Context):
+    import fixtures
+    import tmb
+    from fit_cache import FitCache
+    from reservoir import ReservoirStore
+
+    for size in ctx.sizes(RESERVOIR_SIZES):
+        # a copy, the other stages keep reading the fixture as generated
+        baseDir = os.path.join(ctx.workDir, f"sampling_{size}")
+        os.makedirs(baseDir)
+        shutil.copy(reservoir_file(ctx, size), os.path.join(baseDir, "bench_storage.csv"))
+        tmb.reservoirStore = ReservoirStore(baseDir, size)
+        tmb.fitCache = FitCache()
+        tmb.fitCache.get("bench", tmb.reservoirStore.storageFile("bench"))
+        samples = fixtures.reservoir_rows(SAMPLING_BATCH, seed=size)
+
+        def offer(samples=samples):
+            for sample in samples:
+                tmb.reservoir_sampling("bench", *sample)
+
+        yield Case(size, SAMPLING_BATCH, "samples", offer)
+
+
+def stats_verify_sources() -> list:
+    sources = ["stats_verify.c", "utils.c", "gpu-utilization/utils.c", "powerdraw/utils.c", "vram/utils.c"]
+    return [os.path.join(repoDir, "tmb-server", source) for source in sources]
+
+
+def gsl_flags() -> list:
+    try:
+        return shlex.split(subprocess.check_output(["pkg-config", "--cflags", "--libs", "gsl"], text=True, stderr=subprocess.DEVNULL))
+    except (OSError, subprocess.CalledProcessError):
+        raise Skip("GSL not available for the reference binary")
+
+
+def compile_stats_verify(executable: str, flags: list):
+    subprocess.run(["gcc", *stats_verify_sources(), "-o", executable, *flags, "-lm"], check=True)
+
+
+@stage("gcc_compile")
+def gcc_compile(ctx: Context):
+    flags = gsl_flags()
+    executable = os.path.join(ctx.workDir, "stats_verify_compile")
+    yield Case(None, 1, "builds", lambda: compile_stats_verify(executable, flags))
+
+
+@stage("stats_verify")
+def stats_verify(ctx: Context):
+    from stats_verify import statsVerify
+
+    for size in ctx.sizes(RESERVOIR_SIZES):
+        path = reservoir_file(ctx, size)
+        yield Case(size, size, "rows", lambda path=path: statsVerify(path, 0.6, 0.4, 5000.0))
+
+
+@stage("stats_verify_binary")
+def stats_verify_binary(ctx: Context):
+    executable = os.path.join(ctx.workDir, "stats_verify")
+    if not os.path.exists(executable):
+        compile_stats_verify(executable, gsl_flags())
+    for size in ctx.sizes(RESERVOIR_SIZES):
+        command = [executable, reservoir_file(ctx, size), "0.6", "0.4", "5000"]
+        yield Case(size, size, "rows", lambda command=command: subprocess.run(command, capture_output=True, check=True))
+
+
+@stage("fit_cache_verify")
+def fit_cache_verify(ctx: Context):
+    from fit_cache import FitCache
+
+    for size in ctx.sizes(RESERVOIR_SIZES):
+        cache = FitCache()
+        path = reservoir_file(ctx, size)
+        cache.get("bench", path)
+        yield Case(size, 1, "verdicts", lambda cache=cache, path=path: cache.verify("bench", path, 0.6, 0.4, 5000.0))
+
+
+@stage("export_signature")
+def export_signature(ctx: Context):
+    if not ctx.export:
+        raise Skip("pass --export on a host with a TPM")
+    if shutil.which("tpm2_quote") is None:
+        raise Skip("tpm2-tools not installed")
+    script = os.path.join(repoDir, "verifier", "scripts", "export_signature.sh")
+    bundle = os.path.join(ctx.workDir, "signature.zip")
+
+    def export():
+        if os.path.exists(bundle):
+            os.remove(bundle)
+        subprocess.run(["sudo", script, "-o", bundle], cwd=repoDir, capture_output=True, check=True)
+
+    yield Case(None, 1, "bundles", export)
+
+
+# ------------------------------------------------------------
+# verifier
+# ------------------------------------------------------------
+def ima_fixture(size: int):
+    import fixtures
+
+    return fixtures.ima_log(size)
+
+
+@stage("ima_parse")
+def ima_parse(ctx: Context):
+    from event_log import iter_ima_records, parse_ima_ng
+
+    def parse(data: bytes):
+        for record in iter_ima_records(data):
+            if record.template_name == b"ima-ng":
+                parse_ima_ng(record.template_data)
+
+    for size in ctx.sizes(IMA_SIZES):
+        data = ima_fixture(size).data
+        yield Case(size, size, "records", lambda data=data: parse(data))
+
+
+@stage("boot_parse")
+def boot_parse(ctx: Context):
+    import fixtures
+    from event_log import iter_boot_events
+
+    for size in ctx.sizes(BOOT_SIZES):
+        data = fixtures.boot_log(size).data
+        yield Case(size, size, "events", lambda data=data: sum(1 for _ in iter_boot_events(data)))
+
+
+@stage("ima_replay")
+def ima_replay(ctx: Context):
+    from full_verify import replay_measurements
+
+    for size in ctx.sizes(IMA_SIZES):
+        ima = ima_fixture(size)
+        expected = [b"\x00" * 20] * 10 + [ima.pcrs[i] for i in (10, 11, 12)]
+        yield Case(size, size, "records", lambda ima=ima, expected=expected: replay_measurements(ima.data, expected))
+
+
+@stage("boot_replay")
+def boot_replay(ctx: Context):
+    import fixtures
+    from full_verify import verify_boot_log
+
+    for size in ctx.sizes(BOOT_SIZES):
+        boot = fixtures.boot_log(size)
+        yield Case(size, size, "events", lambda boot=boot: verify_boot_log(boot.data, boot.pcrs))
+
+
+@stage("pcr_extend_many")
+def pcr_extend_many(ctx: Context):
+    from pcr import PCRVerifier, _benchmark_digests
+
+    for size in ctx.sizes(IMA_SIZES):
+        digests = _benchmark_digests(size, 20)
+        yield Case(size, size, "extends", lambda digests=digests: PCRVerifier(["sha1"]).extend_many(10, "sha1", digests))
+
+
+@stage("audit_verify")
+def audit_verify(ctx: Context):
+    import fixtures
+    from audit_log import verify_audit_log
+
+    for size in ctx.sizes(AUDIT_SIZES):
+        audit = fixtures.audit_log(size)
+        yield Case(size, size, "lines", lambda audit=audit: verify_audit_log(audit.data, audit.attested_hash))
+
+    # resumed: the previous run matched at half the attested prefix, the log has grown since.
+    # The saved prefix is hashed again in one pass, this saves its per-line digests, not its hashing.
+    for size in ctx.sizes(AUDIT_SIZES):
+        audit = fixtures.audit_log(size)
+        earlier = fixtures.audit_log(size, attested=0.45)
+        previous = verify_audit_log(earlier.data, earlier.attested_hash)
+        yield Case(
+            f"{size} resumed",
+            size,
+            "lines",
+            lambda audit=audit, previous=previous: verify_audit_log(audit.data, audit.attested_hash, previous),
+        )
+
+
+@stage("full_verify")
+def full_verify(ctx: Context):
+    import fixtures
+    from full_verify import verify_bundle
+
+    for size in ctx.sizes(BUNDLE_SIZES):
+        bundle = fixtures.bundle(size)
+        yield Case(size, size, "records", lambda bundle=bundle: verify_bundle(bundle, cache_path=None))
+
+
+# ------------------------------------------------------------
+# runner
+# ------------------------------------------------------------
+def measure(run: Callable[[], object], repeat: int, budget: float) -> list[float]:
+    """
+    Wall times of at least repeat calls, more for fast cases until MIN_TIME
+    is spent, fewer once budget seconds are (always at least one call).
+    """
+    times = []
+    spent = 0.0
+    while len(times) < MAX_RUNS:
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+        spent += times[-1]
+        if spent > budget or (len(times) >= repeat and spent > MIN_TIME):
+            break
+    return times
+
+
+def run_stages(names: list, ctx: Context, repeat: int, budget: float, report=print) -> dict:
+    results = {}
+    for name in names:
+        try:
+            # the verifier reports progress on stdout, the tmb server logs every sample
+            with contextlib.redirect_stdout(io.StringIO()):
+                cases = list(STAGES[name](ctx))
+                measured = [(case, measure(case.run, repeat, budget)) for case in cases]
+        except Skip as e:
+            report(f"{name:<22} skipped: {e}")
+            continue
+        for case, times in measured:
+            key = name if case.size is None else f"{name}[{case.size}]"
+            median = statistics.median(times)
+            results[key] = {
+                "median": median,
+                "min": min(times),
+                "runs": len(times),
+                "unit": case.unit,
+                "rate": case.items / median if median else None,
+            }
+            report(format_result(key, results[key]))
+    return results
+
+
+def format_result(key: str, result: dict, baseline: Optional[dict] = None) -> str:
+    line = f"{key:<34}{result['median'] * 1000:>12.3f} ms{result['rate']:>16,.0f} {result['unit']}/s"
+    if baseline is not None:
+        line += f"{change(result, baseline):>+10.1%}"
+    return line
+
+
+def change(result: dict, baseline: dict) -> float:
+    """Relative change of the median time, positive is slower."""
+    return result["median"] / baseline["median"] - 1
+
+
+def git_revision() -> Optional[str]:
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=repoDir, text=True, stderr=subprocess.DEVNULL).strip()
+        dirty = subprocess.run(["git", "diff", "--quiet", "HEAD"], cwd=repoDir, stderr=subprocess.DEVNULL).returncode != 0
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("-dirty" if dirty else "")
+
+
+def read_history(path: str) -> list[dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path, "r") as history:
+        return [json.loads(line) for line in history if line.strip()]
+
+
+def find_baseline(history: list[dict], host: str, commit: Optional[str] = None) -> Optional[dict]:
+    """Latest run on this host, of commit when given; runs on other hosts are not comparable."""
+    for run in reversed(history):
+        if run["host"] != host:
+            continue
+        if commit is None or (run["commit"] or "").startswith(commit):
+            return run
+    return None
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> tuple[list[str], list[str]]:
+    """Report lines of every stage both runs measured, and the keys that got slower than threshold."""
+    lines, regressions = [], []
+    for key, result in results.items():
+        previous = baseline["results"].get(key)
+        if previous is None:
+            continue
+        lines.append(format_result(key, result, previous))
+        if change(result, previous) > threshold:
+            regressions.append(key)
+    return lines, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the verification stages on synthetic fixtures")
+    parser.add_argument("--stages", help=f"Comma separated subset of: {', '.join(STAGES)}")
+    parser.add_argument("--quick", action="store_true", help=f"Only fixtures of up to {QUICK_LIMIT:,} items")
+    parser.add_argument("--repeat", type=int, default=5, help="Measurements per case, the median is reported")
+    parser.add_argument("--budget", type=float, default=10.0, help="Seconds per case after which fewer measurements are taken")
+    parser.add_argument("--export", action="store_true", help="Also run export_signature.sh (needs a TPM and sudo)")
+    parser.add_argument("--history", default=DEFAULT_HISTORY, help="JSON-lines file runs are appended to")
+    parser.add_argument("--no-save", action="store_true", help="Do not append this run to the history")
+    parser.add_argument("--baseline", help="Commit to compare with, defaults to the previous run on this host")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Slowdown reported as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with 1 when a stage regressed")
+    args = parser.parse_args()
+
+    names = args.stages.split(",") if args.stages else list(STAGES)
+    unknown = [name for name in names if name not in STAGES]
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(unknown)}")
+
+    # every reservoir row is read and fitted, not just the default 200
+    os.environ["TMB_BUFFER_CAPACITY"] = str(max(RESERVOIR_SIZES))
+    sys.path.append(benchDir)
+    sys.path.append(os.path.join(repoDir, "tmb-server"))
+    sys.path.append(os.path.join(repoDir, "verifier"))
+    import structlog
+
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING))
+
+    with tempfile.TemporaryDirectory(prefix="tmb_bench_") as workDir:
+        results = run_stages(names, Context(workDir, args.quick, args.export), args.repeat, args.budget)
+
+    host = platform.node()
+    history = read_history(args.history)
+    baseline = find_baseline(history, host, args.baseline)
+    regressions = []
+    if baseline is not None:
+        lines, regressions = compare(results, baseline, args.threshold)
+        print(f"\nchange in median time against {baseline['commit']} ({baseline['timestamp']}):")
+        print("\n".join(lines))
+        if regressions:
+            print(f"regressed by more than {args.threshold:.0%}: {', '.join(regressions)}")
+    elif args.baseline:
+        print(f"\nno run of {args.baseline} on {host} in {args.history}")
+
+    if not args.no_save:
+        run = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": git_revision(),
+            "host": host,
+            "python": platform.python_version(),
+            "quick": args.quick,
+            "results": results,
+        }
+        with open(args.history, "a") as history:
+            history.write(json.dumps(run) + "\n")
+
+    return 1 if args.fail_on_regression and regressions else 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,219 @@
+"""
+Synthetic inputs for the benchmarks, in the formats the verification code reads.
+
+Every generator is deterministic for a given size and seed and computes the
+values a matching TPM quote would hold with its own hashlib calls, so the
+fixtures also check the verifier rather than just feed it.
+
+    reservoir     {model}_storage.csv in the fixed-width layout reservoir.py writes
+    IMA log       binary_runtime_measurements_sha1 of ima-ng records
+    boot log      crypto-agile TCG2 binary_bios_measurements (sha1 and sha256 banks)
+    audit log     audit.log lines, the attested hash taken over a prefix
+    bundle        the zip export_signature.sh produces, signed with a throwaway key
+"""
+import hashlib
+import io
+import os
+import random
+import struct
+import sys
+import zipfile
+from typing import NamedTuple
+
+repoDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(repoDir, "tmb-server"))
+sys.path.append(os.path.join(repoDir, "verifier"))
+from reservoir import HEADER, formatRow
+
+SHA1_ZERO = b"\x00" * 20
+AUDIT_RULES_PATH = b"/etc/audit/rules.d/audit.rules"
+AUDIT_LOG_PATH = b"/var/log/audit/audit.log"
+SECURE_CMDLINE = b"BOOT_IMAGE=/boot/vmlinuz-6.8.0 root=/dev/mapper/root ro lsm=integrity ima_policy=tcb"
+# one in this many IMA records is a violation, logged with a zero template hash
+VIOLATION_EVERY = 1000
+
+_u16 = struct.Struct("<H")
+_u32 = struct.Struct("<I")
+
+
+def extend(value: bytes, digest: bytes, algorithm=hashlib.sha1) -> bytes:
+    return algorithm(value + digest).digest()
+
+
+# ------------------------------------------------------------
+# reservoir
+# ------------------------------------------------------------
+def reservoir_rows(count: int, seed: int = 0) -> list[tuple]:
+    """Reference samples shaped like a.csv: beta-ish utilisation, stable vram, bimodal power in mW."""
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(count):
+        power = rng.gauss(4200, 250) if rng.random() < 0.5 else rng.gauss(6100, 300)
+        rows.append((rng.betavariate(4, 3), rng.betavariate(40, 60), power))
+    return rows
+
+
+def write_reservoir(path: str, count: int, seed: int = 0) -> str:
+    with open(path, "wb") as storage:
+        storage.write(HEADER)
+        storage.writelines(formatRow(row) for row in reservoir_rows(count, seed))
+    return path
+
+
+# ------------------------------------------------------------
+# IMA measurement list
+# ------------------------------------------------------------
+def ima_ng_record(pcr_index: int, file_name: bytes, algorithm: bytes, file_hash: bytes, violation: bool = False) -> bytes:
+    hash_field = algorithm + b":\x00" + file_hash
+    name_field = file_name + b"\x00"
+    template_data = _u32.pack(len(hash_field)) + hash_field + _u32.pack(len(name_field)) + name_field
+    template_hash = SHA1_ZERO if violation else hashlib.sha1(template_data).digest()
+    return (
+        _u32.pack(pcr_index)
+        + template_hash
+        + _u32.pack(6)
+        + b"ima-ng"
+        + _u32.pack(len(template_data))
+        + template_data
+    )
+
+
+class ImaLog(NamedTuple):
+    data: bytes
+    records: int
+    # PCR 10-12 after replaying every record
+    pcrs: dict
+
+
+def ima_log(count: int, seed: int = 0, audit_rules: bytes = b"", audit_hash: bytes = b"") -> ImaLog:
+    """
+    count ima-ng records spread over PCR 10-12, mostly PCR 10. When given,
+    the sha256 of the audit rules and the attested audit log hash are
+    measured near the end, where the bundle check looks them up.
+    """
+    rng = random.Random(seed)
+    pcrs = {10: SHA1_ZERO, 11: SHA1_ZERO, 12: SHA1_ZERO}
+    measured = {}
+    if audit_rules:
+        measured[max(0, count - 2)] = (AUDIT_RULES_PATH, hashlib.sha256(audit_rules).digest())
+    if audit_hash:
+        measured[max(0, count - 1)] = (AUDIT_LOG_PATH, audit_hash)
+
+    chunks = []
+    for i in range(count):
+        if i in measured:
+            pcr_index = 10
+            file_name, file_hash = measured[i]
+            record = ima_ng_record(pcr_index, file_name, b"sha256", file_hash)
+        else:
+            pcr_index = 10 if i % 10 < 8 else 11 + i % 2
+            file_name = f"/usr/lib/x86_64-linux-gnu/lib{rng.getrandbits(32):08x}.so.{i % 7}".encode()
+            violation = i % VIOLATION_EVERY == VIOLATION_EVERY - 1
+            record = ima_ng_record(pcr_index, file_name, b"sha1", rng.randbytes(20), violation)
+        chunks.append(record)
+        template_hash = record[4:24]
+        pcrs[pcr_index] = extend(pcrs[pcr_index], b"\xff" * 20 if template_hash == SHA1_ZERO else template_hash)
+    return ImaLog(b"".join(chunks), count, pcrs)
+
+
+# ------------------------------------------------------------
+# TCG2 firmware event log
+# ------------------------------------------------------------
+ALGORITHM_IDS = ((0x0004, hashlib.sha1, 20), (0x000B, hashlib.sha256, 32))
+
+
+def spec_id_event() -> bytes:
+    """First event, TCG 1.2 layout, announcing the sha1 and sha256 banks."""
+    event_data = b"Spec ID Event03\x00" + _u32.pack(0) + bytes((0, 2, 0, 2)) + _u32.pack(len(ALGORITHM_IDS))
+    for algorithm_id, _, size in ALGORITHM_IDS:
+        event_data += _u16.pack(algorithm_id) + _u16.pack(size)
+    event_data += b"\x00"  # vendorInfoSize
+    return _u32.pack(0) + _u32.pack(0x3) + SHA1_ZERO + _u32.pack(len(event_data)) + event_data
+
+
+class BootLog(NamedTuple):
+    data: bytes
+    events: int
+    # sha1 PCR 0-9 after replaying every event
+    pcrs: list
+
+
+def boot_log(count: int, seed: int = 0) -> BootLog:
+    """Spec ID event then count crypto-agile events over PCR 0-9, one of them the IMA kernel command line."""
+    rng = random.Random(seed)
+    pcrs = [SHA1_ZERO] * 10
+    chunks = [spec_id_event()]
+    for i in range(count):
+        pcr_index = i % 10
+        if i == count // 2:
+            # EV_IPL with the kernel command line verify_boot_log looks for
+            event_type, event_data = 0xD, SECURE_CMDLINE
+        else:
+            event_type, event_data = 0x80000008, rng.randbytes(rng.randrange(16, 256))
+        digests = [(algorithm_id, algorithm(event_data).digest()) for algorithm_id, algorithm, _ in ALGORITHM_IDS]
+        chunks.append(_u32.pack(pcr_index) + _u32.pack(event_type) + _u32.pack(len(digests)))
+        chunks.extend(_u16.pack(algorithm_id) + digest for algorithm_id, digest in digests)
+        chunks.append(_u32.pack(len(event_data)) + event_data)
+        pcrs[pcr_index] = extend(pcrs[pcr_index], digests[0][1])
+    return BootLog(b"".join(chunks), count, pcrs)
+
+
+# ------------------------------------------------------------
+# audit log
+# ------------------------------------------------------------
+class AuditLog(NamedTuple):
+    data: bytes
+    lines: int
+    # sha256 IMA measured, of the first attested_lines lines
+    attested_hash: bytes
+    attested_lines: int
+
+
+def audit_log(count: int, seed: int = 0, attested: float = 0.9) -> AuditLog:
+    """count audit.log lines, IMA having measured the log when it was attested * count lines long."""
+    rng = random.Random(seed)
+    lines = []
+    for i in range(count):
+        lines.append(
+            f"type=SYSCALL msg=audit(1760000000.{i % 1000:03d}:{i}): arch=c000003e syscall={rng.choice((0, 1, 2, 257))} "
+            f"success=yes exit={rng.randrange(64)} a0={rng.getrandbits(48):x} a1={rng.getrandbits(32):x} items=1 "
+            f"ppid={rng.randrange(1, 4096)} pid={rng.randrange(4096, 65536)} auid=1000 uid=0 gid=0 "
+            f'comm="llama-server" exe="/usr/local/bin/llama-server" key="big_brother"\n'.encode()
+        )
+    attested_lines = max(1, int(count * attested))
+    return AuditLog(b"".join(lines), count, hashlib.sha256(b"".join(lines[:attested_lines])).digest(), attested_lines)
+
+
+# ------------------------------------------------------------
+# attestation bundle
+# ------------------------------------------------------------
+def bundle(ima_records: int, boot_events: int = 500, audit_lines: int = 10_000, seed: int = 0) -> bytes:
+    """A signature.zip as export_signature.sh writes it, whose quote covers the synthetic logs."""
+    import ecdsa
+
+    audit_rules = b"-D\n-b 32768\n--backlog_wait_time 60000\n-f 1\n"
+    audit = audit_log(audit_lines, seed)
+    boot = boot_log(boot_events, seed)
+    ima = ima_log(ima_records, seed, audit_rules, audit.attested_hash)
+
+    pcr_data = b"".join(boot.pcrs) + b"".join(ima.pcrs[i] for i in (10, 11, 12))
+    # TPMS_ATTEST ends with the digest of the quoted PCRs
+    pcr_message = b"\xffTCG\x80\x18" + bytes(64) + hashlib.sha256(pcr_data).digest()
+    signing_key = ecdsa.SigningKey.generate(curve=ecdsa.NIST256p, entropy=ecdsa.util.PRNG(str(seed).encode()))
+    signature = signing_key.sign_deterministic(pcr_message, hashfunc=hashlib.sha256, sigencode=ecdsa.util.sigencode_der)
+
+    members = {
+        "tpm2_pcr_data": pcr_data,
+        "tpm2_pcr_message": pcr_message,
+        "tpm2_pcr_signature": signature,
+        "signing_key.pem": signing_key.get_verifying_key().to_pem(),
+        "secure_boot": boot.data,
+        "measurements": ima.data,
+        "audit.rules": audit_rules,
+        "audit_log.txt": audit.data,
+    }
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    return archive.getvalue()
@@ -4,11 +4,11 @@ import os
 import sys
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from config import get_config
 from utils import (
     MODELS,
     InternalRequest,
     get_mode,
-    get_port_no,
     send_prompt_request,
     set_mode,
 )
@@ -22,7 +22,7 @@ class PromptRequest:
 
 
 if __name__ == "__main__":
-    load_url = "http://127.0.0.1:{}".format(get_port_no("load"))
+    load_url = get_config().url("load")
     messages = []
     while True:
         userInput = input()
@@ -0,0 +1,134 @@
+"""
+Settings shared by the launcher, load server, wrapper, sampler, tmb server and clients.
+
+Defaults are the dataclass fields below and ports come from port_map.txt. Any
+field can be overridden with a TMB_<FIELD> environment variable (e.g.
+TMB_RESERVOIR_SIZE=50), ports with TMB_PORT_<NAME>, the model map with
+TMB_MODELS="a,3222;b,3223" and the load server's replicas with
+TMB_BACKENDS="a=http://127.0.0.1:3822,http://127.0.0.1:3832;b=...".
+get_config() builds it once per process.
+"""
+import os
+import re
+from dataclasses import dataclass, field, fields, replace
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+ENV_PREFIX = "TMB_"
+PORT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "port_map.txt")
+
+_PORT_LINE = re.compile(r"([a-zA-Z]+): ([0-9]+)")
+_MODEL_ENTRY = re.compile(r"([a-zA-Z]+),([0-9]+)")
+# fields parsed by load_config itself rather than by their type
+_STRUCTURED = ("ports", "models", "backends")
+
+
+@dataclass(frozen=True)
+class Config:
+    host: str = "127.0.0.1"
+    # process name -> port, from port_map.txt
+    ports: Dict[str, int] = field(default_factory=dict)
+    # model name -> llama-server port, handed to the wrapper
+    models: Dict[str, int] = field(default_factory=lambda: {"a": 3222, "b": 3223})
+
+    # clients and load server
+    pool_size: int = 32  # keep-alive connections per host kept by the shared HTTP clients
+    connect_timeout: float = 10.0  # generations can run for minutes, only connecting is bounded
+    client_verdict_timeout: float = 60  # client long-poll for the verdict
+
+    # load server replicas, model name -> wrapper URLs, models not listed use the wrapper port
+    backends: Dict[str, List[str]] = field(default_factory=dict)
+    scheduler_policy: str = "least_outstanding"  # or "ewma"
+    max_outstanding: int = 4  # requests in flight per replica before it counts as saturated
+    max_queue: int = 64  # requests waiting for a replica of one model before new ones get a 503
+    queue_timeout: float = 30
+    ewma_alpha: float = 0.3
+    # identical prompts answered from the load server's cache, off unless enabled
+    response_cache: bool = False
+    response_cache_bytes: int = 64 << 20
+    response_cache_ttl: float = 600
+
+    # telemetry sampler
+    telemetry_backend: str = "tegrastats"  # or "nvidia-smi", "replay"
+    telemetry_replay_file: str = ""
+    telemetry_replay_format: str = "tegrastats"
+    sample_interval: float = 0.05  # seconds between telemetry samples, one sampler serves every request
+    sample_buffer: int = 4096  # samples kept in the ring buffer
+    window_ttl: float = 600  # windows opened but never finished are dropped after this many seconds
+
+    # tmb server
+    reservoir_size: int = 10
+    grace_period: int = 3  # rows ingested as reference before requests are verified
+    buffer_capacity: int = 200  # rows stats_verify reads from a reservoir file
+    session_ttl: float = 60
+    verdict_ttl: float = 120
+    verdict_timeout: float = 6  # default /clientRequest wait
+    max_verdict_timeout: float = 60
+    verdict_keepalive: float = 5
+    attestation_interval: float = 60
+    attestation_every: int = 100
+
+    def port(self, name: str) -> Optional[int]:
+        return self.ports.get(name)
+
+    def url(self, name: str) -> str:
+        return "http://{}:{}".format(self.host, self.ports[name])
+
+    def wrapper_models(self) -> str:
+        """Model map in the wrapper's "name,port;" argument format."""
+        return "".join(f"{model},{port};" for model, port in self.models.items())
+
+
+def read_port_map(path: str = PORT_FILE) -> Dict[str, int]:
+    ports = {}
+    try:
+        with open(path, "r") as file:
+            for line in file:
+                match = _PORT_LINE.search(line)
+                if match:
+                    ports[match.group(1)] = int(match.group(2))
+    except OSError:
+        pass
+    return ports
+
+
+def parse_models(value: str) -> Dict[str, int]:
+    return {model: int(port) for model, port in _MODEL_ENTRY.findall(value)}
+
+
+def parse_backends(value: str) -> Dict[str, List[str]]:
+    backends = {}
+    for entry in filter(None, value.split(";")):
+        model, _, urls = entry.partition("=")
+        backends[model.strip()] = [url.strip().rstrip("/") for url in urls.split(",") if url.strip()]
+    return backends
+
+
+def load_config(environ=os.environ) -> Config:
+    """Defaults, port map and environment overrides, without memoising."""
+    ports = read_port_map(environ.get(ENV_PREFIX + "PORT_MAP", PORT_FILE))
+    portPrefix = ENV_PREFIX + "PORT_"
+    for key, value in environ.items():
+        if key.startswith(portPrefix) and key != portPrefix + "MAP":
+            ports[key[len(portPrefix):].lower()] = int(value)
+
+    overrides = {"ports": ports}
+    if ENV_PREFIX + "MODELS" in environ:
+        overrides["models"] = parse_models(environ[ENV_PREFIX + "MODELS"])
+    if ENV_PREFIX + "BACKENDS" in environ:
+        overrides["backends"] = parse_backends(environ[ENV_PREFIX + "BACKENDS"])
+    for option in fields(Config):
+        key = ENV_PREFIX + option.name.upper()
+        if option.name in _STRUCTURED or key not in environ:
+            continue
+        if option.type is bool:
+            overrides[option.name] = environ[key].strip().lower() in ("1", "true", "yes", "on")
+        else:
+            overrides[option.name] = option.type(environ[key])
+    return replace(Config(), **overrides)
+
+
+@lru_cache(maxsize=None)
+def get_config() -> Config:
+    """Process-wide configuration, get_config.cache_clear() reloads it."""
+    return load_config()
@@ -2,13 +2,13 @@
 import argparse
 import subprocess
 import threading
+from typing import Optional
 
 import uvicorn
 
+from config import get_config
 from utils import client, get_port_no
 
-WRAPPER_MTP = "a,3222;b,3223"
-
 
 def launch_load():
     """Launch the load server in a blocking call (to be run in a thread)."""
@@ -30,47 +30,78 @@ def launch_tmb():
     )
 
 
+def launch_sampler():
+    """Launch the host-wide telemetry sampler in a blocking call (to be run in a thread)."""
+    uvicorn.run(
+        "sampler.sampler:app",
+        host="127.0.0.1",
+        port=get_port_no("sampler"),
+        reload=False,
+    )
+
+
 def launch_wrapper():
     """Launch the wrapper executable as a subprocess."""
     subprocess.Popen(
         [
             "./wrapper/target/debug/wrapper",
-            WRAPPER_MTP,
+            get_config().wrapper_models(),
             str(get_port_no("wrapper")),
+            str(get_port_no("sampler")),
+            str(get_port_no("model")),
         ]
     )
 
 
-def launch_model():
-    """Launch the model server as a subprocess."""
+# llama-server weights of each model name, served on that model's port from config.models
+MODEL_WEIGHTS = {
+    "a": "ggml-org/gemma-3-4b-it-GGUF",
+    "b": "ggml-org/gemma-3-270m-it-GGUF",
+}
+
+
+def model_port(model: str) -> int:
+    """Port the wrapper forwards model's prompts to, the model port for unlisted models."""
+    return get_config().models.get(model, get_port_no("model"))
+
+
+def launch_model(model: str = "a", weights: Optional[str] = None):
+    """Launch the model server of model on its port as a subprocess, with other weights if given."""
     subprocess.Popen(
         [
             "./llama.cpp/build/bin/llama-server",
             "-hf",
-            "ggml-org/gemma-3-4b-it-GGUF",
+            weights or MODEL_WEIGHTS[model],
             "--port",
-            str(get_port_no("model")),
+            str(model_port(model)),
         ],
         stdout=subprocess.DEVNULL,
         stderr=subprocess.DEVNULL,
     )
+
+
 def launch_model_b():
-    subprocess.Popen(
-        [
-            "./llama.cpp/build/bin/llama-server",
-            "-hf",
-            "ggml-org/gemma-3-270m-it-GGUF",
-            "--port",
-            str(get_port_no("model")),
-        ],
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.DEVNULL,
-    )
+    launch_model("b")
+
+
+def launch_models(substitute: Optional[str] = None):
+    """
+    One model server per model in config.models. With substitute, every port
+    serves that model's weights instead, e.g. the cheap model behind every name.
+    """
+    for model in get_config().models:
+        weights = MODEL_WEIGHTS.get(substitute or model)
+        if weights is None:
+            print(f"no weights for model {model}, not launched")
+            continue
+        launch_model(model, weights)
+        print(f"launched model {model} on {model_port(model)}")
 
 
 def launch_all():
     load_thread = threading.Thread(target=launch_load, daemon=True)
     tmb_thread = threading.Thread(target=launch_tmb, daemon=True)
+    sampler_thread = threading.Thread(target=launch_sampler, daemon=True)
 
     load_thread.start()
     print("launched load")
@@ -78,11 +109,13 @@ def launch_all():
     tmb_thread.start()
     print("launched tmb")
 
+    sampler_thread.start()
+    print("launched sampler")
+
     launch_wrapper()
     print("launched wrapper")
 
-    launch_model()
-    print("launched model")
+    launch_models()
 
     from time import sleep
 
@@ -96,6 +129,7 @@ def launch_all():
 def launch_all_evil():
     load_thread = threading.Thread(target=launch_load, daemon=True)
     tmb_thread = threading.Thread(target=launch_tmb, daemon=True)
+    sampler_thread = threading.Thread(target=launch_sampler, daemon=True)
 
     load_thread.start()
     print("launched load")
@@ -103,11 +137,14 @@ def launch_all_evil():
     tmb_thread.start()
     print("launched tmb")
 
+    sampler_thread.start()
+    print("launched sampler")
+
     launch_wrapper()
     print("launched wrapper")
 
-    launch_model_b()
-    print("launched model")
+    # every model name is served by model b's weights
+    launch_models(substitute="b")
 
     from time import sleep
 
@@ -132,6 +169,8 @@ if __name__ == "__main__":
             launch_load()
         case "tmb":
             launch_tmb()
+        case "sampler":
+            launch_sampler()
         case "wrapper":
             launch_wrapper()
         case "model":
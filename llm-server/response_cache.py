@@ -0,0 +1,128 @@
+"""
+Opt-in cache of completed responses in the load server.
+
+Entries are keyed by a hash of the model, the normalised messages and every
+other request field that can change the completion (sampling parameters,
+tools, grammar...). An entry only becomes servable once the verdict of the
+run that produced it has been recorded as verified, and a hit is answered
+with that verdict, so a rejected or unverified response is never served
+again. Entries are evicted least recently used first, once older than
+the TTL or when the cached bodies exceed the byte cap.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+# request fields that don't change the completion itself
+IGNORED_FIELDS = ("messages", "stream", "stream_options", "cache_prompt", "user")
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    # userID of the run that produced the response
+    original_id: str
+    verdict: dict
+    stored: float
+
+
+def normalise_message(message) -> dict:
+    if not isinstance(message, dict):
+        return message
+    normalised = dict(message)
+    if isinstance(normalised.get("role"), str):
+        normalised["role"] = normalised["role"].strip().lower()
+    if isinstance(normalised.get("content"), str):
+        normalised["content"] = normalised["content"].replace("\r\n", "\n").strip()
+    return normalised
+
+
+def cache_key(model: str, original: str) -> Optional[str]:
+    """Hash of what determines the completion, None when original is not a JSON object."""
+    try:
+        body = json.loads(original)
+    except ValueError:
+        return None
+    if not isinstance(body, dict):
+        return None
+    key = {
+        "model": model,
+        "messages": [normalise_message(message) for message in body.get("messages", [])],
+        "params": {name: value for name, value in body.items() if name not in IGNORED_FIELDS},
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.stores = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _drop(self, key: str):
+        self.bytes -= len(self.entries.pop(key).body)
+
+    def get(self, key: Optional[str]) -> Optional[CachedResponse]:
+        with self.lock:
+            if key is None:
+                self.bypassed += 1
+                return None
+            entry = self.entries.get(key)
+            if entry is not None and time.monotonic() - entry.stored > self.ttl:
+                self._drop(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def bypass(self):
+        with self.lock:
+            self.bypassed += 1
+
+    def put(self, key: str, body: bytes, original_id: str, verdict: dict) -> bool:
+        """
+        Store a response with its recorded verdict. False, and nothing stored,
+        unless the run was verified, or if it is larger than the whole cache.
+        """
+        if verdict.get("Verified") is not True or len(body) > self.max_bytes:
+            return False
+        with self.lock:
+            if key in self.entries:
+                self._drop(key)
+            self.entries[key] = CachedResponse(body, original_id, verdict, time.monotonic())
+            self.bytes += len(body)
+            self.stores += 1
+            while self.bytes > self.max_bytes:
+                self._drop(next(iter(self.entries)))
+                self.evictions += 1
+        return True
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "hit_rate": self.hits / lookups if lookups else None,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
@@ -0,0 +1,129 @@
+"""
+Replica selection for the load server.
+
+Each model has a pool of backends, wrapper instances fronting their own
+llama-server. A request takes the backend with the fewest outstanding requests
+("least_outstanding") or the lowest EWMA latency weighted by its load
+("ewma"). A backend already serving max_outstanding requests is saturated;
+when every replica of a model is, requests queue for up to queue_timeout
+seconds, and past max_queue waiters they are refused with Saturated.
+"""
+import asyncio
+import time
+from typing import Dict, List, Optional
+
+POLICIES = ("least_outstanding", "ewma")
+
+
+class Saturated(Exception):
+    """Every replica of the model is busy and its queue is full or timed out."""
+
+
+class Backend:
+    def __init__(self, model: str, url: str):
+        self.model = model
+        self.url = url
+        self.outstanding = 0
+        # seconds, None until the first request completed
+        self.ewma = None
+        self.served = 0
+        self.errors = 0
+
+    def record(self, latency: float, ok: bool, alpha: float):
+        self.served += 1
+        if not ok:
+            self.errors += 1
+        self.ewma = latency if self.ewma is None else alpha * latency + (1 - alpha) * self.ewma
+
+    def stats(self) -> dict:
+        return {
+            "url": self.url,
+            "outstanding": self.outstanding,
+            "ewma_latency": self.ewma,
+            "served": self.served,
+            "errors": self.errors,
+        }
+
+
+class ModelPool:
+    def __init__(self, model: str, urls: List[str]):
+        self.model = model
+        self.backends = [Backend(model, url) for url in urls]
+        self.waiting = 0
+        self.rejected = 0
+        self.ready = asyncio.Condition()
+
+
+class BackendPool:
+    def __init__(
+        self,
+        backends: Dict[str, List[str]],
+        default: List[str],
+        policy: str = "least_outstanding",
+        max_outstanding: int = 4,
+        max_queue: int = 64,
+        queue_timeout: float = 30,
+        ewma_alpha: float = 0.3,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown scheduling policy: {policy}")
+        self.urls = dict(backends)
+        self.default = list(default)
+        self.policy = policy
+        self.max_outstanding = max_outstanding
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.ewma_alpha = ewma_alpha
+        self.pools: Dict[str, ModelPool] = {}
+
+    def pool(self, model: str) -> ModelPool:
+        if model not in self.pools:
+            self.pools[model] = ModelPool(model, self.urls.get(model) or self.default)
+        return self.pools[model]
+
+    def _pick(self, pool: ModelPool) -> Optional[Backend]:
+        free = [backend for backend in pool.backends if backend.outstanding < self.max_outstanding]
+        if not free:
+            return None
+        if self.policy == "ewma":
+            # untried replicas first, then expected wait of the queue already on each
+            return min(free, key=lambda b: (b.ewma is not None, (b.ewma or 0) * (b.outstanding + 1)))
+        return min(free, key=lambda b: (b.outstanding, b.ewma or 0))
+
+    async def acquire(self, model: str) -> Backend:
+        """Reserve a replica of model, waiting for one when all are saturated."""
+        pool = self.pool(model)
+        async with pool.ready:
+            backend = self._pick(pool)
+            if backend is None:
+                if pool.waiting >= self.max_queue:
+                    pool.rejected += 1
+                    raise Saturated(model)
+                pool.waiting += 1
+                try:
+                    await asyncio.wait_for(pool.ready.wait_for(lambda: self._pick(pool) is not None), self.queue_timeout)
+                except asyncio.TimeoutError:
+                    pool.rejected += 1
+                    raise Saturated(model)
+                finally:
+                    pool.waiting -= 1
+                backend = self._pick(pool)
+            backend.outstanding += 1
+            return backend
+
+    async def release(self, backend: Backend, started: float, ok: bool = True):
+        pool = self.pool(backend.model)
+        async with pool.ready:
+            backend.outstanding -= 1
+            backend.record(time.monotonic() - started, ok, self.ewma_alpha)
+            pool.ready.notify()
+
+    def stats(self) -> dict:
+        return {
+            model: {
+                "queued": pool.waiting,
+                "rejected": pool.rejected,
+                "backends": [backend.stats() for backend in pool.backends],
+            }
+            for model, pool in self.pools.items()
+        }
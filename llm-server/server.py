@@ -2,31 +2,233 @@ import json
 import os
 import subprocess
 import sys
+import time
 
 CHEAP_MODEL = 'b'
 
+import httpx
 import requests
-from fastapi import BackgroundTasks, FastAPI, Request, Response
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from starlette.background import BackgroundTask
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
-from utils import MODELS, MODES, InternalRequest, get_port_no, send_internal_request
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from config import get_config
+from prometheus import CONTENT_TYPE, Registry
+from response_cache import ResponseCache, cache_key
+from scheduler import BackendPool, Saturated
+from utils import (
+    MODELS,
+    MODES,
+    InternalRequest,
+    close_async_client,
+    get_port_no,
+    get_verdict_async,
+    publish_cached_verdict_async,
+    send_internal_request_async,
+    send_internal_request_stream_async,
+    stream_requested,
+)
 
 app = FastAPI()
 app.state.response_mode = "normal"
 app.state.port = get_port_no("load")
+config = get_config()
+# replicas per model, requests go to the least loaded one
+app.state.backends = BackendPool(
+    config.backends,
+    default=[config.url("wrapper")],
+    policy=config.scheduler_policy,
+    max_outstanding=config.max_outstanding,
+    max_queue=config.max_queue,
+    queue_timeout=config.queue_timeout,
+    ewma_alpha=config.ewma_alpha,
+)
+# repeated prompts answered with the stored response and its original verdict
+app.state.response_cache = (
+    ResponseCache(config.response_cache_bytes, config.response_cache_ttl) if config.response_cache else None
+)
 
 
+# instruments exposed on /stats
+registry = Registry()
+requestSeconds = registry.histogram(
+    "load_request_seconds", "Time to answer /submit_prompt, by outcome (ok, error, cached, saturated)", ("outcome",)
+)
+# cache      response cache lookup
+# publish    handing the cached verdict to the tmb server on a hit
+# queue      waiting for a replica with a free slot
+# backend    the replica answering, until the last chunk for streams
+stageSeconds = registry.histogram("load_stage_seconds", "Wall time of each stage of /submit_prompt", ("stage",))
+
+
+def backend_stats(field: str) -> dict:
+    return {
+        (model, backend.url): getattr(backend, field)
+        for model, pool in list(app.state.backends.pools.items())
+        for backend in pool.backends
+    }
+
+
+def cache_lookups() -> dict:
+    cache = app.state.response_cache
+    if cache is None:
+        return {}
+    stats = cache.stats()
+    return {(result,): stats[field] for result, field in (("hit", "hits"), ("miss", "misses"), ("bypass", "bypassed"))}
+
+
+# state the backend pool and the response cache already keep, read when /stats is scraped
+registry.gauge("load_backend_outstanding", "Requests in flight per replica", ("model", "url"), collect=lambda: backend_stats("outstanding"))
+registry.counter("load_backend_served_total", "Requests each replica completed", ("model", "url"), collect=lambda: backend_stats("served"))
+registry.counter("load_backend_errors_total", "Failed requests per replica", ("model", "url"), collect=lambda: backend_stats("errors"))
+registry.gauge(
+    "load_queue_waiting",
+    "Requests waiting for a replica, per model",
+    ("model",),
+    collect=lambda: {(model,): pool.waiting for model, pool in list(app.state.backends.pools.items())},
+)
+registry.counter(
+    "load_queue_rejected_total",
+    "Requests refused because every replica was busy, per model",
+    ("model",),
+    collect=lambda: {(model,): pool.rejected for model, pool in list(app.state.backends.pools.items())},
+)
+registry.counter("load_cache_lookups_total", "Response cache lookups by result", ("result",), collect=cache_lookups)
+registry.gauge(
+    "load_cache_bytes",
+    "Bytes of cached response bodies",
+    collect=lambda: {} if app.state.response_cache is None else {(): app.state.response_cache.bytes},
+)
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await close_async_client()
+
+
+# async so a generation waits on the pooled client instead of holding a threadpool worker
 @app.get("/submit_prompt")
-def submit(data: InternalRequest, request: Request):
+async def submit(data: InternalRequest, request: Request, background_tasks: BackgroundTasks):
     print("load server received:", data)
+    received = time.monotonic()
 
     response_mode = request.app.state.response_mode
-    response = handle_prompt_request(data, response_mode)
+    backends = request.app.state.backends
+    data = select_model(data, response_mode)
+
+    cache = request.app.state.response_cache
+    key = None
+    if cache is not None:
+        if stream_requested(data):
+            cache.bypass()
+        else:
+            with stageSeconds.time("cache"):
+                key = cache_key(data.model, data.original)
+                cached = cache.get(key)
+            if cached is not None:
+                print("load server cache hit, original run:", cached.original_id)
+                try:
+                    with stageSeconds.time("publish"):
+                        await publish_cached_verdict_async(data.uuid, cached.original_id, cached.verdict)
+                except httpx.HTTPError as e:
+                    # the client then gets no verdict, never a made-up one
+                    print("could not publish cached verdict:", e)
+                requestSeconds.observe(time.monotonic() - received, "cached")
+                return Response(content=cached.body, media_type="application/json")
+
+    try:
+        with stageSeconds.time("queue"):
+            backend = await backends.acquire(data.model)
+    except Saturated:
+        requestSeconds.observe(time.monotonic() - received, "saturated")
+        raise HTTPException(status_code=503, detail="All Replicas Busy", headers={"Retry-After": "1"})
+    started = time.monotonic()
+
+    if stream_requested(data):
+        # relay the chunks as the wrapper forwards them instead of buffering the completion
+        release = release_once(backends, backend, started, received)
+        return StreamingResponse(
+            relay_stream(data, backend.url, release),
+            media_type="text/event-stream",
+            # the generator's finally never runs if the client leaves before the first chunk
+            background=BackgroundTask(release, False),
+        )
+    ok = False
+    try:
+        response = await send_internal_request_async(data, backend.url)
+        ok = response.is_success
+    finally:
+        await backends.release(backend, started, ok)
+        finished = time.monotonic()
+        stageSeconds.observe(finished - started, "backend")
+        requestSeconds.observe(finished - received, "ok" if ok else "error")
     print(response.content)
+    if key is not None and ok:
+        background_tasks.add_task(cache_response, cache, key, data, response.content)
     return response.json()
 
 
+async def cache_response(cache: ResponseCache, key: str, data: InternalRequest, body: bytes):
+    """Store body once the tmb server has a verdict for the run that produced it."""
+    try:
+        verdict = await get_verdict_async(data.uuid, data.model)
+    except httpx.HTTPError as e:
+        print("no verdict to cache:", e)
+        return
+    # the tmb server always answers with a Verified key: False when rejected, None in the grace period
+    if verdict.get("Verified") is True:
+        cache.put(key, body, data.uuid, verdict)
+
+
+def release_once(backends: BackendPool, backend, started: float, received: float):
+    """Release of a streamed request's replica, whichever of its two callers comes first."""
+    released = False
+
+    async def release(ok: bool):
+        nonlocal released
+        if released:
+            return
+        released = True
+        await backends.release(backend, started, ok)
+        finished = time.monotonic()
+        stageSeconds.observe(finished - started, "backend")
+        requestSeconds.observe(finished - received, "ok" if ok else "error")
+
+    return release
+
+
+async def relay_stream(data: InternalRequest, url: str, release):
+    ok = False
+    try:
+        async for chunk in send_internal_request_stream_async(data, url):
+            yield chunk
+        ok = True
+    finally:
+        # the replica is busy until the last chunk, not just the headers
+        await release(ok)
+
+
+@app.get("/cache")
+def get_cache(request: Request):
+    cache = request.app.state.response_cache
+    return {"enabled": False} if cache is None else {"enabled": True, **cache.stats()}
+
+
+# queue depth and latency of every replica
+@app.get("/backends")
+def get_backends(request: Request):
+    return request.app.state.backends.stats()
+
+
+# Prometheus text exposition of the instruments above
+@app.get("/stats")
+def get_stats():
+    return Response(registry.render(), media_type=CONTENT_TYPE)
+
+
 @app.get("/mode")
 def get_mode(request: Request):
     return {"mode": request.app.state.response_mode}
@@ -64,8 +266,8 @@ class InternalRequest(BaseModel):
     model: str
 
 
-def handle_prompt_request(internal_request: InternalRequest, response_mode: str):
+def select_model(internal_request: InternalRequest, response_mode: str):
     match response_mode:
         case "skimp":
             internal_request.model = CHEAP_MODEL 
-    return send_internal_request(internal_request)
+    return internal_request
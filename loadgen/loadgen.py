@@ -0,0 +1,342 @@
+#!/bin/python
+"""
+Load generation and replay harness.
+
+Replays recorded prompts against the load server at a fixed QPS and
+concurrency and reports p50/p95/p99 of three latencies:
+
+    response     prompt sent -> completion received from the load server
+    verdict      prompt sent -> verdict received from the tmb server
+    attestation  run time of each background attestation the verdicts referenced
+
+plus throughput and error and timeout rates. Prompts come from a JSONL file
+(chat-completion bodies, or objects with a prompt/body/content field) or from
+the payloads in a trace.txt written by the wrapper.
+
+By default the whole stack runs in this process, without GPUs or a TPM: the
+real load, tmb and sampler servers, a stub wrapper standing in for the
+wrapper and llama-server with a configurable generation time, the sampler
+replaying recorded telemetry (the SMIData reports in the trace, or synthetic
+rows) and a stub attestation runner. --external drives servers that are
+already running on the ports from config.py instead.
+
+    python loadgen/loadgen.py --prompts trace.txt --qps 20 --concurrency 8 --requests 500
+"""
+import argparse
+import asyncio
+import contextlib
+import importlib
+import io
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from typing import Optional
+
+repoDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(repoDir)
+
+STAGES = ("response", "verdict", "attestation")
+PERCENTILES = (50, 95, 99)
+
+
+def parse_trace(text: str) -> list:
+    """JSON objects of a trace, whether one per line or written back to back."""
+    decoder = json.JSONDecoder()
+    objects, position = [], 0
+    while True:
+        while position < len(text) and text[position].isspace():
+            position += 1
+        if position >= len(text):
+            return objects
+        try:
+            obj, position = decoder.raw_decode(text, position)
+        except ValueError:
+            # skip to the next object after a corrupt or truncated record
+            position = text.find("{", position + 1)
+            if position < 0:
+                return objects
+            continue
+        objects.append(obj)
+
+
+def prompt_body(obj) -> Optional[dict]:
+    """Chat-completion body of one recorded object, None for telemetry and other records."""
+    if not isinstance(obj, dict):
+        return None
+    if isinstance(obj.get("messages"), list):
+        return {key: value for key, value in obj.items() if key != "stream"}
+    for field in ("prompt", "body", "content", "title"):
+        if isinstance(obj.get(field), str):
+            return {"messages": [{"role": "user", "content": obj[field]}]}
+    return None
+
+
+def load_recording(path: str) -> tuple[list, list]:
+    """Prompts and SMIData telemetry rows recorded in a JSONL file or trace.txt."""
+    with open(path, "r") as recording:
+        objects = parse_trace(recording.read())
+    prompts = [body for body in map(prompt_body, objects) if body is not None]
+    telemetry = [obj for obj in objects if isinstance(obj, dict) and "powerDraw" in obj]
+    return prompts, telemetry
+
+
+def synthetic_telemetry(count: int = 200, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    return [
+        {"gpuUtilization": rng.uniform(0.3, 0.9), "vramUsage": rng.gauss(0.4, 0.01), "powerDraw": rng.gauss(5000, 300)}
+        for _ in range(count)
+    ]
+
+
+def percentile(sortedValues: list, q: float) -> Optional[float]:
+    """Linearly interpolated percentile of already sorted values."""
+    if not sortedValues:
+        return None
+    rank = (len(sortedValues) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(sortedValues) - 1)
+    return sortedValues[low] + (sortedValues[high] - sortedValues[low]) * (rank - low)
+
+
+def summarise(records: list, elapsed: float) -> dict:
+    total = len(records)
+    report = {"requests": total, "elapsed": elapsed, "throughput": total / elapsed if elapsed else None}
+    for stage in ("response", "verdict"):
+        latencies = sorted(record[stage] for record in records if record.get(stage) is not None)
+        report[stage] = stage_summary(latencies)
+        errors = sum(record.get(f"{stage}_status") == "error" for record in records)
+        timeouts = sum(record.get(f"{stage}_status") == "timeout" for record in records)
+        report[stage].update(
+            errors=errors,
+            timeouts=timeouts,
+            error_rate=errors / total if total else None,
+            timeout_rate=timeouts / total if total else None,
+        )
+    # one entry per background attestation, however many verdicts referenced it
+    attestations = {}
+    for record in records:
+        attestation = record.get("attestation")
+        if attestation:
+            attestations[attestation["id"]] = attestation["finishedAt"] - attestation["startedAt"]
+    report["attestation"] = stage_summary(sorted(attestations.values()))
+    return report
+
+
+def stage_summary(latencies: list) -> dict:
+    summary = {"count": len(latencies), "mean": sum(latencies) / len(latencies) if latencies else None}
+    for q in PERCENTILES:
+        summary[f"p{q}"] = percentile(latencies, q)
+    return summary
+
+
+def format_report(report: dict) -> str:
+    milliseconds = lambda value: "-" if value is None else f"{value * 1000:.1f}"
+    lines = [f"{'stage':<12}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'mean ms':>10}{'errors':>8}{'timeouts':>10}"]
+    for stage in STAGES:
+        summary = report[stage]
+        lines.append(
+            f"{stage:<12}{summary['count']:>8}"
+            + "".join(f"{milliseconds(summary[f'p{q}']):>10}" for q in PERCENTILES)
+            + f"{milliseconds(summary['mean']):>10}"
+            + f"{summary.get('errors', '-'):>8}{summary.get('timeouts', '-'):>10}"
+        )
+    lines.append(f"{report['requests']} requests in {report['elapsed']:.2f} s, {report['throughput']:.2f} req/s")
+    return "\n".join(lines)
+
+
+async def drive(prompts: list, model: str, requests: int, qps: Optional[float], concurrency: int, timeout: float) -> list:
+    """Send requests prompts round-robin, opened at qps (or back to back), at most concurrency in flight."""
+    from utils import PROMPT_REQUEST_PATH, async_client, get_verdict_async, load_url
+
+    run = f"{int(time.time())}-{os.getpid()}"
+    slots = asyncio.Semaphore(concurrency)
+    records = []
+
+    async def one(index: int, body: dict):
+        userID = f"loadgen-{run}-{index}"
+        record = {"id": userID}
+        records.append(record)
+        async with slots:
+            started = time.perf_counter()
+            # subscribe first, like the clients do
+            verdict = asyncio.create_task(get_verdict_async(userID, model, timeout))
+            to_send = {"original": json.dumps(body), "uuid": userID, "model": model}
+            try:
+                response = await asyncio.wait_for(
+                    async_client().request("GET", load_url + PROMPT_REQUEST_PATH, json=to_send), timeout
+                )
+                if response.status_code == 200:
+                    record["response"] = time.perf_counter() - started
+                else:
+                    record["response_status"] = "error"
+            except asyncio.TimeoutError:
+                record["response_status"] = "timeout"
+            except Exception:
+                record["response_status"] = "error"
+
+            try:
+                result = await asyncio.wait_for(verdict, timeout + 1)
+            except asyncio.TimeoutError:
+                record["verdict_status"] = "timeout"
+                return
+            except Exception:
+                record["verdict_status"] = "error"
+                return
+            if "Verified" in result:
+                record["verdict"] = time.perf_counter() - started
+                record["verified"] = result["Verified"]
+                record["attestation"] = result.get("Attestation")
+            else:
+                # the tmb server answers 408 when no verdict arrived in time
+                record["verdict_status"] = "timeout" if "Timed Out" in str(result.get("detail")) else "error"
+
+    tasks = []
+    start = time.perf_counter()
+    for index in range(requests):
+        if qps:
+            delay = start + index / qps - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(one(index, prompts[index % len(prompts)])))
+    await asyncio.gather(*tasks)
+    return records
+
+
+class StubStack:
+    """The servers of the stack in this process, with stubs for the model, telemetry and TPM."""
+
+    def __init__(self, portBase: int, telemetry: list, modelLatency: float, jitter: float, attestationLatency: float, sampleInterval: float):
+        self.workDir = tempfile.mkdtemp(prefix="loadgen_")
+        replay = os.path.join(self.workDir, "telemetry.jsonl")
+        with open(replay, "w") as replayFile:
+            replayFile.writelines(json.dumps(row) + "\n" for row in telemetry)
+        # config.py is read once per process, so the stack's ports and sampler are set before any import
+        os.environ.update(
+            TMB_PORT_LOAD=str(portBase),
+            TMB_PORT_WRAPPER=str(portBase + 1),
+            TMB_PORT_TMB=str(portBase + 2),
+            TMB_PORT_SAMPLER=str(portBase + 3),
+            TMB_TELEMETRY_BACKEND="replay",
+            TMB_TELEMETRY_REPLAY_FILE=replay,
+            TMB_TELEMETRY_REPLAY_FORMAT="smidata",
+            TMB_SAMPLE_INTERVAL=str(sampleInterval),
+        )
+        self.modelLatency = modelLatency
+        self.jitter = jitter
+        self.attestationLatency = attestationLatency
+        self.servers = []
+
+    def stub_attestation(self, attestationID: int) -> bool:
+        time.sleep(self.attestationLatency)
+        return True
+
+    def wrapper_app(self):
+        """Stand-in for the wrapper and llama-server: opens a sampler window, "generates", closes it."""
+        from fastapi import BackgroundTasks, FastAPI
+
+        from config import get_config
+        from utils import InternalRequest, async_client
+
+        samplerURL = get_config().url("sampler")
+        app = FastAPI()
+
+        @app.get("/")
+        async def generate(data: InternalRequest, background_tasks: BackgroundTasks):
+            await async_client().post(samplerURL + "/sessions/start", json={"userID": data.uuid, "model": data.model})
+            await asyncio.sleep(max(0.0, random.gauss(self.modelLatency, self.jitter)))
+            # like the wrapper, the window closes once the body has been handed over
+            background_tasks.add_task(async_client().post, samplerURL + "/sessions/finish", json={"userID": data.uuid})
+            return {"choices": [{"index": 0, "message": {"role": "assistant", "content": "stub completion"}}]}
+
+        return app
+
+    def start(self):
+        import structlog
+        import uvicorn
+
+        structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING))
+        sys.path.append(os.path.join(repoDir, "tmb-server"))
+        from config import get_config
+
+        tmbModule = importlib.import_module("tmb")
+        from attestation import AttestationPipeline
+        from fit_cache import FitCache
+        from reservoir import ReservoirStore
+
+        config = get_config()
+        tmbModule.reservoirStore = ReservoirStore(self.workDir, config.reservoir_size)
+        tmbModule.fitCache = FitCache()
+        tmbModule.attestationPipeline = AttestationPipeline(
+            runner=self.stub_attestation, interval=config.attestation_interval, everyRequests=config.attestation_every
+        )
+        apps = {
+            "tmb": tmbModule.tmb,
+            "sampler": importlib.import_module("sampler.sampler").app,
+            "wrapper": self.wrapper_app(),
+            "load": importlib.import_module("llm-server.server").app,
+        }
+        for name, app in apps.items():
+            server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=config.port(name), log_level="warning"))
+            threading.Thread(target=server.run, daemon=True).start()
+            self.servers.append(server)
+        while not all(server.started for server in self.servers):
+            time.sleep(0.05)
+
+    def stop(self):
+        for server in self.servers:
+            server.should_exit = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded prompts and telemetry against the stack")
+    parser.add_argument("--prompts", default=os.path.join(repoDir, "trace.txt"), help="JSONL or trace.txt recording")
+    parser.add_argument("--telemetry", help="Recording to take SMIData rows from, defaults to --prompts")
+    parser.add_argument("--model", default="a")
+    parser.add_argument("--requests", type=int, default=200, help="Requests to send")
+    parser.add_argument("--qps", type=float, default=None, help="Open-loop arrival rate, back to back when omitted")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight at most")
+    parser.add_argument("--timeout", type=float, default=30, help="Seconds before a response or verdict counts as timed out")
+    parser.add_argument("--external", action="store_true", help="Drive running servers instead of the in-process stub stack")
+    parser.add_argument("--port-base", type=int, default=4821, help="First of the four ports the stub stack listens on")
+    parser.add_argument("--model-latency", type=float, default=0.2, help="Stub generation time in seconds")
+    parser.add_argument("--jitter", type=float, default=0.05, help="Standard deviation of the stub generation time")
+    parser.add_argument("--attestation-latency", type=float, default=2.0, help="Stub attestation run time in seconds")
+    parser.add_argument("--sample-interval", type=float, default=0.02, help="Stub telemetry sampling interval in seconds")
+    parser.add_argument("--json", help="Also write the report to this file")
+    parser.add_argument("--verbose", action="store_true", help="Keep the servers' per-request output")
+    args = parser.parse_args()
+
+    prompts, telemetry = load_recording(args.prompts) if os.path.exists(args.prompts) else ([], [])
+    if args.telemetry:
+        telemetry = load_recording(args.telemetry)[1]
+    if not prompts:
+        prompts = [{"messages": [{"role": "user", "content": f"synthetic prompt {i}"}]} for i in range(32)]
+    if not telemetry:
+        telemetry = synthetic_telemetry()
+
+    stack = None
+    if not args.external:
+        stack = StubStack(args.port_base, telemetry, args.model_latency, args.jitter, args.attestation_latency, args.sample_interval)
+        stack.start()
+
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    started = time.perf_counter()
+    with quiet:
+        records = asyncio.run(drive(prompts, args.model, args.requests, args.qps, args.concurrency, args.timeout))
+    report = summarise(records, time.perf_counter() - started)
+    if stack is not None:
+        stack.stop()
+
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w") as reportFile:
+            json.dump(report, reportFile, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Counters, gauges and histograms rendered in the Prometheus text format (0.0.4).
+
+prometheus_client is not a dependency, and the servers only need these three
+kinds. Recording is a lock and an addition (histograms bisect into fixed
+buckets), nothing is formatted until /stats is scraped, and values that
+already live elsewhere (session counts, reservoir sizes, queue depths) are
+read by a collect callback at scrape time instead of being mirrored on the
+hot path.
+
+    registry = Registry()
+    latency = registry.histogram("load_stage_seconds", "Time per stage", ("stage",))
+    with latency.time("queue"):
+        ...
+    registry.render()
+"""
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# seconds, from sub-millisecond fits to attestation runs
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def format_value(value) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, int):
+        return str(value)
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def format_labels(names: Sequence[str], values: Sequence) -> str:
+    if not names:
+        return ""
+    escaped = (str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"") for value in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), collect: Optional[Callable] = None):
+        """
+        collect, when given, is called at scrape time and returns the value,
+        or a dict of label value tuples to values for labelled metrics.
+        """
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.collect = collect
+        self.values: Dict[Tuple, float] = {}
+        self.lock = threading.Lock()
+
+    def _key(self, labelValues: tuple) -> tuple:
+        if len(labelValues) != len(self.labels):
+            raise ValueError(f"{self.name} takes labels {self.labels}, got {labelValues}")
+        return labelValues
+
+    def samples(self) -> Iterator[Tuple[str, tuple, tuple, float]]:
+        """(name, label names, label values, value) of every series."""
+        if self.collect is not None:
+            collected = self.collect()
+            values = collected if isinstance(collected, dict) else {(): collected}
+        else:
+            with self.lock:
+                values = dict(self.values)
+        for labelValues, value in values.items():
+            yield self.name, self.labels, labelValues, value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for name, labelNames, labelValues, value in self.samples():
+            lines.append(f"{name}{format_labels(labelNames, labelValues)} {format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labelValues, amount: float = 1):
+        key = self._key(labelValues)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, *labelValues):
+        key = self._key(labelValues)
+        with self.lock:
+            self.values[key] = value
+
+    def inc(self, *labelValues, amount: float = 1):
+        key = self._key(labelValues)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, *labelValues, amount: float = 1):
+        self.inc(*labelValues, amount=-amount)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [count per bucket (last one +Inf), sum]
+        self.series: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, *labelValues):
+        key = self._key(labelValues)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][idx] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, *labelValues):
+        """Observe the wall time of the block, also when it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labelValues)
+
+    def samples(self):
+        with self.lock:
+            series = {key: (list(counts), total) for key, (counts, total) in self.series.items()}
+        bucketLabels = self.labels + ("le",)
+        for labelValues, (counts, total) in series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", bucketLabels, labelValues + (format_value(bound),), cumulative
+            yield f"{self.name}_sum", self.labels, labelValues, total
+            yield f"{self.name}_count", self.labels, labelValues, cumulative
+
+
+class Registry:
+    """The metrics one server exposes on /stats, rendered in registration order."""
+
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric already registered: {metric.name}")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = (), collect: Optional[Callable] = None) -> Counter:
+        return self.register(Counter(name, help, labels, collect))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = (), collect: Optional[Callable] = None) -> Gauge:
+        return self.register(Gauge(name, help, labels, collect))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
@@ -0,0 +1,167 @@
+"""
+Telemetry sources for the sampler.
+
+A backend is an iterable of Sample rows in the SMIData schema the tmb server
+consumes: gpuUtilization and vramUsage as fractions, powerDraw in mW. Each
+row is stamped with time.monotonic() when it was read, so the sampler can
+hand every inference the rows of the interval it ran in.
+
+    tegrastats  Jetson boards, one long-running `tegrastats --interval <ms>`
+    nvidia-smi  discrete GPUs, one long-running `nvidia-smi ... -lms <ms>`
+    replay      lines of either format, or SMIData JSON, read back from a file
+"""
+import json
+import re
+import subprocess
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Iterator, NamedTuple, Optional
+
+
+class Sample(NamedTuple):
+    timestamp: float
+    gpuUtilization: float
+    vramUsage: float
+    powerDraw: float
+
+
+_RAM = re.compile(r"\bRAM (\d+)/(\d+)MB")
+_GPU = re.compile(r"\bGR(?:3D_FREQ)? (\d+)%")
+# rail the wrapper has always reported as powerDraw
+_POWER = re.compile(r"\bVDD_SOC (\d+)mW")
+
+
+def parse_tegrastats(line: str, timestamp: float) -> Optional[Sample]:
+    """One tegrastats status line, None if a field is missing."""
+    ram, gpu, power = _RAM.search(line), _GPU.search(line), _POWER.search(line)
+    if not (ram and gpu and power):
+        return None
+    return Sample(
+        timestamp,
+        int(gpu.group(1)) / 100.0,
+        int(ram.group(1)) / int(ram.group(2)),
+        float(power.group(1)),
+    )
+
+
+NVIDIA_SMI_QUERY = "utilization.gpu,memory.used,memory.total,power.draw"
+
+
+def parse_nvidia_smi(line: str, timestamp: float) -> Optional[Sample]:
+    """One csv,noheader,nounits row of NVIDIA_SMI_QUERY, power converted from W to mW."""
+    try:
+        gpu, used, total, power = (float(field) for field in line.split(","))
+    except ValueError:
+        return None
+    return Sample(timestamp, gpu / 100.0, used / total, power * 1000.0)
+
+
+def parse_smidata(line: str, timestamp: float) -> Optional[Sample]:
+    """One SMIData JSON object, e.g. a report the wrapper wrote to trace.txt."""
+    try:
+        report = json.loads(line)
+        return Sample(timestamp, float(report["gpuUtilization"]), float(report["vramUsage"]), float(report["powerDraw"]))
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+PARSERS = {
+    "tegrastats": parse_tegrastats,
+    "nvidia-smi": parse_nvidia_smi,
+    "smidata": parse_smidata,
+}
+
+
+class CommandBackend(ABC):
+    """Runs one long-lived command printing a status line per interval."""
+
+    parse: Callable[[str, float], Optional[Sample]]
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.process: Optional[subprocess.Popen] = None
+
+    @abstractmethod
+    def command(self) -> list:
+        """argv of the command, sampling every self.interval seconds."""
+
+    def __iter__(self) -> Iterator[Sample]:
+        self.process = subprocess.Popen(self.command(), stdout=subprocess.PIPE, text=True, bufsize=1)
+        try:
+            for line in self.process.stdout:
+                sample = type(self).parse(line, time.monotonic())
+                if sample is not None:
+                    yield sample
+        finally:
+            self.close()
+
+    def close(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+
+
+class TegrastatsBackend(CommandBackend):
+    parse = staticmethod(parse_tegrastats)
+
+    def command(self) -> list:
+        return ["tegrastats", "--interval", str(max(1, round(self.interval * 1000)))]
+
+
+class NvidiaSmiBackend(CommandBackend):
+    parse = staticmethod(parse_nvidia_smi)
+
+    def command(self) -> list:
+        return [
+            "nvidia-smi",
+            f"--query-gpu={NVIDIA_SMI_QUERY}",
+            "--format=csv,noheader,nounits",
+            "-lms",
+            str(max(1, round(self.interval * 1000))),
+        ]
+
+
+class ReplayBackend:
+    """Replays recorded tegrastats, nvidia-smi or SMIData lines at the sampling interval, looping over the file."""
+
+    def __init__(self, interval: float, path: str, format: str = "tegrastats", loop: bool = True):
+        if format not in PARSERS:
+            raise ValueError(f"Unknown telemetry format: {format}")
+        self.interval = interval
+        self.path = path
+        self.parse = PARSERS[format]
+        self.loop = loop
+        self.closed = False
+
+    def __iter__(self) -> Iterator[Sample]:
+        while not self.closed:
+            with open(self.path, "r") as replay:
+                lines = [line for line in replay if line.strip()]
+            if not lines:
+                return
+            for line in lines:
+                if self.closed:
+                    return
+                sample = self.parse(line, time.monotonic())
+                if sample is not None:
+                    yield sample
+                time.sleep(self.interval)
+            if not self.loop:
+                return
+
+    def close(self):
+        self.closed = True
+
+
+BACKENDS = {
+    "tegrastats": TegrastatsBackend,
+    "nvidia-smi": NvidiaSmiBackend,
+    "replay": ReplayBackend,
+}
+
+
+def make_backend(name: str, interval: float, replay_file: str = "", replay_format: str = "tegrastats"):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown telemetry backend: {name}")
+    if name == "replay":
+        return ReplayBackend(interval, replay_file, replay_format)
+    return BACKENDS[name](interval)
@@ -0,0 +1,150 @@
+"""
+Host-wide telemetry sampler shared by every in-flight inference.
+
+One backend process reads the GPU counters continuously into a ring buffer.
+The wrapper opens a window when it forwards a prompt (/sessions/start) and
+closes it when the model has finished writing (/sessions/finish); the rows
+sampled in between, with their timestamps and the window's bounds, are sent
+to the tmb server's /metrics/batch as that session's SMIData and the session
+is finished in the same request. Concurrent inferences read the same rows
+instead of each running its own sampler.
+"""
+import bisect
+import os
+import sys
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from backends import Sample, make_backend
+from config import get_config
+from utils import close_async_client, send_metrics_batch_async
+
+
+class Sampler:
+    """Ring buffer of the latest samples, filled by a background thread reading the backend."""
+
+    def __init__(self, backend, capacity: int):
+        self.backend = backend
+        self.samples: "deque[Sample]" = deque(maxlen=capacity)
+        self.lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+        self.error: Optional[str] = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.backend.close()
+
+    def _run(self):
+        try:
+            for sample in self.backend:
+                with self.lock:
+                    self.samples.append(sample)
+        except Exception as e:
+            self.error = str(e)
+            print("telemetry backend stopped:", e)
+
+    def window(self, start: float, end: float) -> list:
+        """
+        Samples taken between start and end, plus the ones just outside on
+        either side so the tmb server can interpolate up to the window's edges.
+        """
+        with self.lock:
+            samples = list(self.samples)
+        timestamps = [sample.timestamp for sample in samples]
+        first = max(bisect.bisect_left(timestamps, start) - 1, 0)
+        last = bisect.bisect_right(timestamps, end) + 1
+        return samples[first:last]
+
+    def status(self) -> dict:
+        with self.lock:
+            latest = self.samples[-1]._asdict() if self.samples else None
+            return {"buffered": len(self.samples), "latest": latest, "error": self.error}
+
+
+config = get_config()
+app = FastAPI()
+app.state.sampler = Sampler(
+    make_backend(config.telemetry_backend, config.sample_interval, config.telemetry_replay_file, config.telemetry_replay_format),
+    config.sample_buffer,
+)
+# userID -> (model, monotonic time the window opened)
+app.state.windows = {}
+app.state.windows_lock = threading.Lock()
+app.state.windows_expired = 0
+# windows the wrapper never finishes (a dropped connection, a crashed model) are dropped after window_ttl seconds
+window_ttl = config.window_ttl
+
+
+def expire_windows(now: Optional[float] = None) -> int:
+    """Drop windows open for longer than window_ttl, returns how many were removed."""
+    now = time.monotonic() if now is None else now
+    with app.state.windows_lock:
+        stale = [userID for userID, (_, opened) in app.state.windows.items() if now - opened > window_ttl]
+        for userID in stale:
+            del app.state.windows[userID]
+        app.state.windows_expired += len(stale)
+    return len(stale)
+
+
+@app.on_event("startup")
+def startup():
+    app.state.sampler.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    app.state.sampler.stop()
+    await close_async_client()
+
+
+class WindowStart(BaseModel):
+    userID: str
+    model: str
+
+
+class WindowEnd(BaseModel):
+    userID: str
+
+
+@app.post("/sessions/start")
+def start_window(window: WindowStart):
+    expire_windows()
+    with app.state.windows_lock:
+        app.state.windows[window.userID] = (window.model, time.monotonic())
+    return {"message": "Sampling"}
+
+
+@app.post("/sessions/finish")
+async def finish_window(window: WindowEnd):
+    expire_windows()
+    with app.state.windows_lock:
+        opened = app.state.windows.pop(window.userID, None)
+    if opened is None:
+        raise HTTPException(status_code=400, detail="No Open Window")
+    model, start = opened
+    end = time.monotonic()
+    samples = app.state.sampler.window(start, end)
+    if not samples:
+        raise HTTPException(status_code=503, detail="No Telemetry Sampled")
+    return await send_metrics_batch_async(window.userID, model, samples, finished=True, start=start, end=end)
+
+
+@app.get("/status")
+def status():
+    return {
+        "backend": config.telemetry_backend,
+        "interval": config.sample_interval,
+        "windows": len(app.state.windows),
+        "windows_expired": app.state.windows_expired,
+        **app.state.sampler.status(),
+    }
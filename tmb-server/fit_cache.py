@@ -0,0 +1,182 @@
+"""
+Per-model cache of the fitted reference distributions.
+
+Each model keeps the sufficient statistics of its reservoir (n, shifted sums
+and sums of squares, sumLogX, sumLog1MinusX, the sorted power column) and the
+betaParams / BimodalParams fitted from them. reservoir_sampling reports every
+append or replace, the statistics are updated in O(1) and the fit is redone
+from them, so /finished only evaluates the log-pdfs.
+"""
+import bisect
+import math
+import threading
+from typing import NamedTuple
+
+from stats_verify import (
+    BUFFER_CAPACITY,
+    BetaParams,
+    BimodalParams,
+    DataRow,
+    StatsResult,
+    _log,
+    _toFloat32,
+    betaInit,
+    betaNewton,
+    bimodalFitSorted,
+    dataBufferRead,
+    statsInference,
+)
+
+# full recompute from the rows after this many incremental updates, bounds rounding drift
+REBUILD_INTERVAL = 1000
+
+
+class ColumnStats:
+    """Sufficient statistics of one beta distributed column."""
+
+    def __init__(self):
+        self.n = 0
+        # sums are taken around the first value seen to avoid cancellation in the variance
+        self.shift = None
+        self.sum = 0.0
+        self.sumSq = 0.0
+        self.sumLogX = 0.0
+        self.sumLog1MinusX = 0.0
+
+    def add(self, x: float):
+        if self.shift is None:
+            self.shift = x
+        d = x - self.shift
+        self.n += 1
+        self.sum += d
+        self.sumSq += d * d
+        self.sumLogX += _log(x)
+        self.sumLog1MinusX += _log(1.0 - x)
+
+    def remove(self, x: float):
+        d = x - self.shift
+        self.n -= 1
+        self.sum -= d
+        self.sumSq -= d * d
+        self.sumLogX -= _log(x)
+        self.sumLog1MinusX -= _log(1.0 - x)
+
+    def isFinite(self) -> bool:
+        return math.isfinite(self.sumLogX) and math.isfinite(self.sumLog1MinusX)
+
+    @property
+    def mean(self) -> float:
+        return self.shift + self.sum / self.n
+
+    @property
+    def variance(self) -> float:
+        return max(0.0, (self.sumSq - self.sum * self.sum / self.n) / (self.n - 1))
+
+    def fit(self) -> BetaParams:
+        # need many data points for the distro to work
+        if self.n < 2:
+            return BetaParams(math.nan, math.nan)
+        return betaNewton(self.n, self.sumLogX, self.sumLog1MinusX, betaInit(self.mean, self.variance))
+
+
+class FittedParams(NamedTuple):
+    gpu: BetaParams
+    vram: BetaParams
+    power: BimodalParams
+
+
+class ModelFit:
+    """Reservoir rows of one model together with their statistics and fitted parameters."""
+
+    def __init__(self, rows: list[DataRow]):
+        self.rows: list[DataRow] = []
+        self.rebuild(rows)
+
+    def rebuild(self, rows: list[DataRow]):
+        self.rows = list(rows[:BUFFER_CAPACITY])
+        self.gpu = ColumnStats()
+        self.vram = ColumnStats()
+        self.power: list[float] = []
+        for row in self.rows:
+            self._add(row)
+        self.updates = 0
+        self.refit()
+
+    def _add(self, row: DataRow):
+        self.gpu.add(row.gpuUtilization)
+        self.vram.add(row.vramUsage)
+        bisect.insort(self.power, row.powerDraw)
+
+    def _remove(self, row: DataRow):
+        self.gpu.remove(row.gpuUtilization)
+        self.vram.remove(row.vramUsage)
+        del self.power[bisect.bisect_left(self.power, row.powerDraw)]
+
+    def refit(self):
+        # swapped in whole, verify() never sees the parameters of two different fits
+        self.params = FittedParams(self.gpu.fit(), self.vram.fit(), bimodalFitSorted(self.power))
+
+    def append(self, row: DataRow):
+        # stats_verify stops reading at its buffer capacity
+        if len(self.rows) >= BUFFER_CAPACITY:
+            return
+        self.rows.append(row)
+        self._add(row)
+        self._updated()
+
+    def replace(self, idx: int, row: DataRow):
+        if idx >= len(self.rows):
+            return
+        self._remove(self.rows[idx])
+        self.rows[idx] = row
+        self._add(row)
+        self._updated()
+
+    def _updated(self):
+        self.updates += 1
+        # a log(0) in the running sums cannot be subtracted back out
+        if self.updates >= REBUILD_INTERVAL or not (self.gpu.isFinite() and self.vram.isFinite()):
+            self.rebuild(self.rows)
+        else:
+            self.refit()
+
+    def verify(self, gpuData: float, vramData: float, powerData: float) -> StatsResult:
+        params = self.params
+        return statsInference(params.gpu, params.vram, params.power, gpuData, vramData, powerData)
+
+
+class FitCache:
+    """Model name -> ModelFit, loaded lazily from the storage file on first use."""
+
+    def __init__(self):
+        self.models: dict[str, ModelFit] = {}
+        self.lock = threading.Lock()
+
+    def get(self, model: str, storageFile: str) -> ModelFit:
+        with self.lock:
+            if model not in self.models:
+                self.models[model] = ModelFit(dataBufferRead(storageFile))
+            return self.models[model]
+
+    def verify(self, model: str, storageFile: str, gpuData: float, vramData: float, powerData: float) -> StatsResult:
+        # reads one FittedParams snapshot, updates under the lock replace it rather than mutate it
+        return self.get(model, storageFile).verify(gpuData, vramData, powerData)
+
+    def append(self, model: str, gpuUtilization: float, vramUsage: float, powerDraw: float):
+        with self.lock:
+            if model in self.models:
+                self.models[model].append(_toRow(gpuUtilization, vramUsage, powerDraw))
+
+    def replace(self, model: str, idx: int, gpuUtilization: float, vramUsage: float, powerDraw: float):
+        with self.lock:
+            if model in self.models:
+                self.models[model].replace(idx, _toRow(gpuUtilization, vramUsage, powerDraw))
+
+    def invalidate(self, model: str):
+        with self.lock:
+            self.models.pop(model, None)
+
+
+def _toRow(gpuUtilization: float, vramUsage: float, powerDraw: float) -> DataRow:
+    # same single precision rounding a reload through dataBufferRead would apply
+    return DataRow(_toFloat32(gpuUtilization), _toFloat32(vramUsage), _toFloat32(powerDraw))
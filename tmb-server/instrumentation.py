@@ -0,0 +1,41 @@
+"""
+Instruments of the tmb server, exposed on /stats.
+
+Stages of /finished and of the background attestation are timed into one
+histogram labelled by stage, so a slow verdict can be traced to waiting for
+metrics, the fit, the export script or the verifier. Gauges over state the
+server already keeps (sessions, reservoirs) are registered by tmb.py with
+callbacks read at scrape time.
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prometheus import Registry
+
+registry = Registry()
+
+# collect       session created -> /finished, i.e. waiting for the inference and its metrics
+# averages      window averages of the session's samples
+# fit           evaluating the cached reference fit (a full fit on a model's first verdict)
+# notify        counting the verdict for the attestation pipeline
+# reservoir     reservoir_sampling: Algorithm R offer, pwrite and fit cache update
+# finish        the whole of /finished
+# export        export_signature.sh, on the attestation worker
+# verify        full_verify of the exported bundle, on the attestation worker
+# attestation   one whole background attestation
+stageSeconds = registry.histogram("tmb_stage_seconds", "Wall time of each verification stage", ("stage",))
+verdictWaitSeconds = registry.histogram(
+    "tmb_verdict_wait_seconds", "Time clients waited for a verdict", ("endpoint", "outcome")
+)
+sessionsTimedOut = registry.counter(
+    "tmb_sessions_timed_out_total", "Verdict waits that ended without a verdict", ("endpoint",)
+)
+finishedTotal = registry.counter(
+    "tmb_finished_total", "Sessions finished, by outcome (verified, rejected, grace, error)", ("outcome",)
+)
+metricVerdicts = registry.counter(
+    "tmb_metric_verdicts_total", "Per-metric inference results of the stats check", ("metric", "result")
+)
+samplesTotal = registry.counter("tmb_samples_total", "SMIData samples received", ("result",))
+attestationsTotal = registry.counter("tmb_attestations_total", "Background attestations run", ("result",))
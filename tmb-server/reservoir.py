@@ -0,0 +1,189 @@
+"""
+In-memory reservoir of reference samples per model, persisted to {model}_storage.csv.
+
+Rows live in a preallocated array and the CSV is kept in a fixed-width layout
+(every field padded to FIELD_WIDTH), so an accepted sample costs one pwrite of
+a single row instead of a pandas read and rewrite of the whole file. The file
+stays a plain CSV for dataBufferRead and the C binary. The number of samples
+offered so far is kept in {model}_storage.seen for Algorithm R. Both files stay
+open and every add() ends with one fdatasync: of the row file when the sample
+was kept, of the count file otherwise. The count of a kept sample is synced by
+the next skip; until the reservoir is full the count equals the row count, which
+is what a restart falls back to.
+"""
+import os
+import random
+import threading
+from array import array
+from typing import Optional
+
+from stats_verify import DataRow
+
+HEADER = b"gpuUtilization,vramUsage,powerDraw\n"
+COLUMNS = len(DataRow._fields)
+# repr of any double fits in 24 characters
+FIELD_WIDTH = 24
+ROW_WIDTH = COLUMNS * FIELD_WIDTH + (COLUMNS - 1) + 1
+SEEN_WIDTH = 21
+# macOS has no fdatasync
+_fdatasync = getattr(os, "fdatasync", os.fsync)
+
+
+def formatRow(row) -> bytes:
+    return (",".join(repr(float(value)).ljust(FIELD_WIDTH) for value in row) + "\n").encode()
+
+
+class Reservoir:
+    """Algorithm R reservoir of one model, backed by a fixed-width CSV file."""
+
+    def __init__(self, filePath: str, capacity: int, rng: Optional[random.Random] = None):
+        self.filePath = filePath
+        self.seenPath = os.path.splitext(filePath)[0] + ".seen"
+        self.rng = rng or random.Random()
+        self.lock = threading.Lock()
+        self.rowFd = self.seenFd = -1
+
+        rows, fixedWidth = self._readFile()
+        # never drop reference rows a larger legacy file already holds
+        self.capacity = max(capacity, len(rows))
+        self.data = array("d", bytes(8 * COLUMNS * self.capacity))
+        self.size = 0
+        for row in rows:
+            self._set(self.size, row)
+            self.size += 1
+        self.seen = max(self._readSeen(), self.size)
+
+        if not fixedWidth:
+            self._snapshot()
+        self._open()
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _set(self, idx: int, row):
+        self.data[idx * COLUMNS : (idx + 1) * COLUMNS] = array("d", row)
+
+    def row(self, idx: int) -> DataRow:
+        return DataRow(*self.data[idx * COLUMNS : (idx + 1) * COLUMNS])
+
+    def rows(self) -> list[DataRow]:
+        return [self.row(idx) for idx in range(self.size)]
+
+    def add(self, gpuUtilization: float, vramUsage: float, powerDraw: float) -> tuple[str, int]:
+        """
+        Offer one sample. Returns ("append", idx), ("replace", idx) or ("skip", -1).
+        The n-th sample replaces a random slot with probability capacity / n.
+        """
+        row = (gpuUtilization, vramUsage, powerDraw)
+        with self.lock:
+            self.seen += 1
+            if self.size < self.capacity:
+                idx = self.size
+                action = "append"
+                self.size += 1
+            else:
+                idx = self.rng.randrange(self.seen)
+                if idx >= self.capacity:
+                    self._writeSeen()
+                    _fdatasync(self.seenFd)
+                    return "skip", -1
+                action = "replace"
+            self._set(idx, row)
+            self._writeRow(idx, row)
+            self._writeSeen()
+            # fdatasync still flushes a grown file size, it only skips timestamps
+            _fdatasync(self.rowFd)
+            return action, idx
+
+    def close(self):
+        for fd in (self.rowFd, self.seenFd):
+            if fd >= 0:
+                os.close(fd)
+        self.rowFd = self.seenFd = -1
+
+    def __del__(self):
+        self.close()
+
+    # ------------------------------------------------------------
+    # persistence
+    # ------------------------------------------------------------
+    def _readFile(self) -> tuple[list[tuple], bool]:
+        if not os.path.exists(self.filePath):
+            return [], False
+        with open(self.filePath, "rb") as file:
+            lines = file.read().splitlines(keepends=True)
+        fixedWidth = bool(lines) and lines[0] == HEADER
+        rows = []
+        for line in lines[1:]:
+            if fixedWidth and not line.endswith(b"\n"):
+                # torn final row of an interrupted pwrite
+                fixedWidth = False
+                continue
+            fields = line.split(b",")
+            try:
+                row = tuple(float(field) for field in fields)
+            except ValueError:
+                # torn or malformed row, dropped by the next snapshot
+                fixedWidth = False
+                continue
+            if len(row) != COLUMNS:
+                fixedWidth = False
+                continue
+            fixedWidth = fixedWidth and len(line) == ROW_WIDTH
+            rows.append(row)
+        return rows, fixedWidth
+
+    def _readSeen(self) -> int:
+        try:
+            with open(self.seenPath, "rb") as file:
+                return int(file.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _snapshot(self):
+        """Rewrite the whole file in the fixed-width layout, atomically."""
+        tmpPath = f"{self.filePath}.tmp"
+        with open(tmpPath, "wb") as file:
+            file.write(HEADER)
+            for idx in range(self.size):
+                file.write(formatRow(self.row(idx)))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmpPath, self.filePath)
+        # the replaced file is a new inode, a descriptor opened before points at the old one
+        self._open()
+        self._writeSeen()
+        _fdatasync(self.seenFd)
+
+    def _open(self):
+        self.close()
+        self.rowFd = os.open(self.filePath, os.O_WRONLY | os.O_CREAT, 0o644)
+        self.seenFd = os.open(self.seenPath, os.O_WRONLY | os.O_CREAT, 0o644)
+
+    def _writeRow(self, idx: int, row):
+        os.pwrite(self.rowFd, formatRow(row), len(HEADER) + idx * ROW_WIDTH)
+
+    def _writeSeen(self):
+        os.pwrite(self.seenFd, f"{self.seen}".ljust(SEEN_WIDTH - 1).encode() + b"\n", 0)
+
+
+class ReservoirStore:
+    """Model name -> Reservoir, opened lazily from baseDir."""
+
+    def __init__(self, baseDir: str, capacity: int):
+        self.baseDir = baseDir
+        self.capacity = capacity
+        self.reservoirs: dict[str, Reservoir] = {}
+        self.lock = threading.Lock()
+
+    def storageFile(self, model: str) -> str:
+        return os.path.join(self.baseDir, f"{model}_storage.csv")
+
+    def get(self, model: str) -> Reservoir:
+        with self.lock:
+            if model not in self.reservoirs:
+                self.reservoirs[model] = Reservoir(self.storageFile(model), self.capacity)
+            return self.reservoirs[model]
+
+    def size(self, model: str) -> int:
+        return len(self.get(model))
@@ -0,0 +1,169 @@
+"""
+Constant-memory aggregates for the samples of one session.
+
+/metrics folds every sample in as it arrives (Welford mean and variance,
+min, max, count), so /finished reads the averages in O(1) no matter how long
+the generation ran. Samples that carry the sampler's monotonic timestamp are
+also integrated over time (linear between samples, clipped to the request's
+window), which gives time-weighted averages and the energy of the request
+however unevenly the samples fall.
+"""
+import math
+from typing import Optional
+
+
+class RunningStats:
+    """Welford running mean and variance of one metric."""
+
+    __slots__ = ("count", "mean", "m2", "min", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, x: float):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+
+    @property
+    def variance(self) -> float:
+        # sample variance, same n - 1 denominator as the reference fits
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "std": self.std,
+            "min": self.min,
+            "max": self.max,
+        }
+
+
+class TimeWeighted:
+    """Integral over time of one metric, from timestamped samples."""
+
+    __slots__ = ("start", "end", "area", "first", "last")
+
+    def __init__(self):
+        # window the request ran in, None to integrate over the samples' own span
+        self.start: Optional[float] = None
+        self.end: Optional[float] = None
+        self.area = 0.0
+        self.first: Optional[tuple[float, float]] = None
+        self.last: Optional[tuple[float, float]] = None
+
+    def add(self, t: float, x: float):
+        if self.last is None:
+            self.first = self.last = (t, x)
+            return
+        t0, x0 = self.last
+        if t < t0:
+            # out of order, already covered by the segments integrated so far
+            return
+        lo = t0 if self.start is None else max(t0, self.start)
+        hi = t if self.end is None else min(t, self.end)
+        if hi > lo:
+            slope = (x - x0) / (t - t0)
+            self.area += (x0 + slope * (lo - t0) + x0 + slope * (hi - t0)) / 2 * (hi - lo)
+        self.last = (t, x)
+
+    def bounds(self) -> tuple[float, float]:
+        start = self.first[0] if self.start is None else self.start
+        end = self.last[0] if self.end is None else self.end
+        return start, max(start, end)
+
+    def integral(self) -> float:
+        """Area under the samples over the window, holding the first and last value at its edges."""
+        if self.first is None:
+            return 0.0
+        start, end = self.bounds()
+        area = self.area
+        if self.first[0] > start:
+            area += self.first[1] * (min(self.first[0], end) - start)
+        if self.last[0] < end:
+            area += self.last[1] * (end - max(self.last[0], start))
+        return area
+
+    @property
+    def duration(self) -> float:
+        if self.first is None:
+            return 0.0
+        start, end = self.bounds()
+        return end - start
+
+    @property
+    def mean(self) -> Optional[float]:
+        duration = self.duration
+        return self.integral() / duration if duration > 0 else None
+
+
+class SessionMetrics:
+    """Running aggregates of the three SMIData metrics for one session."""
+
+    __slots__ = ("model", "gpuUtilization", "vramUsage", "powerDraw", "timeWeighted")
+
+    def __init__(self):
+        self.model: Optional[str] = None
+        self.gpuUtilization = RunningStats()
+        self.vramUsage = RunningStats()
+        self.powerDraw = RunningStats()
+        # gpuUtilization, vramUsage, powerDraw over time
+        self.timeWeighted = (TimeWeighted(), TimeWeighted(), TimeWeighted())
+
+    @property
+    def count(self) -> int:
+        return self.gpuUtilization.count
+
+    def setWindow(self, start: Optional[float], end: Optional[float]):
+        """Sampler-clock interval the request ran in, set before its samples are added."""
+        for metric in self.timeWeighted:
+            metric.start, metric.end = start, end
+
+    def add(self, model: str, gpuUtilization: float, vramUsage: float, powerDraw: float, timestamp: Optional[float] = None):
+        # the first sample decides the model, as the per-sample cache did
+        if self.model is None:
+            self.model = model
+        self.gpuUtilization.add(gpuUtilization)
+        self.vramUsage.add(vramUsage)
+        self.powerDraw.add(powerDraw)
+        if timestamp is not None:
+            for metric, x in zip(self.timeWeighted, (gpuUtilization, vramUsage, powerDraw)):
+                metric.add(timestamp, x)
+
+    @property
+    def duration(self) -> float:
+        return self.timeWeighted[2].duration
+
+    @property
+    def energy(self) -> float:
+        """Joules drawn over the window, powerDraw is in mW."""
+        return self.timeWeighted[2].integral() / 1000.0
+
+    def averages(self) -> tuple[float, float, float]:
+        """Time-weighted averages when the samples were timestamped, plain means otherwise."""
+        means = (self.gpuUtilization.mean, self.vramUsage.mean, self.powerDraw.mean)
+        weighted = tuple(metric.mean for metric in self.timeWeighted)
+        return means if None in weighted else weighted
+
+    def summary(self) -> dict:
+        return {
+            "model": self.model,
+            "gpuUtilization": self.gpuUtilization.summary(),
+            "vramUsage": self.vramUsage.summary(),
+            "powerDraw": self.powerDraw.summary(),
+            "duration": self.duration,
+            "energyJoules": self.energy,
+            "timeWeighted": dict(zip(("gpuUtilization", "vramUsage", "powerDraw"), (metric.mean for metric in self.timeWeighted))),
+        }
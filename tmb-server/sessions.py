@@ -0,0 +1,179 @@
+"""
+Session table for in-flight inferences, replacing the bare pendingRequests dict.
+
+Sessions are spread over shards by userID, each shard guarded by its own
+lock. Locks are only held for dict access and state changes, never across an
+await, so they are plain threading locks and work from any event loop or
+threadpool. Every session follows
+
+    WAITING -> COLLECTING -> VERIFYING -> DONE
+
+and stays in the table until its verdict is collected by /clientRequest or
+it has been idle for longer than the TTL. Verdicts are also kept in a
+short-lived store of their own, so clients that subscribe after /finished,
+or several subscribers for the same userID, still get the result.
+"""
+import asyncio
+import threading
+import time
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Optional
+
+from running_stats import SessionMetrics
+
+
+class SessionState(str, Enum):
+    WAITING = "waiting"  # client is waiting, no metrics yet
+    COLLECTING = "collecting"  # metrics are arriving
+    VERIFYING = "verifying"  # /finished is running the checks
+    DONE = "done"  # verdict is available
+
+
+TRANSITIONS = {
+    SessionState.WAITING: {SessionState.COLLECTING, SessionState.DONE},
+    SessionState.COLLECTING: {SessionState.VERIFYING, SessionState.DONE},
+    SessionState.VERIFYING: {SessionState.DONE},
+    SessionState.DONE: set(),
+}
+
+
+class InvalidTransition(Exception):
+    pass
+
+
+@dataclass
+class Session:
+    userID: str
+    state: SessionState
+    event: asyncio.Event = field(default_factory=asyncio.Event)
+    metrics: SessionMetrics = field(default_factory=SessionMetrics)
+    verification: Optional[bool] = None
+    # reference to the latest background attestation when the verdict was reached
+    attestation: Optional[dict] = None
+    created: float = field(default_factory=time.monotonic)
+    touched: float = field(default_factory=time.monotonic)
+
+
+class SessionManager:
+    def __init__(self, shards: int = 64, ttl: float = 60.0, sweepInterval: float = 5.0, verdictTTL: float = 120.0):
+        self.ttl = ttl
+        self.sweepInterval = sweepInterval
+        self.verdictTTL = verdictTTL
+        self.shards: list[dict[str, Session]] = [{} for _ in range(shards)]
+        # userID -> (verification, attestation, time the session finished), sharded like the sessions
+        self.verdicts: list[dict[str, tuple[Optional[bool], Optional[dict], float]]] = [{} for _ in range(shards)]
+        self.locks = [threading.Lock() for _ in range(shards)]
+        self.lastSweep = time.monotonic()
+        self.created = 0
+        self.expired = 0
+
+    def _shard(self, userID: str) -> int:
+        return hash(userID) % len(self.shards)
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self.shards)
+
+    def countByState(self) -> dict[SessionState, int]:
+        """Sessions in the table per state, for /stats."""
+        counts = dict.fromkeys(SessionState, 0)
+        for idx, shard in enumerate(self.shards):
+            with self.locks[idx]:
+                for session in shard.values():
+                    counts[session.state] += 1
+        return counts
+
+    def get(self, userID: str) -> Optional[Session]:
+        idx = self._shard(userID)
+        with self.locks[idx]:
+            return self.shards[idx].get(userID)
+
+    def getOrCreate(self, userID: str, state: SessionState) -> Session:
+        """Return the live session for userID, creating it in the given state."""
+        self.maybeExpire()
+        idx = self._shard(userID)
+        with self.locks[idx]:
+            session = self.shards[idx].get(userID)
+            if session is None:
+                session = Session(userID, state)
+                self.shards[idx][userID] = session
+                # a new inference under a reused userID must not see the old verdict
+                self.verdicts[idx].pop(userID, None)
+                self.created += 1
+            session.touched = time.monotonic()
+            return session
+
+    def transition(self, session: Session, *expected: SessionState, to: SessionState) -> bool:
+        """
+        Move session to the given state if it is currently in one of the expected states.
+        Returns False when the session is in another (legal) state, raises on illegal moves.
+        """
+        idx = self._shard(session.userID)
+        with self.locks[idx]:
+            if expected and session.state not in expected:
+                return False
+            if to != session.state and to not in TRANSITIONS[session.state]:
+                raise InvalidTransition(f"{session.userID}: {session.state.value} -> {to.value}")
+            session.state = to
+            session.touched = time.monotonic()
+            if to == SessionState.DONE:
+                self.verdicts[idx][session.userID] = (session.verification, session.attestation, session.touched)
+        if to == SessionState.DONE:
+            session.event.set()
+        return True
+
+    def publish(self, userID: str, verification: Optional[bool], attestation: Optional[dict]) -> bool:
+        """
+        Record a verdict reached by an earlier run, e.g. for a cached response,
+        and release anyone waiting on userID. False if an inference is already
+        reporting metrics under userID.
+        """
+        session = self.getOrCreate(userID, SessionState.WAITING)
+        if session.state != SessionState.WAITING:
+            return False
+        session.verification = verification
+        session.attestation = attestation
+        return self.transition(session, SessionState.WAITING, to=SessionState.DONE)
+
+    def verdict(self, userID: str) -> Optional[dict]:
+        """The stored verdict for userID, None if there is none or it expired."""
+        idx = self._shard(userID)
+        with self.locks[idx]:
+            stored = self.verdicts[idx].get(userID)
+        if stored is None or time.monotonic() - stored[2] > self.verdictTTL:
+            return None
+        return {"Verified": stored[0], "Attestation": stored[1]}
+
+    def remove(self, session: Session, *states: SessionState) -> bool:
+        """Drop session from the table, only if it is still in one of states when given."""
+        idx = self._shard(session.userID)
+        with self.locks[idx]:
+            if states and session.state not in states:
+                return False
+            # a new session may already live under the same userID
+            if self.shards[idx].get(session.userID) is not session:
+                return False
+            del self.shards[idx][session.userID]
+            return True
+
+    def maybeExpire(self):
+        now = time.monotonic()
+        if now - self.lastSweep >= self.sweepInterval:
+            self.lastSweep = now
+            self.expire(now)
+
+    def expire(self, now: Optional[float] = None) -> int:
+        """Drop sessions idle for longer than the TTL and old verdicts, returns how many sessions were removed."""
+        now = time.monotonic() if now is None else now
+        removed = 0
+        for idx, shard in enumerate(self.shards):
+            with self.locks[idx]:
+                stale = [userID for userID, session in shard.items() if now - session.touched > self.ttl]
+                for userID in stale:
+                    del shard[userID]
+                removed += len(stale)
+                verdicts = self.verdicts[idx]
+                for userID in [userID for userID, (_, _, doneAt) in verdicts.items() if now - doneAt > self.verdictTTL]:
+                    del verdicts[userID]
+        self.expired += removed
+        return removed
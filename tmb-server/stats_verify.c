@@ -35,8 +35,10 @@ int main(int argcnt, char *argls[]) {
     
     assert (argcnt == 5);
     DataBuffer buffer;
-    // TODO with python, move 10, the buffer size to a global config file
-    DataBufferInit(&buffer, 200);
+    // same default and override as config.py's buffer_capacity
+    const char *capacityEnv = getenv("TMB_BUFFER_CAPACITY");
+    int capacity = capacityEnv ? atoi(capacityEnv) : 200;
+    DataBufferInit(&buffer, capacity > 0 ? capacity : 200);
     DataBufferRead(&buffer, filePath);
     // DataBufferPrint(&buffer);
 
@@ -0,0 +1,345 @@
+"""
+In-process port of stats_verify.c and the gpu-utilization, vram and powerdraw
+fitting code, so /finished no longer compiles and forks the C binary per request.
+
+The arithmetic follows the C sources step for step (float32 CSV parsing,
+sequential sums, IEEE inf/nan instead of Python exceptions, GSL digamma,
+trigamma and lngamma) so that verdicts match the binary.
+"""
+import math
+import os
+import re
+import struct
+import sys
+from typing import NamedTuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import get_config
+
+# rows read from a reservoir file, stats_verify.c reads TMB_BUFFER_CAPACITY too
+BUFFER_CAPACITY = get_config().buffer_capacity
+
+EPSILON = 2.220446049250313e-16  # DBL_EPSILON
+LOWER_BOUND = 1e-14
+SMALL_ALPHA = 1e-6
+SMALL_BETA = 1e-6
+SMALL_DELTA = 1e-8
+NEWTON_ITERATIONS = 50
+NEWTON_STEP = 0.1
+
+# hard coded cut off thresholds, same as the C inference functions
+GPU_LOG_PDF_THRESHOLD = 0.1
+VRAM_LOG_PDF_THRESHOLD = 2
+POWER_PDF_THRESHOLD = 0.05
+
+_FLOAT_PREFIX = re.compile(r"\s*[+-]?(?:inf(?:inity)?|nan|(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)", re.I)
+
+
+class DataRow(NamedTuple):
+    gpuUtilization: float
+    vramUsage: float
+    powerDraw: float
+
+
+class BetaParams(NamedTuple):
+    alpha: float
+    beta: float
+
+
+class BimodalParams(NamedTuple):
+    mean1: float
+    std1: float
+    mean2: float
+    std2: float
+    weight1: float
+    weight2: float
+
+
+class StatsResult(NamedTuple):
+    gpuParams: BetaParams
+    vramParams: BetaParams
+    powerParams: BimodalParams
+    gpuAccepted: bool
+    vramAccepted: bool
+    powerAccepted: bool
+
+    @property
+    def verified(self) -> bool:
+        # the binary only reports the vram verdict, see the end of stats_verify.c main
+        return self.vramAccepted
+
+
+# ------------------------------------------------------------
+# C numeric helpers
+# ------------------------------------------------------------
+def _strtof(token: str) -> float:
+    """strtof: parse the longest float prefix and round it to single precision."""
+    match = _FLOAT_PREFIX.match(token)
+    if not match:
+        return 0.0
+    value = float(match.group(0))
+    try:
+        return _toFloat32(value)
+    except OverflowError:
+        return math.copysign(math.inf, value)
+
+
+def _toFloat32(value: float) -> float:
+    return struct.unpack("f", struct.pack("f", value))[0]
+
+
+def _div(a: float, b: float) -> float:
+    try:
+        return a / b
+    except ZeroDivisionError:
+        if a == 0 or math.isnan(a):
+            return math.nan
+        return math.copysign(math.inf, a) * math.copysign(1.0, b)
+
+
+def _log(x: float) -> float:
+    if x > 0:
+        return math.log(x)
+    if x == 0:
+        return -math.inf
+    return math.nan
+
+
+def _lngamma(x: float) -> float:
+    try:
+        return math.lgamma(x)
+    except ValueError:
+        # gsl_sf_lngamma domain error with the error handler off
+        return math.nan
+
+
+def _psi(x: float) -> float:
+    """Digamma, gsl_sf_psi for x > 0: recurrence up to x >= 10 then the asymptotic series."""
+    if math.isnan(x) or x <= 0:
+        return math.nan
+    result = 0.0
+    while x < 10.0:
+        result -= 1.0 / x
+        x += 1.0
+    f = 1.0 / (x * x)
+    series = f * (1 / 12 - f * (1 / 120 - f * (1 / 252 - f * (1 / 240 - f * (1 / 132 - f * (691 / 32760 - f / 12))))))
+    return result + math.log(x) - 0.5 / x - series
+
+
+def _psi1(x: float) -> float:
+    """Trigamma, gsl_sf_psi_1 for x > 0: recurrence up to x >= 10 then the asymptotic series."""
+    if math.isnan(x) or x <= 0:
+        return math.nan
+    result = 0.0
+    while x < 10.0:
+        result += 1.0 / (x * x)
+        x += 1.0
+    f = 1.0 / (x * x)
+    series = f * (1 / 6 - f * (1 / 30 - f * (1 / 42 - f * (1 / 30 - f * (5 / 66 - f * (691 / 2730 - f * 7 / 6))))))
+    return result + (1.0 + 0.5 / x + series) / x
+
+
+# ------------------------------------------------------------
+# DataBuffer (stats_verify.c)
+# ------------------------------------------------------------
+def dataBufferRead(filePath: str, totalCapacity: int = BUFFER_CAPACITY) -> list[DataRow]:
+    """Read the reservoir CSV the way DataBufferRead does: skip the header, strtok on commas, cap at totalCapacity."""
+    buffer: list[DataRow] = []
+    with open(filePath, "r") as file:
+        for lineNum, line in enumerate(file):
+            if len(buffer) >= totalCapacity:
+                break
+            # skip header
+            if lineNum == 0:
+                continue
+            # strtok collapses empty fields
+            tokens = [token for token in line.rstrip("\n").split(",") if token]
+            if not tokens:
+                continue
+            buffer.append(
+                DataRow(
+                    _strtof(tokens[0]),
+                    _strtof(tokens[1]) if len(tokens) > 1 else _toFloat32(0.3),
+                    _strtof(tokens[2]) if len(tokens) > 2 else _toFloat32(0.3),
+                )
+            )
+    return buffer
+
+
+def sampleMeanVariance(values: list[float]) -> tuple[float, float]:
+    """sampleMean and sampleVariance (n - 1 denominator) for one column."""
+    n = len(values)
+    total = 0.0
+    for value in values:
+        total += value
+    mean = _div(total, n)
+    sqSum = 0.0
+    for value in values:
+        sqSum += (value - mean) * (value - mean)
+    return mean, _div(sqSum, n - 1)
+
+
+# ------------------------------------------------------------
+# Beta fits (gpu-utilization/utils.c, vram/utils.c)
+# ------------------------------------------------------------
+def betaInit(mean: float, variance: float) -> BetaParams:
+    """Method of Moments initialization for alpha and beta."""
+    if variance <= 0.0:
+        return BetaParams(1.0, 1.0)
+    t = _div(mean * (1 - mean), variance) - 1
+    return BetaParams(max(EPSILON, mean * t), max(EPSILON, (1 - mean) * t))
+
+
+def betaNewton(n: int, sumLogX: float, sumLog1MinusX: float, initial: BetaParams) -> BetaParams:
+    """Damped Newton iterations on the beta log likelihood score."""
+    alpha, beta = initial
+    for _ in range(NEWTON_ITERATIONS):
+        alphaBeta = alpha + beta
+
+        # gradients from score vectors
+        g1 = n * (_psi(alphaBeta) - _psi(alpha)) + sumLogX
+        g2 = n * (_psi(alphaBeta) - _psi(beta)) + sumLog1MinusX
+
+        # Hessian entries from digamma derivatives
+        A = _psi1(alphaBeta) - _psi1(alpha)
+        B = _psi1(alphaBeta) - _psi1(beta)
+        C = _psi1(alphaBeta)
+        D = A * B - C * C
+        if abs(D) < LOWER_BOUND:
+            break
+
+        dalpha = _div(B * g1 - C * g2, D)
+        dbeta = _div(-C * g1 + A * g2, D)
+        # slows Newton methods to prevent divergence
+        alpha -= NEWTON_STEP * dalpha
+        beta -= NEWTON_STEP * dbeta
+
+        if alpha <= 0:
+            alpha = SMALL_ALPHA
+        if beta <= 0:
+            beta = SMALL_BETA
+
+        if abs(dalpha) < SMALL_DELTA * abs(alpha) and abs(dbeta) < SMALL_DELTA * abs(beta):
+            break
+    return BetaParams(alpha, beta)
+
+
+def betaFit(values: list[float]) -> BetaParams:
+    n = len(values)
+    # need many data points for the distro to work
+    if n < 2:
+        return BetaParams(math.nan, math.nan)
+
+    mean, variance = sampleMeanVariance(values)
+    sumLogX = 0.0
+    sumLog1MinusX = 0.0
+    for value in values:
+        sumLogX += _log(value)
+        sumLog1MinusX += _log(1.0 - value)
+    return betaNewton(n, sumLogX, sumLog1MinusX, betaInit(mean, variance))
+
+
+def betaDistroGPU(buffer: list[DataRow]) -> BetaParams:
+    return betaFit([row.gpuUtilization for row in buffer])
+
+
+def betaDistroVRAM(buffer: list[DataRow]) -> BetaParams:
+    return betaFit([row.vramUsage for row in buffer])
+
+
+def betaLogPDF(data: float, alpha: float, beta: float) -> float:
+    lnB = _lngamma(alpha) + _lngamma(beta) - _lngamma(alpha + beta)
+    return (alpha - 1) * _log(data) + (beta - 1) * _log(1.0 - data) - lnB
+
+
+def betaDistroGPUInference(data: float, params: BetaParams) -> bool:
+    return betaLogPDF(data, params.alpha, params.beta) > GPU_LOG_PDF_THRESHOLD
+
+
+def betaDistroVRAMInference(data: float, params: BetaParams) -> bool:
+    return betaLogPDF(data, params.alpha, params.beta) > VRAM_LOG_PDF_THRESHOLD
+
+
+# ------------------------------------------------------------
+# Bimodal power fit (powerdraw/utils.c)
+# ------------------------------------------------------------
+def gaussianPDF(x: float, mean: float, std: float) -> float:
+    coeff = _div(1.0, std * math.sqrt(2 * math.pi))
+    z = _div(x - mean, std)
+    return coeff * math.exp(-0.5 * (z * z))
+
+
+def bimodalFitPower(buffer: list[DataRow]) -> BimodalParams:
+    return bimodalFitSorted(sorted(row.powerDraw for row in buffer))
+
+
+def bimodalFitSorted(data: list[float]) -> BimodalParams:
+    """Split the sorted power column at its median and fit one Gaussian per phase."""
+    n = len(data)
+    if n < 2:
+        return BimodalParams(*([math.nan] * 6))
+
+    if n % 2 == 0:
+        median = (data[n // 2 - 1] + data[n // 2]) / 2.0
+    else:
+        median = data[n // 2]
+
+    # phase 1: <= median, phase 2: > median
+    sum1 = sum2 = 0.0
+    count1 = count2 = 0
+    for value in data:
+        if value <= median:
+            sum1 += value
+            count1 += 1
+        else:
+            sum2 += value
+            count2 += 1
+    mean1 = _div(sum1, count1)
+    mean2 = _div(sum2, count2)
+
+    sqsum1 = sqsum2 = 0.0
+    for value in data:
+        if value <= median:
+            sqsum1 += (value - mean1) * (value - mean1)
+        else:
+            sqsum2 += (value - mean2) * (value - mean2)
+    std1 = math.sqrt(_div(sqsum1, count1 - 1))
+    std2 = math.sqrt(_div(sqsum2, count2 - 1))
+
+    return BimodalParams(mean1, std1, mean2, std2, count1 / n, count2 / n)
+
+
+def bimodalPowerInference(x: float, params: BimodalParams) -> bool:
+    p = params.weight1 * gaussianPDF(x, params.mean1, params.std1) + params.weight2 * gaussianPDF(
+        x, params.mean2, params.std2
+    )
+    return p > POWER_PDF_THRESHOLD
+
+
+# ------------------------------------------------------------
+# entry point, equivalent to ./stats_verify <storage> <gpu> <vram> <power>
+# ------------------------------------------------------------
+def statsVerify(filePath: str, gpuData: float, vramData: float, powerData: float) -> StatsResult:
+    buffer = dataBufferRead(filePath)
+    return statsInference(
+        betaDistroGPU(buffer), betaDistroVRAM(buffer), bimodalFitPower(buffer), gpuData, vramData, powerData
+    )
+
+
+def statsInference(
+    gpuParams: BetaParams,
+    vramParams: BetaParams,
+    powerParams: BimodalParams,
+    gpuData: float,
+    vramData: float,
+    powerData: float,
+) -> StatsResult:
+    """Run the three inference checks against already fitted parameters."""
+    return StatsResult(
+        gpuParams,
+        vramParams,
+        powerParams,
+        betaDistroGPUInference(gpuData, gpuParams),
+        betaDistroVRAMInference(vramData, vramParams),
+        bimodalPowerInference(powerData, powerParams),
+    )
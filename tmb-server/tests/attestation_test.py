@@ -0,0 +1,73 @@
+import os
+import sys
+import threading
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from attestation import AttestationPipeline
+
+# run pytest -v
+
+
+class StubRunner:
+    def __init__(self, verified=True):
+        self.verified = verified
+        self.calls = []
+        self.release = threading.Event()
+
+    def __call__(self, attestationID):
+        self.calls.append(attestationID)
+        self.release.wait(5)
+        return self.verified
+
+
+def test_notify_does_not_wait_for_attestation():
+    runner = StubRunner()
+    pipeline = AttestationPipeline(runner, interval=3600, everyRequests=1000)
+
+    # first verdict starts an attestation and returns before it finishes
+    assert pipeline.notify() is None
+    runner.release.set()
+    pipeline.wait(5)
+
+    reference = pipeline.notify()
+    assert reference["id"] == 1
+    assert reference["verified"] is True
+    assert runner.calls == [1]
+
+
+def test_attests_every_n_requests_single_flight():
+    runner = StubRunner(verified=False)
+    pipeline = AttestationPipeline(runner, interval=3600, everyRequests=3)
+
+    pipeline.notify()
+    # due again after three verdicts, but one is still running
+    for _ in range(5):
+        pipeline.notify()
+    assert runner.calls == [1]
+
+    # the overdue attestation starts with the first verdict after it finished
+    runner.release.set()
+    pipeline.wait(5)
+    pipeline.notify()
+    pipeline.wait(5)
+    assert runner.calls == [1, 2]
+
+    for _ in range(2):
+        pipeline.notify()
+    assert pipeline.pending is None
+    pipeline.notify()
+    pipeline.wait(5)
+    assert runner.calls == [1, 2, 3]
+    assert pipeline.reference()["verified"] is False
+
+
+def test_runner_errors_are_recorded():
+    def failing(attestationID):
+        raise RuntimeError("tpm unavailable")
+
+    pipeline = AttestationPipeline(failing, interval=3600)
+    pipeline.notify()
+    pipeline.wait(5)
+    reference = pipeline.reference()
+    assert reference["verified"] is False
+    assert reference["error"] == "tpm unavailable"
@@ -0,0 +1,96 @@
+import hashlib
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "benchmarks"))
+import fixtures
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "verifier"))
+import audit_log
+from audit_log import AuditLogError, find_attested_prefix, verify_audit_log
+
+# run pytest -v
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    """Chunks shorter than a line, so every line is cut by a chunk boundary."""
+    monkeypatch.setattr(audit_log, "CHUNK_SIZE", 7)
+
+
+@pytest.fixture
+def starts(monkeypatch):
+    """Where each find_attested_prefix call verify_audit_log makes starts hashing."""
+    calls = []
+
+    def spy(log, attested_hash, start=0, hasher=None):
+        calls.append(start)
+        return find_attested_prefix(log, attested_hash, start, hasher)
+
+    monkeypatch.setattr(audit_log, "find_attested_prefix", spy)
+    return calls
+
+
+def prefix(lines: list, count: int) -> bytes:
+    return b"".join(lines[:count])
+
+
+@pytest.mark.parametrize("chunk_size", [7, 64, 1 << 20])
+def test_line_split_across_chunks(monkeypatch, chunk_size):
+    monkeypatch.setattr(audit_log, "CHUNK_SIZE", chunk_size)
+    lines = fixtures.audit_log(40).data.splitlines(keepends=True)
+    log = b"".join(lines)
+    for count in (1, 13, 40):
+        attested = hashlib.sha256(prefix(lines, count)).digest()
+        assert find_attested_prefix(log, attested) == len(prefix(lines, count))
+    # a prefix that ends inside a line is not line-aligned
+    assert find_attested_prefix(log, hashlib.sha256(log[:100]).digest()) == -1
+
+
+def test_partial_final_line(small_chunks):
+    log = b"type=A msg=1\ntype=B msg=2\ntype=C msg="
+    assert find_attested_prefix(log, hashlib.sha256(log).digest()) == len(log)
+    assert find_attested_prefix(log, hashlib.sha256(log[:13]).digest()) == 13
+    # part of the unfinished line is not a match
+    assert find_attested_prefix(log, hashlib.sha256(log[:-2]).digest()) == -1
+
+
+def test_resume_from_saved_state(small_chunks, starts):
+    audit = fixtures.audit_log(60, attested=0.5)
+    first = verify_audit_log(audit.data, audit.attested_hash)
+    assert first == {"offset": len(prefix(audit.data.splitlines(keepends=True), 30)), "digest": audit.attested_hash.hex()}
+
+    # IMA measures the log again after it grew
+    lines = audit.data.splitlines(keepends=True)
+    attested = hashlib.sha256(prefix(lines, 50)).digest()
+    starts.clear()
+    second = verify_audit_log(audit.data, attested, first)
+    assert starts == [first["offset"]]
+    assert second == verify_audit_log(audit.data, attested) == {"offset": len(prefix(lines, 50)), "digest": attested.hex()}
+
+    # unchanged measurement, the saved prefix is the match
+    starts.clear()
+    assert verify_audit_log(audit.data, attested, second) == second
+    assert starts == [second["offset"]]
+
+
+def test_modified_earlier_line_falls_back(small_chunks, starts):
+    audit = fixtures.audit_log(60, attested=0.5)
+    first = verify_audit_log(audit.data, audit.attested_hash)
+    lines = audit.data.splitlines(keepends=True)
+    lines[3] = lines[3].replace(b"uid=0", b"uid=1")
+    rewritten = b"".join(lines)
+    starts.clear()
+
+    # rewritten and measured again: the saved prefix no longer hashes to its digest, the whole log is searched
+    attested = hashlib.sha256(prefix(lines, 50)).digest()
+    assert verify_audit_log(rewritten, attested, first)["offset"] == len(prefix(lines, 50))
+    assert starts == [0]
+
+    # rewritten after the measurement
+    with pytest.raises(AuditLogError):
+        verify_audit_log(rewritten, hashlib.sha256(audit.data[: first["offset"]] + b"x\n").digest(), first)
+    with pytest.raises(AuditLogError):
+        verify_audit_log(rewritten, audit.attested_hash)
@@ -0,0 +1,49 @@
+import contextlib
+import io
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "benchmarks"))
+import fixtures
+from bench import compare, find_baseline
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "verifier"))
+from full_verify import replay_measurements, verify_bundle
+from reservoir import Reservoir
+
+# run pytest -v
+
+
+def test_fixtures_pass_verification(tmp_path):
+    """The synthetic logs must be ones the verifier accepts, or the benchmarks time an early failure."""
+    reservoir = Reservoir(fixtures.write_reservoir(str(tmp_path / "bench_storage.csv"), 50), 50)
+    assert len(reservoir) == 50
+
+    ima = fixtures.ima_log(2 * fixtures.VIOLATION_EVERY)
+    expected = [b"\x00" * 20] * 10 + [ima.pcrs[i] for i in (10, 11, 12)]
+    _, _, matchedAt = replay_measurements(ima.data, expected)
+    assert max(matchedAt.values()) == ima.records - 1
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = verify_bundle(fixtures.bundle(500, boot_events=50, audit_lines=100), cache_path=None)
+    assert not result["cached"]
+
+
+def test_regressions_against_the_baseline_run():
+    history = [
+        {"commit": "aaaaaaa", "host": "bench", "results": {"ima_replay[1000]": {"median": 1.0}}},
+        {"commit": "bbbbbbb", "host": "other", "results": {"ima_replay[1000]": {"median": 9.0}}},
+        {"commit": "ccccccc-dirty", "host": "bench", "results": {"ima_replay[1000]": {"median": 2.0}}},
+    ]
+    assert find_baseline(history, "bench")["commit"] == "ccccccc-dirty"
+    assert find_baseline(history, "bench", "aaa")["commit"] == "aaaaaaa"
+    assert find_baseline(history, "laptop") is None
+
+    results = {
+        "ima_replay[1000]": {"median": 1.5, "rate": 666.0, "unit": "records"},
+        "ima_parse[1000]": {"median": 1.0, "rate": 1000.0, "unit": "records"},
+    }
+    lines, regressions = compare(results, history[0], threshold=0.1)
+    assert regressions == ["ima_replay[1000]"]
+    assert len(lines) == 1 and lines[0].endswith("+50.0%")
+    assert compare(results, history[2], threshold=0.1)[1] == []
@@ -0,0 +1,48 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from config import Config, get_config, load_config
+
+# run pytest -v
+
+
+def test_defaults_and_port_map(tmp_path):
+    portMap = tmp_path / "port_map.txt"
+    portMap.write_text("load: 4821\ntmb: 4823\n")
+
+    config = load_config({"TMB_PORT_MAP": str(portMap)})
+    assert config.ports == {"load": 4821, "tmb": 4823}
+    assert config.url("tmb") == "http://127.0.0.1:4823"
+    assert config.port("wrapper") is None
+    assert config.reservoir_size == Config.reservoir_size
+    assert config.wrapper_models() == "a,3222;b,3223;"
+
+
+def test_environment_overrides(tmp_path):
+    config = load_config({
+        "TMB_PORT_MAP": str(tmp_path / "missing.txt"),
+        "TMB_PORT_WRAPPER": "5822",
+        "TMB_RESERVOIR_SIZE": "50",
+        "TMB_VERDICT_TIMEOUT": "2.5",
+        "TMB_MODELS": "a,4000;c,4002",
+        "TMB_BACKENDS": "a=http://127.0.0.1:3822/, http://127.0.0.1:3832;c=http://127.0.0.1:3842",
+        "TMB_SCHEDULER_POLICY": "ewma",
+        "TMB_RESPONSE_CACHE": "true",
+        "TMB_RESPONSE_CACHE_BYTES": "1024",
+    })
+    assert config.ports == {"wrapper": 5822}
+    assert config.reservoir_size == 50
+    assert config.verdict_timeout == 2.5
+    assert config.models == {"a": 4000, "c": 4002}
+    assert config.backends == {"a": ["http://127.0.0.1:3822", "http://127.0.0.1:3832"], "c": ["http://127.0.0.1:3842"]}
+    assert config.scheduler_policy == "ewma"
+    assert config.response_cache is True
+    assert config.response_cache_bytes == 1024
+    assert load_config({"TMB_RESPONSE_CACHE": "0"}).response_cache is False
+
+
+def test_get_config_is_memoised():
+    assert get_config() is get_config()
+    get_config.cache_clear()
+    assert get_config() == load_config()
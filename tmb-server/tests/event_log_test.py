@@ -0,0 +1,129 @@
+import hashlib
+import io
+import os
+import struct
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "benchmarks"))
+import fixtures
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "verifier"))
+from event_log import EventLogError, iter_boot_events, iter_ima_records, parse_ima_ng
+
+# run pytest -v
+
+
+# ------------------------------------------------------------
+# the parsers full_verify used before event_log, reading copies of every field
+# ------------------------------------------------------------
+def legacy_parse_ima_ng(data_bytes: bytes):
+    data_hash_length = struct.unpack("<I", data_bytes[:4])[0]
+    data_hash_algorithm = data_bytes[4 : 4 + data_hash_length].split(b"\x00")[0]
+    data_hash = data_bytes[4 + len(data_hash_algorithm) + 1 : 4 + data_hash_length]
+    name_length = struct.unpack("<I", data_bytes[4 + data_hash_length : 4 + data_hash_length + 4])[0]
+    name = data_bytes[4 + data_hash_length + 4 : 4 + data_hash_length + 4 + name_length - 1]
+    return data_hash, name
+
+
+def legacy_ima_records(measurements: bytes):
+    offset = 0
+    while offset < len(measurements):
+        pcr_index = struct.unpack_from("<I", measurements, offset)[0]
+        template_data_hash = measurements[offset + 4 : offset + 24]
+        template_name_length = struct.unpack_from("<I", measurements, offset + 24)[0]
+        template_name = measurements[offset + 28 : offset + 28 + template_name_length]
+        offset += 28 + template_name_length
+        template_data_length = struct.unpack_from("<I", measurements, offset)[0]
+        template_data = measurements[offset + 4 : offset + 4 + template_data_length]
+        offset += 4 + template_data_length
+        yield pcr_index, template_data_hash, template_name, template_data
+
+
+def legacy_boot_events(secure_boot: bytes):
+    """
+    The old file walk of secure_boot. It read a fixed 172 byte digest dump
+    (all four banks); here the dump is split by the sizes the Spec ID event lists.
+    """
+    log = io.BytesIO(secure_boot)
+    pcr_index = struct.unpack("<I", log.read(4))[0]
+    event_type = struct.unpack("<I", log.read(4))[0]
+    initial_digest = log.read(20)
+    event_size = struct.unpack("<I", log.read(4))[0]
+    event_data = log.read(event_size)
+    yield pcr_index, event_type, (("sha1", initial_digest),), event_data
+
+    count = struct.unpack("<I", event_data[24:28])[0]
+    sizes = dict(struct.unpack("<HH", event_data[28 + 4 * i : 32 + 4 * i]) for i in range(count))
+    names = {0x0004: "sha1", 0x000B: "sha256"}
+    while log.read(1):
+        log.seek(-1, os.SEEK_CUR)
+        pcr_index = struct.unpack("<I", log.read(4))[0]
+        event_type = struct.unpack("<I", log.read(4))[0]
+        digest_count = struct.unpack("<I", log.read(4))[0]
+        digests = []
+        for _ in range(digest_count):
+            algorithm_id = struct.unpack("<H", log.read(2))[0]
+            digests.append((names[algorithm_id], log.read(sizes[algorithm_id])))
+        event_size = struct.unpack("<I", log.read(4))[0]
+        event_data = log.read(event_size)
+        yield pcr_index, event_type, tuple(digests), event_data
+
+
+def test_ima_records_match_the_legacy_parser():
+    ima = fixtures.ima_log(2 * fixtures.VIOLATION_EVERY, audit_rules=b"-D\n", audit_hash=b"\x01" * 32)
+    records = list(iter_ima_records(ima.data))
+    legacy = list(legacy_ima_records(ima.data))
+    assert len(records) == len(legacy) == ima.records
+    for record, (pcr_index, template_hash, template_name, template_data) in zip(records, legacy):
+        assert (record.pcr_index, record.template_hash, record.template_name) == (pcr_index, template_hash, template_name)
+        assert bytes(record.template_data) == template_data
+        assert parse_ima_ng(record.template_data) == legacy_parse_ima_ng(template_data)
+    assert records[-1].end == len(ima.data)
+    assert parse_ima_ng(records[-1].template_data) == (b"\x01" * 32, fixtures.AUDIT_LOG_PATH)
+
+
+def test_ima_records_resume_from_an_offset():
+    ima = fixtures.ima_log(50)
+    records = list(iter_ima_records(ima.data))
+    assert list(iter_ima_records(ima.data, records[19].end)) == records[20:]
+
+
+def test_boot_events_match_the_legacy_parser():
+    boot = fixtures.boot_log(200)
+    events = list(iter_boot_events(boot.data))
+    legacy = list(legacy_boot_events(boot.data))
+    assert len(events) == len(legacy) == boot.events + 1
+    for event, (pcr_index, event_type, digests, event_data) in zip(events, legacy):
+        assert (event.pcr_index, event.event_type, event.digests) == (pcr_index, event_type, digests)
+        assert bytes(event.event_data) == event_data
+
+    pcrs = [fixtures.SHA1_ZERO] * 10
+    for event in events[1:]:
+        pcrs[event.pcr_index] = hashlib.sha1(pcrs[event.pcr_index] + dict(event.digests)["sha1"]).digest()
+    assert pcrs == boot.pcrs
+
+
+def test_unknown_algorithm_is_a_parse_error():
+    boot = fixtures.boot_log(3)
+    header = len(fixtures.spec_id_event())
+    # the first digest of the first agile event names sha384, which the Spec ID event does not list
+    data = boot.data[: header + 12] + struct.pack("<H", 0x000C) + boot.data[header + 14 :]
+    with pytest.raises(EventLogError, match="0x000c"):
+        list(iter_boot_events(data))
+
+
+@pytest.mark.parametrize("cut", [1, 10, 30])
+def test_truncated_logs_are_parse_errors(cut):
+    boot = fixtures.boot_log(3)
+    with pytest.raises(EventLogError):
+        list(iter_boot_events(boot.data[:-cut]))
+
+    ima = fixtures.ima_log(3)
+    records = list(iter_ima_records(ima.data))
+    with pytest.raises(EventLogError, match=f"offset {records[1].end}"):
+        list(iter_ima_records(ima.data[:-cut]))
+
+    with pytest.raises(EventLogError):
+        parse_ima_ng(bytes(records[0].template_data)[:-cut])
@@ -0,0 +1,96 @@
+import os
+import random
+import sys
+import threading
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from fit_cache import FitCache
+from stats_verify import dataBufferRead, statsVerify
+
+# run pytest -v
+baseDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = ["a_storage.csv", "b_storage.csv", "gpt5_storage.csv"]
+
+
+def writeStorage(path, rows):
+    with open(path, "w") as file:
+        file.write("gpuUtilization,vramUsage,powerDraw\n")
+        for gpu, vram, power in rows:
+            file.write(f"{gpu},{vram},{power}\n")
+
+
+def assertSameFit(cached, full):
+    assert [*cached.gpuParams, *cached.vramParams] == pytest.approx([*full.gpuParams, *full.vramParams], rel=1e-6)
+    assert repr(cached.powerParams) == repr(full.powerParams)
+    assert cached[3:] == full[3:]
+
+
+@pytest.mark.parametrize("fixture", FIXTURES)
+def test_cached_fit_matches_full_refit(fixture):
+    storageFile = os.path.join(baseDir, fixture)
+    cache = FitCache()
+    for probe in [(0.3, 0.7, 250.0), (0.8, 0.85, 4000.0), (0.12, 0.4, 1449.0)]:
+        assertSameFit(cache.verify("m", storageFile, *probe), statsVerify(storageFile, *probe))
+
+
+@pytest.mark.parametrize("fixture", ["a_storage.csv", "b_storage.csv"])
+def test_incremental_updates_match_full_refit(fixture, tmp_path):
+    rng = random.Random(0)
+    storageFile = str(tmp_path / fixture)
+    rows = [tuple(row) for row in dataBufferRead(os.path.join(baseDir, fixture))]
+    writeStorage(storageFile, rows)
+
+    cache = FitCache()
+    cache.get("m", storageFile)
+    for step in range(50):
+        row = (rng.uniform(0.05, 0.95), rng.uniform(0.05, 0.95), rng.uniform(100, 5000))
+        if step % 5 == 0:
+            rows.append(row)
+            cache.append("m", *row)
+        else:
+            idx = rng.randrange(len(rows))
+            rows[idx] = row
+            cache.replace("m", idx, *row)
+        writeStorage(storageFile, rows)
+
+        probe = (rng.random(), rng.random(), rng.uniform(0, 5000))
+        assertSameFit(cache.verify("m", storageFile, *probe), statsVerify(storageFile, *probe))
+
+
+def test_unloaded_models_are_not_tracked():
+    cache = FitCache()
+    cache.append("never-verified", 0.5, 0.5, 100.0)
+    assert "never-verified" not in cache.models
+
+
+def test_verify_sees_one_fit_while_updating(tmp_path):
+    storageFile = str(tmp_path / "m_storage.csv")
+    rows = [tuple(row) for row in dataBufferRead(os.path.join(baseDir, "a_storage.csv"))]
+    writeStorage(storageFile, rows)
+    cache = FitCache()
+    model = cache.get("m", storageFile)
+    fits = [model.params]
+    cache.replace("m", 0, 0.2, 0.3, 900.0)
+    fits.append(model.params)
+    assert fits[0].gpu != fits[1].gpu and fits[0].vram != fits[1].vram
+
+    done = threading.Event()
+
+    def update():
+        for step in range(400):
+            cache.replace("m", 0, *(rows[0] if step % 2 else (0.2, 0.3, 900.0)))
+        done.set()
+
+    writer = threading.Thread(target=update)
+    writer.start()
+    while not done.is_set():
+        result = cache.verify("m", storageFile, 0.5, 0.5, 1000.0)
+        matching = [
+            fit
+            for fit in fits
+            if [*result.gpuParams, *result.vramParams] == pytest.approx([*fit.gpu, *fit.vram], rel=1e-6)
+        ]
+        assert len(matching) == 1 and result.powerParams == matching[0].power
+    writer.join()
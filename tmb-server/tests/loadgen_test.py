@@ -0,0 +1,53 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "loadgen"))
+from loadgen import load_recording, parse_trace, percentile, summarise
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "sampler"))
+from backends import Sample, parse_smidata
+
+# run pytest -v
+
+
+def test_trace_records_back_to_back_or_per_line(tmp_path):
+    prompt = '{"messages":[{"role":"user","content":"hi"}],"stream":true}'
+    report = '{"gpuUtilization":0.5,"vramUsage":0.25,"powerDraw":4000}'
+    record = {"gpuUtilization": 0.5, "vramUsage": 0.25, "powerDraw": 4000}
+    assert parse_trace(f"{prompt}\n{report}\n") == [json.loads(prompt), record]
+    # older wrappers wrote records without a separator
+    assert parse_trace(prompt + report + "{broken" + report) == [json.loads(prompt), record, record]
+
+    recording = tmp_path / "trace.txt"
+    recording.write_text(f'{prompt}\n{report}\n{{"title":"t","body":"replayed"}}\n')
+    prompts, telemetry = load_recording(str(recording))
+    assert prompts == [
+        {"messages": [{"role": "user", "content": "hi"}]},
+        {"messages": [{"role": "user", "content": "replayed"}]},
+    ]
+    assert telemetry == [record]
+    assert parse_smidata(report, 1.0) == Sample(1.0, 0.5, 0.25, 4000.0)
+
+
+def test_percentiles_and_rates():
+    assert percentile([], 50) is None
+    assert percentile([1.0, 2.0, 3.0, 4.0], 50) == 2.5
+    assert percentile([1.0, 2.0, 3.0, 4.0], 99) == pytest.approx(3.97)
+
+    attestation = {"id": 1, "startedAt": 10.0, "finishedAt": 12.0}
+    records = [
+        {"response": 0.1, "verdict": 0.2, "attestation": attestation},
+        {"response": 0.3, "verdict": 0.4, "attestation": attestation},
+        {"response_status": "error", "verdict_status": "timeout"},
+        {"response_status": "timeout", "verdict_status": "timeout"},
+    ]
+    report = summarise(records, 2.0)
+    assert report["throughput"] == 2.0
+    assert report["response"]["count"] == 2 and report["response"]["p50"] == 0.2
+    assert (report["response"]["error_rate"], report["response"]["timeout_rate"]) == (0.25, 0.25)
+    assert report["verdict"]["timeouts"] == 2
+    # both verdicts referenced the same attestation run
+    assert report["attestation"]["count"] == 1 and report["attestation"]["p99"] == 2.0
@@ -0,0 +1,68 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "verifier"))
+from pcr import DIGEST_SIZES, PCR_COUNT, PCRVerifier, _benchmark_digests, _LegacyPCRVerifier
+
+# run pytest -v
+
+
+def legacy_replay(algorithm: str, chains: dict) -> _LegacyPCRVerifier:
+    legacy = _LegacyPCRVerifier()
+    for pcr_index, digests in chains.items():
+        for digest in digests:
+            legacy.extend_pcr(pcr_index, algorithm, digest.hex())
+    return legacy
+
+
+@pytest.mark.parametrize("algorithm", sorted(DIGEST_SIZES))
+def test_extend_apis_match_the_legacy_verifier(algorithm):
+    digests = _benchmark_digests(300, DIGEST_SIZES[algorithm])
+    chains = {0: digests[:1], 10: digests[1::3], 11: digests[2::3], 23: digests[3::3]}
+    expected = legacy_replay(algorithm, chains).pcr_banks[algorithm]
+
+    extended = PCRVerifier()
+    for pcr_index, chain in chains.items():
+        for digest in chain:
+            extended.extend(pcr_index, algorithm, digest)
+    folded = PCRVerifier([algorithm])
+    for pcr_index, chain in chains.items():
+        folded.extend_many(pcr_index, algorithm, chain)
+    serial = PCRVerifier([algorithm])
+    serial.replay(algorithm, chains)
+    threaded = PCRVerifier([algorithm])
+    threaded.replay(algorithm, chains, workers=4)
+
+    for verifier in (extended, folded, serial, threaded):
+        assert verifier.get_bank(algorithm) == expected
+    # the other banks are untouched
+    other = "sha256" if algorithm == "sha1" else "sha1"
+    assert extended.get_bank(other) == PCRVerifier().get_bank(other)
+
+
+def test_set_pcr_value_resumes_a_chain():
+    digests = _benchmark_digests(10, 20)
+    expected = legacy_replay("sha1", {10: digests}).pcr_banks["sha1"][10]
+
+    first = PCRVerifier(["sha1"])
+    first.extend_many(10, "sha1", digests[:4])
+    resumed = PCRVerifier(["sha1"])
+    resumed.set_pcr_value(10, "sha1", first.get_pcr_value(10, "sha1"))
+    resumed.extend_many(10, "sha1", digests[4:])
+    assert resumed.get_pcr_value(10, "sha1") == expected
+
+
+def test_invalid_arguments():
+    with pytest.raises(ValueError):
+        PCRVerifier(["md5"])
+    verifier = PCRVerifier(["sha1"])
+    with pytest.raises(ValueError):
+        verifier.extend(0, "sha256", b"\x00" * 32)
+    with pytest.raises(IndexError):
+        verifier.extend(PCR_COUNT, "sha1", b"\x00" * 20)
+    with pytest.raises(IndexError):
+        verifier.extend_many(-1, "sha1", [])
+    with pytest.raises(ValueError):
+        verifier.set_pcr_value(0, "sha1", b"\x00" * 32)
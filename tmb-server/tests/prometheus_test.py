@@ -0,0 +1,49 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from prometheus import Registry
+
+# run pytest -v
+
+
+def test_render_text_format():
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests", ("path",))
+    requests.inc('/a"b')
+    requests.inc('/a"b', amount=2)
+    registry.gauge("queue", "Queue depth", ("model",), collect=lambda: {("a",): 3, ("b",): 0})
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        latency.observe(value)
+
+    assert registry.render().splitlines() == [
+        "# HELP requests_total Requests",
+        "# TYPE requests_total counter",
+        'requests_total{path="/a\\"b"} 3',
+        "# HELP queue Queue depth",
+        "# TYPE queue gauge",
+        'queue{model="a"} 3',
+        'queue{model="b"} 0',
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        # buckets are cumulative and inclusive of their upper bound
+        'latency_seconds_bucket{le="0.1"} 2',
+        'latency_seconds_bucket{le="1.0"} 3',
+        'latency_seconds_bucket{le="+Inf"} 4',
+        "latency_seconds_sum 2.65",
+        "latency_seconds_count 4",
+    ]
+
+
+def test_timer_observes_failures_and_labels_are_checked():
+    registry = Registry()
+    stages = registry.histogram("stage_seconds", "Stage", ("stage",))
+    with pytest.raises(RuntimeError):
+        with stages.time("fit"):
+            raise RuntimeError
+    assert 'stage_seconds_count{stage="fit"} 1' in registry.render()
+    with pytest.raises(ValueError):
+        stages.observe(1.0)
@@ -0,0 +1,87 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "benchmarks"))
+import fixtures
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "verifier"))
+from event_log import iter_ima_records
+from full_verify import VerificationError, replay_measurements
+
+# run pytest -v
+
+BOOT_PCRS = [b"\x00" * 20] * 10
+
+
+def quote(ima: fixtures.ImaLog) -> list:
+    return BOOT_PCRS + [ima.pcrs[i] for i in (10, 11, 12)]
+
+
+def first_run(records: int = 200) -> dict:
+    """Checkpoint of a verified log as the verify cache stores it, through JSON."""
+    ima = fixtures.ima_log(records)
+    _, checkpoint, _ = replay_measurements(ima.data, quote(ima))
+    return json.loads(json.dumps(checkpoint))
+
+
+def test_resume_matches_full_replay(capsys):
+    checkpoint = first_run()
+    # the same generator with more records, i.e. the log grew since the checkpoint
+    grown = fixtures.ima_log(500)
+    assert grown.data.startswith(fixtures.ima_log(200).data)
+
+    full = replay_measurements(grown.data, quote(grown))
+    assert "Resuming" not in capsys.readouterr().out
+    resumed = replay_measurements(grown.data, quote(grown), checkpoint)
+    assert "Resuming measurement log after record 200" in capsys.readouterr().out
+    assert resumed == full
+    assert resumed[1]["count"] == 500 and resumed[1]["offset"] == len(grown.data)
+
+
+def test_changed_prefix_falls_back_to_full_replay(capsys):
+    checkpoint = first_run()
+    grown = fixtures.ima_log(500)
+    # a byte of the first record's template data, inside the checkpointed prefix
+    tampered = grown.data[:60] + bytes([grown.data[60] ^ 1]) + grown.data[61:]
+    with pytest.raises(VerificationError, match="measurement record 0"):
+        replay_measurements(tampered, quote(grown), checkpoint)
+    assert "replaying in full" in capsys.readouterr().out
+
+
+def test_log_fully_matched_at_the_checkpoint(capsys):
+    checkpoint = first_run()
+    # records appended after the quote was taken are not replayed
+    latest_file_hashes, next_checkpoint, matched_at = replay_measurements(
+        fixtures.ima_log(500).data, quote(fixtures.ima_log(200)), checkpoint
+    )
+    assert "Resuming" in capsys.readouterr().out
+    assert next_checkpoint is checkpoint
+    assert matched_at == {10: 199, 11: 199, 12: 199}
+    assert {name.hex(): value.hex() for name, value in latest_file_hashes.items()} == checkpoint["file_hashes"]
+
+
+def test_matched_at_and_early_exit():
+    ima = fixtures.ima_log(200)
+    last = {}
+    for index, record in enumerate(iter_ima_records(ima.data)):
+        last[record.pcr_index] = index
+    assert len(set(last.values())) == 3
+
+    # neither valid records past the match point nor garbage that would not parse are read
+    for tail in (fixtures.ima_log(300).data[len(ima.data) :], b"\xff" * 10):
+        _, checkpoint, matched_at = replay_measurements(ima.data + tail, quote(ima))
+        assert matched_at == last
+        assert checkpoint["offset"] == len(ima.data) and checkpoint["count"] == 200
+
+
+def test_pcr_without_records_matches_before_the_first():
+    records = [fixtures.ima_ng_record(10, b"/usr/bin/a%d" % i, b"sha1", bytes([i]) * 20) for i in range(3)]
+    pcr10 = fixtures.SHA1_ZERO
+    for record in records:
+        pcr10 = fixtures.extend(pcr10, record[4:24])
+    expected = BOOT_PCRS + [pcr10, fixtures.SHA1_ZERO, fixtures.SHA1_ZERO]
+    _, _, matched_at = replay_measurements(b"".join(records), expected)
+    assert matched_at == {10: 2, 11: -1, 12: -1}
@@ -0,0 +1,81 @@
+import os
+import random
+import shutil
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import reservoir as reservoirModule
+from reservoir import ROW_WIDTH, Reservoir, ReservoirStore
+from stats_verify import dataBufferRead
+
+# run pytest -v
+baseDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_legacy_csv_is_migrated_without_losing_rows(tmp_path):
+    storageFile = str(tmp_path / "gpt5_storage.csv")
+    shutil.copy(os.path.join(baseDir, "gpt5_storage.csv"), storageFile)
+    legacyRows = dataBufferRead(storageFile)
+
+    reservoir = Reservoir(storageFile, capacity=10)
+    assert reservoir.capacity == len(legacyRows)
+    assert len(reservoir) == reservoir.seen == len(legacyRows)
+    # the fixed-width file still reads the same through the stats_verify parser
+    assert dataBufferRead(storageFile) == legacyRows
+    with open(storageFile, "rb") as file:
+        assert all(len(line) == ROW_WIDTH for line in file.readlines()[1:])
+
+
+def test_rows_and_seen_count_survive_restart(tmp_path):
+    store = ReservoirStore(str(tmp_path), capacity=4)
+    for i in range(20):
+        store.get("m").add(i / 20, 1 - i / 20, 100.0 * i)
+    before = store.get("m")
+
+    reopened = ReservoirStore(str(tmp_path), capacity=4).get("m")
+    assert reopened.rows() == before.rows()
+    assert reopened.seen == 20
+    assert len(reopened) == 4
+
+
+def test_each_add_syncs_once(tmp_path, monkeypatch):
+    synced = []
+    monkeypatch.setattr(reservoirModule, "_fdatasync", lambda fd: synced.append(os.fstat(fd).st_ino))
+    reservoir = Reservoir(str(tmp_path / "m_storage.csv"), capacity=2, rng=random.Random(1))
+    synced.clear()
+
+    actions = [reservoir.add(0.1 * i, 0.2, 300.0 + i)[0] for i in range(6)]
+    # a kept sample syncs its row, a skipped one the count
+    rowFile, seenFile = os.stat(reservoir.filePath).st_ino, os.stat(reservoir.seenPath).st_ino
+    assert synced == [rowFile if action != "skip" else seenFile for action in actions]
+    assert "skip" in actions
+
+    reopened = Reservoir(reservoir.filePath, capacity=2)
+    assert reopened.rows() == reservoir.rows()
+    assert reopened.seen == 6
+
+
+def test_torn_final_row_is_dropped(tmp_path):
+    reservoir = Reservoir(str(tmp_path / "m_storage.csv"), capacity=4)
+    for i in range(3):
+        reservoir.add(0.1 * i, 0.2, 300.0)
+    with open(reservoir.filePath, "ab") as file:
+        file.write(b"0.55")
+
+    reopened = Reservoir(reservoir.filePath, capacity=4)
+    assert reopened.rows() == reservoir.rows()[:3]
+
+
+def test_algorithm_r_keeps_each_sample_with_probability_k_over_n(tmp_path):
+    capacity, stream, trials = 5, 20, 400
+    kept = [0] * stream
+    for trial in range(trials):
+        reservoir = Reservoir(str(tmp_path / f"{trial}_storage.csv"), capacity, rng=random.Random(trial))
+        for i in range(stream):
+            reservoir.add(float(i), 0.0, 0.0)
+        for row in reservoir.rows():
+            kept[int(row.gpuUtilization)] += 1
+
+    # every sample should survive capacity / stream = 25% of the time
+    for count in kept:
+        assert abs(count / trials - capacity / stream) < 0.08
@@ -0,0 +1,94 @@
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "llm-server"))
+import response_cache as cacheModule
+import server
+from response_cache import ResponseCache, cache_key
+from utils import InternalRequest
+
+# run pytest -v
+
+VERIFIED = {"Verified": True, "Attestation": None}
+
+
+def body(**fields) -> str:
+    return json.dumps({"messages": [{"role": "user", "content": "hi"}], **fields})
+
+
+def test_cache_key_ignores_fields_that_dont_change_the_completion():
+    key = cache_key("a", body())
+    assert cache_key("a", body(stream=True, cache_prompt=False, user="someone")) == key
+    # role and content are normalised
+    assert cache_key("a", json.dumps({"messages": [{"role": " User", "content": "hi\r\n"}]})) == key
+    assert cache_key("a", body(temperature=0.2)) != key
+    assert cache_key("b", body()) != key
+    assert cache_key("a", "not json") is None
+
+
+def test_lru_eviction_under_byte_cap():
+    cache = ResponseCache(max_bytes=10, ttl=60)
+    assert cache.put("a", b"aaaa", "ua", VERIFIED)
+    assert cache.put("b", b"bbbb", "ub", VERIFIED)
+    # a is now the most recently used
+    assert cache.get("a").body == b"aaaa"
+    assert cache.put("c", b"cccc", "uc", VERIFIED)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.bytes == 8
+    # larger than the whole cache
+    assert not cache.put("d", b"d" * 11, "ud", VERIFIED)
+
+
+def test_ttl_expiry(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(cacheModule.time, "monotonic", lambda: now[0])
+    cache = ResponseCache(max_bytes=100, ttl=10)
+    cache.put("a", b"body", "ua", VERIFIED)
+    now[0] = 109.0
+    assert cache.get("a") is not None
+    now[0] = 111.0
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+    assert cache.bytes == 0
+
+
+def test_counters():
+    cache = ResponseCache(max_bytes=8, ttl=60)
+    cache.get(None)
+    cache.bypass()
+    cache.get("a")
+    cache.put("a", b"aaaa", "ua", VERIFIED)
+    cache.get("a")
+    cache.put("b", b"bbbb", "ub", VERIFIED)
+    cache.put("c", b"cccc", "uc", VERIFIED)
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["bypassed"]) == (1, 1, 2)
+    assert (stats["stores"], stats["evictions"], stats["entries"]) == (3, 1, 2)
+    assert stats["hit_rate"] == 0.5
+
+
+@pytest.mark.parametrize("verified", [False, None])
+def test_rejected_verdict_is_never_stored(verified, monkeypatch):
+    cache = ResponseCache(max_bytes=100, ttl=60)
+    verdict = {"Verified": verified, "Attestation": None}
+    assert not cache.put("a", b"body", "ua", verdict)
+    assert cache.get("a") is None
+
+    # what the tmb server answers for the run, rejected or grace period first
+    answers = [verdict, VERIFIED]
+
+    async def get_verdict(userID, model):
+        return answers.pop(0)
+
+    monkeypatch.setattr(server, "get_verdict_async", get_verdict)
+    data = InternalRequest(original=body(), uuid="u1", model="a")
+    asyncio.run(server.cache_response(cache, "k", data, b"body"))
+    assert cache.stats()["stores"] == 0
+
+    asyncio.run(server.cache_response(cache, "k", data, b"body"))
+    assert cache.get("k").verdict == VERIFIED
@@ -0,0 +1,70 @@
+import os
+import random
+import statistics
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from running_stats import RunningStats, SessionMetrics, TimeWeighted
+
+# run pytest -v
+
+
+def test_running_stats_match_batch_statistics():
+    rng = random.Random(0)
+    samples = [rng.uniform(100, 5000) for _ in range(1000)]
+    stats = RunningStats()
+    for sample in samples:
+        stats.add(sample)
+
+    assert stats.count == len(samples)
+    assert stats.mean == pytest.approx(statistics.fmean(samples), rel=1e-12)
+    assert stats.variance == pytest.approx(statistics.variance(samples), rel=1e-9)
+    assert (stats.min, stats.max) == (min(samples), max(samples))
+
+
+def test_session_metrics_keep_first_model():
+    metrics = SessionMetrics()
+    metrics.add("a", 0.5, 0.6, 300.0)
+    metrics.add("b", 0.7, 0.8, 500.0)
+    assert metrics.model == "a"
+    assert metrics.count == 2
+    assert metrics.powerDraw.mean == 400.0
+    assert metrics.summary()["gpuUtilization"]["max"] == 0.7
+
+
+def test_time_weighted_integrates_over_the_window():
+    # flat at 1000 mW, then ramps, sampled unevenly and past both ends of the window
+    metric = TimeWeighted()
+    metric.start, metric.end = 0.5, 2.0
+    for t, x in [(0.0, 1000.0), (0.9, 1000.0), (1.0, 1000.0), (1.5, 2000.0), (2.5, 3000.0)]:
+        metric.add(t, x)
+    # 0.5 s at 1000, 1000 -> 2000 over 0.5 s, 2000 -> 2500 (interpolated at the end) over 0.5 s
+    assert metric.integral() == pytest.approx(500 + 750 + 1125)
+    assert metric.duration == 1.5
+    assert metric.mean == pytest.approx(2375 / 1.5)
+
+
+def test_time_weighted_holds_a_single_sample():
+    metric = TimeWeighted()
+    metric.start, metric.end = 10.0, 10.02
+    metric.add(9.99, 4000.0)
+    assert metric.integral() == pytest.approx(80.0)
+    assert metric.mean == pytest.approx(4000.0)
+
+
+def test_session_metrics_energy_and_weighted_averages():
+    metrics = SessionMetrics()
+    metrics.setWindow(0.0, 4.0)
+    # a short spike sampled three times would dominate an unweighted mean
+    for t, p in [(0.0, 1000.0), (3.0, 1000.0), (3.01, 9000.0), (3.02, 1000.0)]:
+        metrics.add("a", 0.5, 0.5, p, timestamp=t)
+    assert metrics.powerDraw.mean == 3000.0
+    gpu, vram, power = metrics.averages()
+    assert power == pytest.approx(1020.0)
+    assert metrics.energy == pytest.approx(4.08)
+
+    untimed = SessionMetrics()
+    untimed.add("a", 0.5, 0.5, 1000.0)
+    assert untimed.averages() == (0.5, 0.5, 1000.0)
@@ -0,0 +1,90 @@
+import os
+import sys
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "sampler"))
+import sampler as samplerModule
+from backends import CommandBackend, ReplayBackend, Sample, TegrastatsBackend, parse_nvidia_smi, parse_tegrastats
+
+# run pytest -v
+
+TEGRASTATS = (
+    "11-09-2025 00:00:29 RAM 3058/7620MB (lfb 37x4MB) CPU [somestuff] GR3D_FREQ 12% cpu soc soc gpu tj soc "
+    "VDD_IN 5080mW/5080mW VDD_CPU 603mW/603mW VDD_SOC 1449mW/1449mW\n"
+)
+
+
+def test_parsers_produce_smidata_units():
+    sample = parse_tegrastats(TEGRASTATS, 1.0)
+    assert sample == Sample(1.0, 0.12, 3058 / 7620, 1449.0)
+    assert parse_nvidia_smi("57, 3058, 7620, 61.25\n", 2.0) == Sample(2.0, 0.57, 3058 / 7620, 61250.0)
+    assert parse_tegrastats("RAM 3058/7620MB\n", 0) is None
+    assert parse_nvidia_smi("[N/A], 1, 2, 3\n", 0) is None
+
+
+def test_window_keeps_rows_of_the_interval():
+    sampler = samplerModule.Sampler(None, capacity=4)
+    sampler.samples.extend(Sample(t, 0.1 * t, 0.5, 1000.0) for t in range(6))
+    # oldest rows fell out of the ring buffer
+    assert [sample.timestamp for sample in sampler.window(0, 10)] == [2, 3, 4, 5]
+    # one row on either side of the window to interpolate its edges from
+    assert [sample.timestamp for sample in sampler.window(3.5, 3.7)] == [3, 4]
+    assert [sample.timestamp for sample in sampler.window(3, 4)] == [2, 3, 4, 5]
+    # nothing sampled in a very short window, the latest row stands in
+    assert [sample.timestamp for sample in sampler.window(5.1, 5.2)] == [5]
+
+
+def test_windows_are_sent_to_tmb(tmp_path, monkeypatch):
+    replay = tmp_path / "tegrastats.log"
+    replay.write_text(TEGRASTATS * 3)
+    sampler = samplerModule.Sampler(ReplayBackend(0.01, str(replay)), capacity=64)
+    monkeypatch.setattr(samplerModule.app.state, "sampler", sampler)
+
+    sent = []
+
+    async def send(userID, model, samples, finished=False, start=None, end=None):
+        sent.append((userID, model, samples, finished))
+        assert start < end
+        return {"finished": {userID: {"Verification Result": None}}}
+
+    monkeypatch.setattr(samplerModule, "send_metrics_batch_async", send)
+    with TestClient(samplerModule.app) as client:
+        assert client.post("/sessions/start", json={"userID": "u1", "model": "a"}).status_code == 200
+        time.sleep(0.1)
+        response = client.post("/sessions/finish", json={"userID": "u1"})
+        assert response.json() == {"finished": {"u1": {"Verification Result": None}}}
+        assert client.post("/sessions/finish", json={"userID": "u1"}).status_code == 400
+
+    (userID, model, samples, finished), = sent
+    assert (userID, model, finished) == ("u1", "a", True)
+    assert len(samples) >= 2
+    assert all(sample.powerDraw == 1449.0 for sample in samples)
+
+
+def test_command_backends_must_name_their_command():
+    class Unnamed(CommandBackend):
+        parse = staticmethod(parse_tegrastats)
+
+    with pytest.raises(TypeError):
+        Unnamed(0.05)
+    assert TegrastatsBackend(0.05).command() == ["tegrastats", "--interval", "50"]
+
+
+def test_unfinished_windows_expire(monkeypatch):
+    monkeypatch.setattr(samplerModule.app.state, "windows", {})
+    monkeypatch.setattr(samplerModule.app.state, "windows_expired", 0)
+    monkeypatch.setattr(samplerModule, "window_ttl", 10)
+    now = time.monotonic()
+    samplerModule.app.state.windows.update({"lost": ("a", now - 11), "running": ("a", now - 5)})
+    assert samplerModule.expire_windows(now) == 1
+    assert list(samplerModule.app.state.windows) == ["running"]
+
+    # opening a window sweeps the stale ones, as finishing one does
+    samplerModule.app.state.windows["lost"] = ("a", now - 11)
+    with TestClient(samplerModule.app) as client:
+        assert client.post("/sessions/start", json={"userID": "u2", "model": "a"}).status_code == 200
+        assert "lost" not in samplerModule.app.state.windows
+        assert client.get("/status").json()["windows_expired"] == 2
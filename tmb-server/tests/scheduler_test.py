@@ -0,0 +1,154 @@
+import asyncio
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "llm-server"))
+import server
+from scheduler import BackendPool, Saturated
+from utils import InternalRequest
+
+# run pytest -v
+
+URLS = ["http://r1", "http://r2"]
+
+
+def make_pool(**options) -> BackendPool:
+    return BackendPool({"a": URLS}, default=["http://default"], **options)
+
+
+def test_least_outstanding_spreads_requests():
+    async def run():
+        pool = make_pool(max_outstanding=2)
+        picked = [await pool.acquire("a") for _ in range(4)]
+        assert [backend.url for backend in picked] == ["http://r1", "http://r2", "http://r1", "http://r2"]
+        # models without replicas of their own use the default
+        assert (await pool.acquire("b")).url == "http://default"
+
+    asyncio.run(run())
+
+
+def test_ewma_prefers_the_faster_replica():
+    async def run():
+        pool = make_pool(policy="ewma", max_outstanding=4)
+        r1, r2 = pool.pool("a").backends
+        r1.ewma = 0.5
+        # untried replicas are tried first, however fast the others are
+        assert (await pool.acquire("a")) is r2
+        r2.outstanding, r1.ewma, r2.ewma = 0, 1.0, 0.1
+        # r2 stays cheaper until its queue outweighs its speed: 0.1 * 4 < 1.0 * 1
+        assert [(await pool.acquire("a")) for _ in range(4)] == [r2] * 4
+        # saturated at max_outstanding, the slower replica takes the rest
+        assert (await pool.acquire("a")) is r1
+
+    asyncio.run(run())
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        make_pool(policy="random")
+
+
+def test_saturated_replicas_queue_until_released():
+    async def run():
+        pool = make_pool(max_outstanding=1, queue_timeout=1)
+        busy = [await pool.acquire("a") for _ in URLS]
+        assert all(backend.outstanding == 1 for backend in busy)
+
+        waiter = asyncio.create_task(pool.acquire("a"))
+        await asyncio.sleep(0.01)
+        assert not waiter.done() and pool.pool("a").waiting == 1
+        await pool.release(busy[1], started=0.0)
+        assert (await waiter) is busy[1]
+        assert pool.pool("a").waiting == 0
+
+    asyncio.run(run())
+
+
+def test_queue_timeout_raises_saturated():
+    async def run():
+        pool = make_pool(max_outstanding=1, queue_timeout=0.05)
+        for _ in URLS:
+            await pool.acquire("a")
+        with pytest.raises(Saturated):
+            await pool.acquire("a")
+        assert pool.pool("a").rejected == 1 and pool.pool("a").waiting == 0
+
+    asyncio.run(run())
+
+
+def test_full_queue_refuses_at_once():
+    async def run():
+        pool = make_pool(max_outstanding=1, max_queue=2, queue_timeout=5)
+        for _ in URLS:
+            await pool.acquire("a")
+        waiters = [asyncio.create_task(pool.acquire("a")) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        with pytest.raises(Saturated):
+            await asyncio.wait_for(pool.acquire("a"), 0.5)
+        assert pool.pool("a").rejected == 1
+        for waiter in waiters:
+            waiter.cancel()
+
+    asyncio.run(run())
+
+
+def test_release_updates_ewma_and_errors():
+    async def run():
+        pool = BackendPool({"a": ["http://r1"]}, default=[], ewma_alpha=0.5)
+        backend = await pool.acquire("a")
+        await pool.release(backend, started=time.monotonic() - 2.0, ok=True)
+        assert backend.ewma == pytest.approx(2.0, abs=0.05) and backend.outstanding == 0
+
+        backend = await pool.acquire("a")
+        await pool.release(backend, started=time.monotonic() - 4.0, ok=False)
+        assert backend.ewma == pytest.approx(0.5 * 4.0 + 0.5 * 2.0, abs=0.05)
+        assert (backend.served, backend.errors) == (2, 1)
+        assert pool.stats()["a"]["backends"][0]["errors"] == 1
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("disconnect", [False, True])
+def test_streamed_request_releases_its_replica_once(disconnect, monkeypatch):
+    async def chunks(data, url):
+        yield b"data: 1\n\n"
+        yield b"data: [DONE]\n\n"
+
+    monkeypatch.setattr(server, "send_internal_request_stream_async", chunks)
+
+    async def run():
+        pool = BackendPool({"a": ["http://r1"]}, default=[], max_outstanding=1)
+        request = SimpleNamespace(app=SimpleNamespace(state=SimpleNamespace(response_mode="normal", backends=pool, response_cache=None)))
+        data = InternalRequest(original='{"stream": true}', uuid="u1", model="a")
+        # server.submit is the /mode handler, both are named submit
+        submit = next(route.endpoint for route in server.app.routes if getattr(route, "path", None) == "/submit_prompt")
+        response = await submit(data, request, None)
+        assert pool.stats()["a"]["backends"][0]["outstanding"] == 1
+
+        sent = []
+        started = asyncio.Event()
+
+        async def send(message):
+            sent.append(message)
+            if disconnect:
+                # the client is gone before the headers are out, the body is never iterated
+                started.set()
+                await asyncio.Event().wait()
+
+        async def receive():
+            if disconnect:
+                await started.wait()
+                return {"type": "http.disconnect"}
+            await asyncio.Event().wait()
+
+        await response({"type": "http", "asgi": {"spec_version": "2.3"}}, receive, send)
+        backend = pool.stats()["a"]["backends"][0]
+        assert backend["outstanding"] == 0 and backend["served"] == 1
+        assert backend["errors"] == (1 if disconnect else 0)
+        assert len(sent) == (1 if disconnect else 4)
+
+    asyncio.run(run())
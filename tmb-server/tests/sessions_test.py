@@ -0,0 +1,109 @@
+import os
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import tmb as tmbModule
+from reservoir import ReservoirStore
+from sessions import InvalidTransition, SessionManager, SessionState
+
+# run pytest -v
+
+
+def test_state_machine_only_moves_forward():
+    sessions = SessionManager(shards=4)
+    session = sessions.getOrCreate("user", SessionState.WAITING)
+    assert sessions.transition(session, SessionState.WAITING, to=SessionState.COLLECTING)
+    # a second /finished sees VERIFYING and backs off instead of re-running
+    assert sessions.transition(session, SessionState.COLLECTING, to=SessionState.VERIFYING)
+    assert not sessions.transition(session, SessionState.COLLECTING, to=SessionState.VERIFYING)
+    with pytest.raises(InvalidTransition):
+        sessions.transition(session, to=SessionState.COLLECTING)
+    assert sessions.transition(session, to=SessionState.DONE)
+    assert session.event.is_set()
+
+
+def test_idle_sessions_expire_after_ttl():
+    sessions = SessionManager(shards=4, ttl=10)
+    for i in range(100):
+        sessions.getOrCreate(f"user-{i}", SessionState.COLLECTING)
+    fresh = sessions.getOrCreate("fresh", SessionState.COLLECTING)
+    fresh.touched += 20
+
+    assert sessions.expire(now=fresh.touched - 5) == 100
+    assert len(sessions) == 1
+    assert sessions.expired == 100
+
+
+def test_remove_keeps_newer_session_with_same_id():
+    sessions = SessionManager(shards=4)
+    old = sessions.getOrCreate("user", SessionState.COLLECTING)
+    sessions.remove(old)
+    new = sessions.getOrCreate("user", SessionState.COLLECTING)
+    sessions.remove(old)
+    assert sessions.get("user") is new
+
+
+def test_verdict_waits_for_late_client(tmp_path, monkeypatch):
+    monkeypatch.setattr(tmbModule, "reservoirStore", ReservoirStore(str(tmp_path), 10))
+    monkeypatch.setattr(tmbModule, "sessions", SessionManager())
+    client = TestClient(tmbModule.tmb)
+    smiData = {
+        "gpuUtilization": 0.5,
+        "vramUsage": 0.6,
+        "powerDraw": 250.0,
+        "uuid": {"userID": "late_user", "model": "test"},
+    }
+
+    assert client.post("/metrics", json=smiData).status_code == 200
+    assert client.post("/finished", json={"userID": "late_user"}).status_code == 200
+    # duplicate /finished and stray samples do not touch the finished session
+    assert client.post("/finished", json={"userID": "late_user"}).status_code == 409
+    assert client.post("/metrics", json=smiData).json() == {"message": "Session Already Finished"}
+
+    response = client.post("/clientRequest", json={"userID": "late_user", "model": "test"})
+    assert response.status_code == 200
+    assert tmbModule.sessions.get("late_user") is None
+
+    # the verdict store still answers other subscribers after the session is gone
+    response = client.post("/clientRequest", params={"timeout": 1}, json={"userID": "late_user", "model": "test"})
+    assert response.json() == {"Verified": None, "Attestation": None}
+    with client.stream("GET", "/verdict/late_user") as stream:
+        assert "event: verdict" in stream.read().decode()
+
+
+def test_cached_verdict_releases_waiter(monkeypatch):
+    monkeypatch.setattr(tmbModule, "sessions", SessionManager())
+    client = TestClient(tmbModule.tmb)
+
+    response = client.post("/cachedVerdict", json={"userID": "repeat", "originalID": "first", "verified": True})
+    assert response.status_code == 200
+    response = client.post("/clientRequest", json={"userID": "repeat", "model": "a"})
+    assert response.json() == {"Verified": True, "Attestation": None}
+
+    # a request that is really running keeps its own verdict
+    tmbModule.sessions.getOrCreate("live", SessionState.COLLECTING)
+    response = client.post("/cachedVerdict", json={"userID": "live", "originalID": "first", "verified": True})
+    assert response.status_code == 409
+
+
+def test_stream_times_out_without_verdict(monkeypatch):
+    monkeypatch.setattr(tmbModule, "sessions", SessionManager())
+    client = TestClient(tmbModule.tmb)
+    with client.stream("GET", "/verdict/nobody", params={"timeout": 0.2}) as stream:
+        assert stream.read().decode() == "event: timeout\ndata: {}\n\n"
+    assert tmbModule.sessions.get("nobody") is None
+
+
+def test_new_session_clears_reused_verdict():
+    sessions = SessionManager(shards=4)
+    session = sessions.getOrCreate("reused", SessionState.COLLECTING)
+    session.verification = True
+    sessions.transition(session, to=SessionState.DONE)
+    assert sessions.verdict("reused") == {"Verified": True, "Attestation": None}
+
+    sessions.remove(session)
+    sessions.getOrCreate("reused", SessionState.COLLECTING)
+    assert sessions.verdict("reused") is None
@@ -0,0 +1,108 @@
+import csv
+import json
+import math
+import os
+import re
+import shlex
+import subprocess
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from stats_verify import _psi, _psi1, statsVerify
+
+# run pytest -v
+baseDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = ["a_storage.csv", "b_storage.csv", "gpt5_storage.csv"]
+
+
+@pytest.fixture(scope="module")
+def cExecutable(tmp_path_factory):
+    """Build the reference stats_verify binary once, skip when GSL is not installed."""
+    try:
+        flags = shlex.split(
+            subprocess.check_output(["pkg-config", "--cflags", "--libs", "gsl"], text=True, stderr=subprocess.DEVNULL)
+        )
+    except (OSError, subprocess.CalledProcessError):
+        pytest.skip("GSL not available for the reference binary")
+
+    executable = str(tmp_path_factory.mktemp("stats_verify") / "stats_verify")
+    sources = ["stats_verify.c", "utils.c", "gpu-utilization/utils.c", "powerdraw/utils.c", "vram/utils.c"]
+    subprocess.run(
+        ["gcc", *[os.path.join(baseDir, source) for source in sources], "-o", executable, *flags, "-lm"],
+        check=True,
+    )
+    return executable
+
+
+def probes(storageFile):
+    """Every stored row plus a spread of values in and around the fitted ranges."""
+    with open(storageFile) as file:
+        rows = [
+            (float(row["gpuUtilization"]), float(row["vramUsage"]), float(row["powerDraw"]))
+            for row in csv.DictReader(file)
+        ]
+    spread = [(i / 10, 1 - i / 10, i * 500.0) for i in range(11)]
+    return rows + spread
+
+
+@pytest.mark.parametrize("fixture", FIXTURES)
+def test_parity_with_c_binary(cExecutable, fixture):
+    storageFile = os.path.join(baseDir, fixture)
+    for gpu, vram, power in probes(storageFile):
+        stdout = subprocess.run(
+            [cExecutable, storageFile, str(gpu), str(vram), str(power)],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        expected = [verdict == "ACCEPTED" for verdict in re.findall(r"→ (ACCEPTED|REJECTED)", stdout)]
+        alphaBetas = [float(value) for value in re.findall(r"= (-?nan|-?\d+\.\d+)", stdout)[:4]]
+
+        result = statsVerify(storageFile, gpu, vram, power)
+        assert [result.gpuAccepted, result.vramAccepted, result.powerAccepted] == expected
+        assert result.verified == bool(int(stdout[-1]))
+        assert [*result.gpuParams, *result.vramParams] == pytest.approx(alphaBetas, rel=1e-6, abs=1e-6, nan_ok=True)
+
+
+def test_snapshot_of_recorded_values():
+    """
+    Regression snapshot of the parameters and verdicts for the fixtures and
+    their probes, recorded in stats_verify_snapshot.json. They were printed by
+    stats_verify.c built against a scipy-based stand-in for the three GSL
+    special functions (lngamma, psi, psi_1), not against GSL, so they only pin
+    the port to its current output; test_parity_with_c_binary is the check
+    against the real binary. null is NaN.
+    """
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "stats_verify_snapshot.json")) as file:
+        snapshot = json.load(file)
+    assert sorted(snapshot) == sorted(FIXTURES)
+
+    def nan(values):
+        return [math.nan if value is None else value for value in values]
+
+    for fixture, expected in snapshot.items():
+        storageFile = os.path.join(baseDir, fixture)
+        for gpu, vram, power, gpuAccepted, vramAccepted, powerAccepted, verified in expected["probes"]:
+            result = statsVerify(storageFile, gpu, vram, power)
+            assert (result.gpuAccepted, result.vramAccepted, result.powerAccepted, result.verified) == (
+                bool(gpuAccepted), bool(vramAccepted), bool(powerAccepted), bool(verified)
+            ), (fixture, gpu, vram, power)
+        assert list(result.gpuParams) == pytest.approx(nan(expected["params"]["gpu"]), rel=1e-9, nan_ok=True)
+        assert list(result.vramParams) == pytest.approx(nan(expected["params"]["vram"]), rel=1e-9, nan_ok=True)
+        assert list(result.powerParams) == pytest.approx(nan(expected["params"]["power"]), rel=1e-9, nan_ok=True)
+
+
+def test_special_functions_match_gsl():
+    """Digamma and trigamma stand in for gsl_sf_psi and gsl_sf_psi_1."""
+    eulerGamma = 0.5772156649015329
+    assert _psi(1.0) == pytest.approx(-eulerGamma, rel=1e-14)
+    assert _psi(0.5) == pytest.approx(-eulerGamma - 2 * math.log(2), rel=1e-14)
+    assert _psi1(1.0) == pytest.approx(math.pi**2 / 6, rel=1e-14)
+    assert _psi1(0.5) == pytest.approx(math.pi**2 / 2, rel=1e-14)
+    # recurrence psi(x + 1) = psi(x) + 1 / x across the asymptotic switch point
+    for x in (0.5, 3.7, 9.5, 42.0):
+        assert _psi(x + 1) == pytest.approx(_psi(x) + 1 / x, rel=1e-13)
+        assert _psi1(x + 1) == pytest.approx(_psi1(x) - 1 / (x * x), rel=1e-13)
+
@@ -54,4 +54,51 @@ async def test_client_request_success():
         assert res_incoming.status_code == 200
 
     res_client = await client_task
-    assert res_client.status_code == 200
\ No newline at end of file
+    assert res_client.status_code == 200
+
+def test_metrics_batch_ingests_and_finishes(tmp_path, monkeypatch):
+    import tmb as tmbModule
+    from reservoir import ReservoirStore
+
+    monkeypatch.setattr(tmbModule, "reservoirStore", ReservoirStore(str(tmp_path), 10))
+    samples = [
+        {
+            "gpuUtilization": 0.1 * i,
+            "vramUsage": 0.5,
+            "powerDraw": 200.0 + i,
+            "uuid": {"userID": userID, "model": "batch"},
+        }
+        for userID in ("batch_a", "batch_b")
+        for i in range(1, 4)
+    ]
+
+    response = client.post("/metrics/batch", json={"samples": samples, "finished": True})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["accepted"] == 6
+    assert set(body["finished"]) == {"batch_a", "batch_b"}
+    assert tmbModule.sessions.get("batch_a").metrics.powerDraw.mean == 202.0
+
+    # the finished sessions reject further samples
+    response = client.post("/metrics/batch", json={"samples": samples[:1]})
+    assert response.json()["ignored"] == 1
+
+def test_stats_exposes_stage_timings(tmp_path, monkeypatch):
+    import tmb as tmbModule
+    from reservoir import ReservoirStore
+
+    monkeypatch.setattr(tmbModule, "reservoirStore", ReservoirStore(str(tmp_path), 10))
+    samples = [
+        {"gpuUtilization": 0.5, "vramUsage": 0.5, "powerDraw": 200.0, "uuid": {"userID": "stats_user", "model": "stats"}}
+    ]
+    client.post("/metrics/batch", json={"samples": samples, "finished": True})
+
+    response = client.get("/stats")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    lines = response.text.splitlines()
+    assert "# TYPE tmb_stage_seconds histogram" in lines
+    for stage in ("collect", "averages", "reservoir", "finish"):
+        assert any(line.startswith(f'tmb_stage_seconds_count{{stage="{stage}"}} ') for line in lines)
+    assert 'tmb_reservoir_rows{model="stats"} 1' in lines
+    assert any(line.startswith('tmb_finished_total{outcome="grace"} ') for line in lines)
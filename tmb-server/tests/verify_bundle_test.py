@@ -0,0 +1,111 @@
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "benchmarks"))
+import fixtures
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "verifier"))
+from audit_log import AuditLogError
+from event_log import iter_ima_records
+from full_verify import VerificationError, replay_measurements, verify_bundle
+
+# run pytest -v
+
+BUNDLE = fixtures.bundle(300, boot_events=40, audit_lines=50)
+
+
+def replace_member(bundle: bytes, name: str, data: bytes) -> bytes:
+    archive = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(bundle)) as source, zipfile.ZipFile(archive, "w") as target:
+        for member in source.namelist():
+            target.writestr(member, data if member == name else source.read(member))
+    return archive.getvalue()
+
+
+def member(name: str) -> bytes:
+    with zipfile.ZipFile(io.BytesIO(BUNDLE)) as zf:
+        return zf.read(name)
+
+
+def verify(source, **options) -> dict:
+    with contextlib.redirect_stdout(io.StringIO()):
+        return verify_bundle(source, cache_path=None, **options)
+
+
+def test_path_bytes_and_zipfile_sources(tmp_path):
+    path = tmp_path / "signature.zip"
+    path.write_bytes(BUNDLE)
+    results = [verify(str(path)), verify(BUNDLE), verify(bytearray(BUNDLE))]
+    with zipfile.ZipFile(str(path)) as zf:
+        results.append(verify(zf))
+        # the ZipFile stays open for the caller
+        assert zf.read("audit.rules") == member("audit.rules")
+
+    assert all(not result["cached"] for result in results)
+    assert len({result["bundle"] for result in results}) == len(results)
+    assert all(result["matched_at"] == results[0]["matched_at"] for result in results)
+
+
+def test_parallel_verifications_are_independent():
+    tampered = replace_member(BUNDLE, "audit.rules", b"-D\n")
+    sources = [BUNDLE, tampered] * 4
+
+    def run(source):
+        try:
+            return verify(source)["bundle"]
+        except VerificationError:
+            return None
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        outcomes = list(pool.map(run, sources))
+    assert outcomes[1::2] == [None] * 4
+    assert None not in outcomes[::2] and len(set(outcomes[::2])) == 4
+
+
+def flip(data: bytes, offset: int) -> bytes:
+    return data[:offset] + bytes([data[offset] ^ 1]) + data[offset + 1 :]
+
+
+@pytest.mark.parametrize(
+    "name, data, error, message",
+    [
+        ("tpm2_pcr_data", flip(member("tpm2_pcr_data"), 0), VerificationError, "quote"),
+        ("secure_boot", fixtures.boot_log(40, seed=1).data, VerificationError, "PCR00"),
+        ("secure_boot", member("secure_boot").replace(b"ima_policy=tcb", b"ima_policy=xyz"), VerificationError, "secure boot"),
+        # a byte of the first record's template data
+        ("measurements", flip(member("measurements"), 60), VerificationError, "template hash of measurement record 0"),
+        ("measurements", member("measurements")[: list(iter_ima_records(member("measurements")))[-5].end], VerificationError, "does not reproduce"),
+        ("audit.rules", b"-D\n", VerificationError, "audit rules"),
+        ("audit_log.txt", flip(member("audit_log.txt"), 10), AuditLogError, "not attested"),
+    ],
+)
+def test_failed_checks_raise(name, data, error, message):
+    with pytest.raises(error, match=message):
+        verify(replace_member(BUNDLE, name, data))
+
+
+def test_edit_of_audit_files_is_illegal():
+    ima = fixtures.ima_log(20)
+    edit = fixtures.ima_ng_record(11, fixtures.AUDIT_LOG_PATH, b"sha256", b"\x01" * 32)
+    expected = [b"\x00" * 20] * 10 + [b"\x01" * 20] * 3
+    with pytest.raises(VerificationError, match="Illegal edit detected!"):
+        replay_measurements(ima.data + edit, expected)
+
+
+def test_failed_checks_raise_under_optimisation(tmp_path):
+    path = tmp_path / "signature.zip"
+    path.write_bytes(replace_member(BUNDLE, "audit.rules", b"-D\n"))
+    script = (
+        "import sys; sys.path.append(sys.argv[1]); from full_verify import VerificationError, verify_bundle\n"
+        "try:\n    verify_bundle(sys.argv[2], cache_path=None)\nexcept VerificationError:\n    sys.exit(3)\n"
+    )
+    verifierDir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "verifier")
+    result = subprocess.run([sys.executable, "-O", "-c", script, verifierDir, str(path)], capture_output=True)
+    assert result.returncode == 3, result.stderr
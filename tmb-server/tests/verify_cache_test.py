@@ -0,0 +1,144 @@
+import contextlib
+import io
+import json
+import os
+import sys
+import threading
+import zipfile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "benchmarks"))
+import fixtures
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "verifier"))
+import verify_cache as cacheModule
+from full_verify import verify_bundle
+from verify_cache import VerifyCache, get_cache
+
+# run pytest -v
+
+BUNDLE = fixtures.bundle(300, boot_events=40, audit_lines=50)
+
+
+def replace_members(bundle: bytes, members: dict) -> bytes:
+    archive = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(bundle)) as source, zipfile.ZipFile(archive, "w") as target:
+        for name in source.namelist():
+            target.writestr(name, members.get(name, source.read(name)))
+    return archive.getvalue()
+
+
+def verify(source, cache_path: str) -> tuple:
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        result = verify_bundle(source, cache_path=cache_path)
+    return result, output.getvalue()
+
+
+def test_identical_bundle_reuses_the_verdict(tmp_path):
+    path = str(tmp_path / "verify_cache.json")
+    first, _ = verify(BUNDLE, path)
+    second, output = verify(BUNDLE, path)
+    assert not first["cached"] and second["cached"]
+    assert "reusing verdict" in output
+    assert len(get_cache(path).verdicts) == 1
+
+
+def test_matching_boot_pcrs_skip_the_boot_log(tmp_path):
+    path = str(tmp_path / "verify_cache.json")
+    verify(BUNDLE, path)
+    with zipfile.ZipFile(io.BytesIO(BUNDLE)) as zf:
+        audit_log = zf.read("audit_log.txt")
+    # the log grew, so the verdict is not reused; the boot log is never read, garbage passes
+    grown = replace_members(BUNDLE, {"audit_log.txt": audit_log + b"type=EOE msg=audit(1760000001.000:99):\n", "secure_boot": b"\xff"})
+    result, output = verify(grown, path)
+    assert not result["cached"]
+    assert "skipping replay" in output and "Resuming measurement log" in output
+
+
+def test_lru_eviction(tmp_path):
+    cache = VerifyCache(str(tmp_path / "verify_cache.json"), max_entries=2)
+    cache.add_verdict("a", "1")
+    cache.add_verdict("b", "2")
+    # a is used again, b is now the oldest
+    assert cache.verdict("a", "1")
+    cache.add_verdict("c", "3")
+    assert list(cache.verdicts) == ["a", "c"]
+    assert not cache.verdict("b", "2")
+    # a different members digest for the same quote is a miss
+    assert not cache.verdict("a", "2")
+
+    for key in "xyz":
+        cache.add_boot(key)
+    assert not cache.boot_verified("x") and cache.boot_verified("y") and cache.boot_verified("z")
+
+
+def test_persist_and_reload(tmp_path):
+    path = str(tmp_path / "cache" / "verify_cache.json")
+    cache = VerifyCache(path)
+    cache.add_boot("boot")
+    cache.add_verdict("quote", "members")
+    cache.add_checkpoint("host", {"offset": 10, "count": 1, "prefix_hash": "00", "pcrs": {10: "ab"}, "file_hashes": {}})
+    cache.add_audit_log("host", {"offset": 5, "digest": "cd"})
+    assert not os.path.exists(path)
+    cache.save()
+    assert not [name for name in os.listdir(os.path.dirname(path)) if name.endswith(".tmp")]
+
+    reloaded = VerifyCache(path)
+    assert reloaded.boot_verified("boot") and reloaded.verdict("quote", "members")
+    # JSON object keys are strings, replay_measurements converts them back
+    assert reloaded.checkpoint("host")["pcrs"] == {"10": "ab"}
+    assert reloaded.audit_log("host") == {"offset": 5, "digest": "cd"}
+
+    assert get_cache(path) is get_cache(path)
+
+
+def test_unreadable_file_starts_empty(tmp_path):
+    path = tmp_path / "verify_cache.json"
+    path.write_text("{not json")
+    cache = VerifyCache(str(path))
+    assert not cache.verdicts and cache.checkpoint("host") is None
+    cache.add_boot("boot")
+    cache.save()
+    assert json.loads(path.read_text())["boot_states"] == ["boot"]
+
+
+def test_one_write_per_verification(tmp_path, monkeypatch):
+    path = str(tmp_path / "verify_cache.json")
+    replaced = []
+    replace = os.replace
+    monkeypatch.setattr(cacheModule.os, "replace", lambda src, dst: (replaced.append(dst), replace(src, dst)))
+    verify(BUNDLE, path)
+    assert replaced == [path]
+    # a reused verdict adds nothing, the file is not written again
+    verify(BUNDLE, path)
+    assert replaced == [path]
+
+
+def test_saves_never_go_back_to_an_older_snapshot(tmp_path, monkeypatch):
+    path = str(tmp_path / "verify_cache.json")
+    cache = VerifyCache(path)
+    dump = json.dump
+    first_dump = threading.Event()
+    second_added = threading.Event()
+
+    def slow_dump(stored, cache_file):
+        # the first save took its snapshot, a newer entry and save come in before it is written
+        if not first_dump.is_set():
+            first_dump.set()
+            second_added.wait(5)
+        dump(stored, cache_file)
+
+    monkeypatch.setattr(cacheModule.json, "dump", slow_dump)
+    cache.add_verdict("a", "1")
+    first = threading.Thread(target=cache.save)
+    first.start()
+    first_dump.wait(5)
+    cache.add_verdict("b", "2")
+    second = threading.Thread(target=cache.save)
+    second.start()
+    # without ordering the second save would replace the file first
+    second.join(0.5)
+    second_added.set()
+    first.join()
+    second.join()
+    assert set(json.loads(open(path).read())["verdicts"]) == {"a", "b"}
@@ -1,14 +1,33 @@
 import asyncio
+import json
 import os
-import random
-import shlex
-import subprocess
+import sys
+import time
+from typing import Optional
 
-import pandas as pd
 import structlog
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import get_config
+from attestation import AttestationPipeline
+from fit_cache import FitCache
+from instrumentation import (
+    finishedTotal,
+    metricVerdicts,
+    registry,
+    samplesTotal,
+    sessionsTimedOut,
+    stageSeconds,
+    verdictWaitSeconds,
+)
+from prometheus import CONTENT_TYPE
+from reservoir import ReservoirStore
+from sessions import SessionManager, SessionState
+
 
 class UUID(BaseModel):
     userID: str
@@ -20,132 +39,225 @@ class SMIData(BaseModel):
     vramUsage: float
     powerDraw: float
     uuid: UUID
+    # sampler's monotonic clock, enables time-weighted averages and energy
+    timestamp: Optional[float] = None
 
 
 tmb = FastAPI()
 log = structlog.get_logger()
-# TODO with c, move the reservoir/buffer size to a global config file
-reservoir_size = 10
-
-pendingRequests: dict[str, dict] = {}
-
-
-# async def cache_and_average(userID, model, gpuUtilization, vramUsage, powerDraw):
-#     # data normalized from rust side
-#     session = pendingRequests[userID]
-#     async with session["Lock"]:
-#         session["Cache"].append(
-#             {
-#                 "Model": model,
-#                 "gpuUtilization": gpuUtilization,
-#                 "vramUsage": vramUsage,
-#                 "powerDraw": powerDraw,
-#             }
-#         )
-
-#         cache = session["Cache"]
-#         n = len(cache)
-#     return {
-#         "gpuAvg": sum(num["gpuUtilization"] for num in cache) / n,
-#         "vramAvg": sum(num["vramUsage"] for num in cache) / n,
-#         "powerAvg": sum(num["powerDraw"] for num in cache) / n,
-#     }
-
-
-# could def be optimized lol
+config = get_config()
+reservoir_size = config.reservoir_size
+# rows ingested as reference before requests are verified
+grace_period = config.grace_period
+
+reservoirStore = ReservoirStore(os.path.dirname(os.path.abspath(__file__)), reservoir_size)
+# fitted reference distributions per model, kept in sync by reservoir_sampling
+fitCache = FitCache()
+# in-flight sessions, idle ones are dropped after session_ttl seconds
+session_ttl = config.session_ttl
+# how long verdicts stay available after /finished
+verdict_ttl = config.verdict_ttl
+sessions = SessionManager(ttl=session_ttl, verdictTTL=verdict_ttl)
+# default /clientRequest wait, the cap for long-polls and streams, and the stream keepalive period
+# the cap stays within session_ttl so a waiting session is never reaped under its waiter
+verdict_timeout = config.verdict_timeout
+max_verdict_timeout = config.max_verdict_timeout
+verdict_keepalive = config.verdict_keepalive
+# TPM quote export and verification run in the background, at most once per
+# attestation_interval seconds or every attestation_every verdicts
+attestation_interval = config.attestation_interval
+attestation_every = config.attestation_every
+attestationPipeline = AttestationPipeline(interval=attestation_interval, everyRequests=attestation_every)
+
+# state the server already keeps, read when /stats is scraped
+registry.counter("tmb_sessions_created_total", "Sessions opened", collect=lambda: sessions.created)
+registry.counter("tmb_sessions_expired_total", "Idle sessions dropped after session_ttl", collect=lambda: sessions.expired)
+registry.gauge(
+    "tmb_sessions_in_flight",
+    "Sessions in the table, by state",
+    ("state",),
+    collect=lambda: {(state.value,): count for state, count in sessions.countByState().items()},
+)
+registry.gauge(
+    "tmb_reservoir_rows",
+    "Reference rows in each loaded model reservoir",
+    ("model",),
+    collect=lambda: {(model,): len(reservoir) for model, reservoir in list(reservoirStore.reservoirs.items())},
+)
+
+
 def reservoir_sampling(model, gpuUtilization, vramUsage, powerDraw):
-    baseDir = os.path.dirname(os.path.abspath(__file__))
-    filePath = os.path.join(baseDir, f"{model}_storage.csv")
-    log.info(f"Reservoir Sampling at: {filePath}")
-
-    # one data as row
-    row = pd.DataFrame(
-        [
-            {
-                "gpuUtilization": gpuUtilization,
-                "vramUsage": vramUsage,
-                "powerDraw": powerDraw,
-            }
-        ]
-    )
+    reservoir = reservoirStore.get(model)
+    log.info(f"Reservoir Sampling at: {reservoir.filePath}")
+
+    action, idx = reservoir.add(gpuUtilization, vramUsage, powerDraw)
+    # keep the cached fit in sync with rows that actually changed
+    if action == "replace":
+        fitCache.replace(model, idx, gpuUtilization, vramUsage, powerDraw)
+    elif action == "append":
+        fitCache.append(model, gpuUtilization, vramUsage, powerDraw)
 
-    # read storage file, create one if none exists
-    if os.path.exists(filePath) and os.path.getsize(filePath) > 0:
-        try:
-            df = pd.read_csv(filePath, index_col=False)
-        except pd.errors.EmptyDataError:
-            # exists exists but is blank
-            df = pd.DataFrame(columns=row.columns)
-    else:
-        df = pd.DataFrame(columns=row.columns)
 
-    # reservoir sampling
-    if len(df) >= reservoir_size:
-        # replace a random row
-        idx = random.randrange(len(df))
-        df.iloc[idx] = row.iloc[0]
-    else:
-        df = pd.concat([df, row], ignore_index=True)
+async def await_verdict(userID: str, timeout: float, abandon: bool = True) -> Optional[dict]:
+    """Wait up to timeout seconds for the verdict of userID, None if it did not arrive."""
+    verdict = sessions.verdict(userID)
+    if verdict is not None:
+        return verdict
 
-    df.to_csv(filePath, index=False)
+    session = sessions.getOrCreate(userID, SessionState.WAITING)
+    try:
+        await asyncio.wait_for(session.event.wait(), timeout=timeout)
+    except asyncio.TimeoutError:
+        # a session that already has metrics is kept so a late /finished still lands,
+        # one that never received any is abandoned
+        if abandon:
+            sessions.remove(session, SessionState.WAITING)
+        return None
+    return sessions.verdict(userID) or {"Verified": session.verification, "Attestation": session.attestation}
 
 
+# long-poll for the verdict, clients can subscribe before or after sending their prompt
 @tmb.post("/clientRequest")
-async def clientRequest(uuid: UUID):
+async def clientRequest(uuid: UUID, timeout: float = Query(default=verdict_timeout, gt=0, le=max_verdict_timeout)):
     userID = uuid.userID
     log.info(f"{userID} Reached /clientRequest")
-    if userID not in pendingRequests:
-        log.info("/clientRequest Creating New Event")
-        pendingRequests[userID] = {
-            "Event": asyncio.Event(),
-            "Cache": [],
-            "Verification": None,
-        }
-
-    session = pendingRequests[userID]
+    started = time.perf_counter()
     try:
-        await asyncio.wait_for(session["Event"].wait(), timeout=6)
-
-        return {"Verified": session["Verification"]}
-    except asyncio.TimeoutError:
-        err = "Verification Process Timed Out"
-        log.error(err)
-        raise HTTPException(status_code=408, detail=err)
+        verdict = await await_verdict(userID, timeout)
     except Exception:
         err = "Client Request Error"
         log.error(err)
         raise HTTPException(status_code=500, detail=err)
-    finally:
-        pendingRequests.pop(userID, None)
+
+    verdictWaitSeconds.observe(time.perf_counter() - started, "clientRequest", "timeout" if verdict is None else "delivered")
+    if verdict is None:
+        sessionsTimedOut.inc("clientRequest")
+        err = "Verification Process Timed Out"
+        log.error(err)
+        raise HTTPException(status_code=408, detail=err)
+
+    # verdict delivered, the stored copy serves any other subscriber
+    session = sessions.get(userID)
+    if session is not None:
+        sessions.remove(session, SessionState.DONE)
+    return verdict
+
+
+async def verdict_events(userID: str, timeout: float):
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    deadline = started + timeout
+    while True:
+        remaining = deadline - loop.time()
+        verdict = await await_verdict(userID, min(remaining, verdict_keepalive), abandon=remaining <= verdict_keepalive)
+        if verdict is not None:
+            verdictWaitSeconds.observe(loop.time() - started, "verdict", "delivered")
+            yield f"event: verdict\ndata: {json.dumps(verdict)}\n\n"
+            return
+        if loop.time() >= deadline:
+            verdictWaitSeconds.observe(loop.time() - started, "verdict", "timeout")
+            sessionsTimedOut.inc("verdict")
+            yield "event: timeout\ndata: {}\n\n"
+            return
+        yield ": keepalive\n\n"
+
+
+# server-sent events: keepalive comments until a single verdict (or timeout) event
+@tmb.get("/verdict/{userID}")
+async def verdictStream(userID: str, timeout: float = Query(default=max_verdict_timeout, gt=0, le=max_verdict_timeout)):
+    log.info(f"{userID} Reached /verdict")
+    return StreamingResponse(
+        verdict_events(userID, timeout),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+def ingest(smiData: SMIData) -> bool:
+    """Fold one sample into its session, False if that session already finished."""
+    userID = smiData.uuid.userID
+    session = sessions.getOrCreate(userID, SessionState.COLLECTING)
+    if not sessions.transition(
+        session, SessionState.WAITING, SessionState.COLLECTING, to=SessionState.COLLECTING
+    ):
+        log.warning(f"{userID} Sent Metrics After /finished")
+        samplesTotal.inc("ignored")
+        return False
+
+    session.metrics.add(smiData.uuid.model, smiData.gpuUtilization, smiData.vramUsage, smiData.powerDraw, smiData.timestamp)
+    samplesTotal.inc("accepted")
+    return True
 
 
 # incoming data from LLM server
 @tmb.post("/metrics")
 async def metrics(smiData: SMIData):
-    userID = smiData.uuid.userID
-    log.info(f"{userID} Reached /metrics")
-    if userID not in pendingRequests:
-        log.info("/metrics Creating New Event")
-        pendingRequests[userID] = {
-            "Event": asyncio.Event(),
-            "Cache": [],
-            "Verification": None,
-        }
-        # raise HTTPException(status_code=400, detail=f"No Active Session For {userID}")
-
-    session = pendingRequests[userID]
-    session["Cache"].append(
-        {
-            "model": smiData.uuid.model,
-            "gpuUtilization": smiData.gpuUtilization,
-            "vramUsage": smiData.vramUsage,
-            "powerDraw": smiData.powerDraw,
-        }
-    )
+    log.info(f"{smiData.uuid.userID} Reached /metrics")
+    if not ingest(smiData):
+        return {"message": "Session Already Finished"}
 
     return {"message": "Receiving Data"}
 
 
+class MetricsBatch(BaseModel):
+    samples: list[SMIData]
+    # close every session in the batch once its samples are ingested
+    finished: bool = False
+    # sampler-clock interval the sessions ran in, timestamped samples are integrated over it
+    start: Optional[float] = None
+    end: Optional[float] = None
+
+
+# many samples, possibly for several sessions, in one request
+@tmb.post("/metrics/batch")
+async def metricsBatch(batch: MetricsBatch):
+    userIDs = list(dict.fromkeys(sample.uuid.userID for sample in batch.samples))
+    log.info(f"Reached /metrics/batch with {len(batch.samples)} Samples for {len(userIDs)} Sessions")
+
+    if batch.start is not None or batch.end is not None:
+        for userID in userIDs:
+            session = sessions.getOrCreate(userID, SessionState.COLLECTING)
+            if session.metrics.count == 0:
+                session.metrics.setWindow(batch.start, batch.end)
+    accepted = sum(ingest(sample) for sample in batch.samples)
+    response = {
+        "message": "Receiving Data",
+        "accepted": accepted,
+        "ignored": len(batch.samples) - accepted,
+    }
+
+    if batch.finished:
+        results = {}
+        for userID in userIDs:
+            try:
+                result = await finish_session(userID)
+            except HTTPException as e:
+                result = {"error": e.detail}
+            if isinstance(result, Exception):
+                result = {"error": str(result)}
+            results[userID] = result
+        response["finished"] = results
+
+    return response
+
+
+class CachedVerdict(BaseModel):
+    userID: str
+    # run whose response the load server served again
+    originalID: str
+    verified: Optional[bool] = None
+    attestation: Optional[dict] = None
+
+
+# the load server answered userID from its response cache, hand out the verdict of the original run
+@tmb.post("/cachedVerdict")
+async def cachedVerdict(cached: CachedVerdict):
+    log.info(f"{cached.userID} Reached /cachedVerdict for {cached.originalID}")
+    if not sessions.publish(cached.userID, cached.verified, cached.attestation):
+        raise HTTPException(status_code=409, detail="Session Already Receiving Metrics")
+    return {"message": "Verdict Recorded"}
+
+
 class FINISH(BaseModel):
     userID: str
 
@@ -153,103 +265,83 @@ class FINISH(BaseModel):
 # continuously ingest data at /metric endpoint until /finished is hit
 @tmb.post("/finished")
 async def finished(req: FINISH, request: Request):
-    userID = req.userID
-    log.info(f"{userID} Reached /finished")
-    if userID not in pendingRequests:
+    log.info(f"{req.userID} Reached /finished")
+    return await finish_session(req.userID)
+
+
+async def finish_session(userID: str):
+    session = sessions.get(userID)
+    if session is None:
         raise HTTPException(status_code=400, detail="No Active Session")
 
-    session = pendingRequests[userID]
-    cache = session["Cache"]
+    stats = session.metrics
 
-    if not cache:
+    if not stats.count:
         raise HTTPException(status_code=400, detail="No Data Received")
 
-    # find average
-    n = len(cache)
-    model = cache[0]["model"]
-    gpuAvg = sum(items["gpuUtilization"] for items in cache) / n
-    vramAvg = sum(items["vramUsage"] for items in cache) / n
-    powerAvg = sum(items["powerDraw"] for items in cache) / n
-
-    # compile c file
-    baseDir = os.path.dirname(os.path.abspath(__file__))
-    cFile = os.path.join(baseDir, "stats_verify.c")
-    cExecutable = os.path.join(baseDir, "stats_verify")
-    # check if storage file need ../ in case of failure
-    storageFile = os.path.join(baseDir, f"{model}_storage.csv")
+    if not sessions.transition(session, SessionState.COLLECTING, to=SessionState.VERIFYING):
+        raise HTTPException(status_code=409, detail="Session Already Finished")
+    started = time.perf_counter()
+    stageSeconds.observe(time.monotonic() - session.created, "collect")
+
+    # averages kept by /metrics, weighted by time when the samples carry timestamps
+    model = stats.model
+    with stageSeconds.time("averages"):
+        gpuAvg, vramAvg, powerAvg = stats.averages()
+    log.info(f"{userID} Session Metrics: {stats.summary()}")
+
+    storageFile = reservoirStore.storageFile(model)
     # grace period
     # sets async event & updates data
-    if pd.read_csv(storageFile).size <= 10:
+    if reservoirStore.size(model) <= grace_period:
         log.info("Ingesting Data for Reference")
-        session["Event"].set()  # release clientRequest waiter
-        reservoir_sampling(model, gpuAvg, vramAvg, powerAvg)
-        return {"Verification Result": session["Verification"]}
-    
-    log.info(f"C File Located at: {cFile}")
-    log.info(f"C Executable Located at: {cExecutable}")
-    log.info(f"Storage File Located at: {storageFile}")
-    try:
-        log.info("Compiling C File...")
-        # build dependencies
-        deps = [
-            os.path.join(baseDir, "utils.c"),
-            os.path.join(baseDir, "gpu-utilization", "utils.c"),
-            os.path.join(baseDir, "powerdraw", "utils.c"),
-            os.path.join(baseDir, "vram", "utils.c"),
-        ]
-        # get GSL flags
-        try:
-            pkg_flags = subprocess.check_output(
-                ["pkg-config", "--cflags", "--libs", "gsl"], text=True
-            ).strip()
-            flags = shlex.split(pkg_flags)
-        except Exception as e:
-            log.error(f"Error. Try Install GSL on Your Machine: {e}")
-            return e
-        # build gcc command
-        cmd = ["gcc", cFile, *deps, "-o", cExecutable, *flags]
-        log.info(f"Python Subprocess Running Command: {cmd}")
-        subprocess.run(cmd, check=True)
-        # subprocess.run(["gcc", cFile, "-o", cExecutable], check=True)
-    except subprocess.CalledProcessError as e:
-        log.error(f"Error Compiling C File: {e}")
-        return e
-    # build input arguments
-    arguments = [str(storageFile), str(gpuAvg), str(vramAvg), str(powerAvg)]
-    print(arguments)
+        sessions.transition(session, to=SessionState.DONE)  # release clientRequest waiter
+        # the reservoir write waits on fdatasync, keep it off the event loop
+        with stageSeconds.time("reservoir"):
+            await asyncio.to_thread(reservoir_sampling, model, gpuAvg, vramAvg, powerAvg)
+        finishedTotal.inc("grace")
+        stageSeconds.observe(time.perf_counter() - started, "finish")
+        return {"Verification Result": session.verification}
 
+    log.info(f"Storage File Located at: {storageFile}")
     try:
-        result = subprocess.run(
-            [cExecutable] + arguments,
-            capture_output=True,
-            text=True,
-            check=True,
-            cwd=baseDir,
-        )
-        verification = int(result.stdout[-1])
-        # sums true + false, <= 1 means majority true
-        print("-ejkvdfhjkvndekrhvbekrjhbvdfkrjhvbjk")
-        print(verification)
-        log.info(result.stdout)
-
-        session["Verification"] = bool(int(verification))
-
-        log.info(f"Setting Events for: {session['Event']}")
-        session["Event"].set()  # release clientRequest waiter
-        #call max function
-        os.system("sudo verifier/export_signature.sh -o signature.zip")
-        ## Here would actually be glue logc sending signatures and data but this is just a demoo
-
-        crypto_verification_success = os.system("python3 verifier/full_verify.py signature.zip") == 0
-        return {"Verification Result": session["Verification"] and crypto_verification_success}
-    except subprocess.CalledProcessError as e:
-        log.error(f"STDOUT: {e.stdout}")
-        log.error(f"STDERR: {e.stderr}")
-        return e
+        # cached fit of the stats_verify reference model, refit only on reservoir change
+        with stageSeconds.time("fit"):
+            result = fitCache.verify(model, storageFile, gpuAvg, vramAvg, powerAvg)
+        log.info(f"Stats Verification: {result}")
+        for metric, accepted in (("gpu", result.gpuAccepted), ("vram", result.vramAccepted), ("power", result.powerAccepted)):
+            metricVerdicts.inc(metric, "accept" if accepted else "reject")
+
+        session.verification = result.verified
+        # latest finished attestation, a new one is started in the background when due
+        with stageSeconds.time("notify"):
+            session.attestation = attestationPipeline.notify()
+
+        log.info(f"Setting Events for: {userID}")
+        sessions.transition(session, to=SessionState.DONE)  # release clientRequest waiter
+        finishedTotal.inc("verified" if session.verification else "rejected")
+
+        # None until the first attestation has finished
+        crypto_verification_success = session.attestation["verified"] if session.attestation else None
+        return {
+            "Verification Result": session.verification and crypto_verification_success,
+            "Attestation": session.attestation,
+        }
     except Exception as e:
-        log.error(f"Error Executing C Binary: {e}")
+        log.error(f"Error Running Stats Verification: {e}")
+        finishedTotal.inc("error")
         return e
     finally:
+        # never leave a waiter hanging, even when verification failed
+        sessions.transition(session, to=SessionState.DONE)
         # reservoir sampling at the end
-        if session["Verification"]:
-            reservoir_sampling(model, gpuAvg, vramAvg, powerAvg)
+        if session.verification:
+            with stageSeconds.time("reservoir"):
+                await asyncio.to_thread(reservoir_sampling, model, gpuAvg, vramAvg, powerAvg)
+        stageSeconds.observe(time.perf_counter() - started, "finish")
+
+
+# Prometheus text exposition of the instruments in instrumentation.py and above
+@tmb.get("/stats")
+def getStats():
+    return Response(registry.render(), media_type=CONTENT_TYPE)
@@ -1,4 +1,5 @@
 #!/bin/python
+import asyncio
 import json
 import os
 import sys
@@ -14,12 +15,13 @@ from textual.containers import VerticalScroll
 from textual.validation import Function, Number, ValidationResult, Validator
 from textual.widgets import Input, Label, Pretty, Select
 
+from config import get_config
 from utils import (
     MODELS,
     InternalRequest,
     get_mode,
-    get_port_no,
-    send_prompt_request,
+    get_verdict_async,
+    send_prompt_request_stream_async,
     set_mode,
 )
 
@@ -44,6 +46,10 @@ class Response(Label):
 
     def on_mount(self) -> None:
         self.border_title = self.model
+        self.set_verified(self.verified)
+
+    def set_verified(self, verified: bool) -> None:
+        self.verified = verified
         self.border_subtitle = f"verified: {self.verified}"
         if self.verified:
             self.add_class(f"-valid")
@@ -52,7 +58,7 @@ class Response(Label):
 class InputApp(App):
     def __init__(self) -> None:
         super().__init__()
-        self.load_url = "http://127.0.0.1:{}/".format(get_port_no("load"))
+        self.load_url = get_config().url("load") + "/"
         self.messages = []
 
     CSS = """
@@ -130,19 +136,23 @@ class InputApp(App):
         container = self.query_one('#messages', VerticalScroll)
         self.messages.append({"role": "user", "content": prompt})
         to_send = InternalRequest(
-                original=f'{{"messages": {json.dumps(self.messages)}}}',
+                original=f'{{"messages": {json.dumps(self.messages)}, "stream": true}}',
                 uuid=UUID,
                 model=model,
                 )
-        res = send_prompt_request(to_send)
+        # wait for the verdict alongside the answer instead of after it
+        verdict = asyncio.create_task(get_verdict_async(UUID, model))
+        response = Response("", model, None)
+        container.mount(response)
+        content = ""
+        async for chunk in send_prompt_request_stream_async(to_send):
+            for choice in chunk.get('choices', []):
+                content += choice.get('delta', {}).get('content') or ""
+            response.update(content)
+            container.scroll_end(animate=False)
         #self.messages.append(res)
 
-        ver = requests.post(
-            f"http://localhost:{get_port_no('tmb')}/clientRequest",
-            json={"userID": UUID, "model": model},
-            ).json()['Verified']
-        container.mount(Response(str(res['choices'][0]['message']['content']), model, ver))
-        container.scroll_end(animate=False)
+        response.set_verified((await verdict).get('Verified'))
 
 if __name__ == "__main__":
     app = InputApp()
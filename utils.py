@@ -1,9 +1,15 @@
+import asyncio
 import json
-import os
-import re
+import threading
+import uuid
+import weakref
 
+import httpx
 import requests
 from pydantic import BaseModel
+from requests.adapters import HTTPAdapter
+
+from config import get_config
 
 server_url = "http://127.0.0.1:8000"
 
@@ -13,21 +19,57 @@ PROMPT_REQUEST_PATH = "/submit_prompt"
 INTERNAL_REQUEST_PATH = "/internal"
 GET_MODE_PATH = "/mode"
 SET_MODE_PATH = "/switch_mode"
-
-base_dir = os.path.dirname(os.path.abspath(__file__))
-PORT_FILE = os.path.join(base_dir, "port_map.txt")
+VERDICT_PATH = "/clientRequest"
+CACHED_VERDICT_PATH = "/cachedVerdict"
+METRICS_BATCH_PATH = "/metrics/batch"
 
 
 def get_port_no(process_name):
-    with open(PORT_FILE, "r") as file:
-        for line in file.readlines():
-            matches = re.findall(r"([a-zA-z]+): ([0-9]+)", line)
-            if matches[0][0] == process_name:
-                return int(matches[0][1])
-    return None
+    return get_config().port(process_name)
+
+
+load_url = get_config().url("load")
+tmb_url = get_config().url("tmb")
+wrapper_url = get_config().url("wrapper") + "/"
+
+
+_session = None
+_session_lock = threading.Lock()
+# one AsyncClient per event loop, its connections can't be shared across loops
+_async_clients = weakref.WeakKeyDictionary()
+
 
+def http_session():
+    """Process-wide requests session, reuses keep-alive connections between calls."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=get_config().pool_size)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
 
-load_url = "http://127.0.0.1:{}".format(get_port_no("load"))
+
+def async_client():
+    """Shared httpx.AsyncClient of the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        config = get_config()
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(None, connect=config.connect_timeout),
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=config.pool_size),
+        )
+        _async_clients[loop] = client
+    return client
+
+
+async def close_async_client():
+    """Close the running loop's client, for server shutdown hooks."""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
 
 
 class InternalRequest(BaseModel):
@@ -38,21 +80,55 @@ class InternalRequest(BaseModel):
 
 def send_prompt_request(internal_request):
     to_send = internal_request_to_json(internal_request)
-    response = requests.get("{}{}".format(load_url, PROMPT_REQUEST_PATH), json=to_send)
+    response = http_session().get("{}{}".format(load_url, PROMPT_REQUEST_PATH), json=to_send)
     return response.json()
 
 
+async def send_prompt_request_async(internal_request):
+    to_send = internal_request_to_json(internal_request)
+    response = await async_client().request("GET", "{}{}".format(load_url, PROMPT_REQUEST_PATH), json=to_send)
+    return response.json()
+
+
+def stream_requested(internal_request):
+    """Whether the chat-completion body asks llama-server for "stream": true chunks."""
+    try:
+        return bool(json.loads(internal_request.original).get("stream"))
+    except (ValueError, AttributeError):
+        return False
+
+
+def sse_chunk(line):
+    """Chat-completion chunk of one SSE line, None for other lines and the [DONE] marker."""
+    if not line.startswith("data:"):
+        return None
+    data = line[len("data:"):].strip()
+    if not data or data == "[DONE]":
+        return None
+    return json.loads(data)
+
+
 def send_prompt_request_stream(internal_request):
     to_send = internal_request_to_json(internal_request)
     url = load_url + PROMPT_REQUEST_PATH
-    sesh = requests.session()
-    
-    with sesh.get(url, json=to_send, stream=True) as response:
-        # if backend streams plain text / JSON lines
+
+    with http_session().get(url, json=to_send, stream=True) as response:
         for line in response.iter_lines(decode_unicode=True):
-            if not line:
-                continue
-            yield line
+            chunk = sse_chunk(line) if line else None
+            if chunk is not None:
+                yield chunk
+
+
+async def send_prompt_request_stream_async(internal_request):
+    to_send = internal_request_to_json(internal_request)
+    url = load_url + PROMPT_REQUEST_PATH
+
+    async with async_client().stream("GET", url, json=to_send) as response:
+        async for line in response.aiter_lines():
+            chunk = sse_chunk(line)
+            if chunk is not None:
+                yield chunk
+
 
 def internal_request_to_json(internal_request):
     ret = {
@@ -65,22 +141,96 @@ def internal_request_to_json(internal_request):
 
 def send_internal_request(internal_request):
     to_send = internal_request_to_json(internal_request)
-    wrapper_url = "http://127.0.0.1:{}/".format(3822)
 
     headers = {"Content-Type": "application/json"}
-    response = requests.get(wrapper_url, data=json.dumps(to_send), headers=headers)
+    response = http_session().get(wrapper_url, data=json.dumps(to_send), headers=headers)
 
     return response
 
 
+async def send_internal_request_async(internal_request, url=None):
+    to_send = internal_request_to_json(internal_request)
+
+    headers = {"Content-Type": "application/json"}
+    response = await async_client().request("GET", url or wrapper_url, content=json.dumps(to_send), headers=headers)
+
+    return response
+
+
+async def send_internal_request_stream_async(internal_request, url=None):
+    """Pass the wrapper's response through as it arrives, e.g. SSE chunks."""
+    to_send = internal_request_to_json(internal_request)
+
+    headers = {"Content-Type": "application/json"}
+    async with async_client().stream("GET", url or wrapper_url, content=json.dumps(to_send), headers=headers) as response:
+        async for data in response.aiter_raw():
+            yield data
+
+
+def get_verdict(user_id, model, timeout=None):
+    """Long-poll the tmb server, can be called before the prompt is even sent."""
+    response = http_session().post(
+        "{}{}".format(tmb_url, VERDICT_PATH),
+        params={"timeout": timeout or get_config().client_verdict_timeout},
+        json={"userID": user_id, "model": model},
+    )
+    return response.json()
+
+
+async def get_verdict_async(user_id, model, timeout=None):
+    response = await async_client().post(
+        "{}{}".format(tmb_url, VERDICT_PATH),
+        params={"timeout": timeout or get_config().client_verdict_timeout},
+        json={"userID": user_id, "model": model},
+    )
+    return response.json()
+
+
+async def publish_cached_verdict_async(user_id, original_id, verdict):
+    """Have the tmb server answer user_id with the verdict of the run original_id."""
+    response = await async_client().post(
+        "{}{}".format(tmb_url, CACHED_VERDICT_PATH),
+        json={
+            "userID": user_id,
+            "originalID": original_id,
+            "verified": verdict.get("Verified"),
+            "attestation": verdict.get("Attestation"),
+        },
+    )
+    return response.json()
+
+
+async def send_metrics_batch_async(user_id, model, samples, finished=False, start=None, end=None):
+    """Send telemetry rows of one session, sampled between start and end, to the tmb server."""
+    response = await async_client().post(
+        "{}{}".format(tmb_url, METRICS_BATCH_PATH),
+        json={
+            "samples": [
+                {
+                    "gpuUtilization": sample.gpuUtilization,
+                    "vramUsage": sample.vramUsage,
+                    "powerDraw": sample.powerDraw,
+                    "uuid": {"userID": user_id, "model": model},
+                    "timestamp": sample.timestamp,
+                }
+                for sample in samples
+            ],
+            "finished": finished,
+            "start": start,
+            "end": end,
+        },
+    )
+    return response.json()
+
+
 def get_mode(server_url):
-    response = requests.get("{}{}".format(server_url, GET_MODE_PATH), json={})
+    response = http_session().get("{}{}".format(server_url, GET_MODE_PATH), json={})
     return response.json()
 
 
 def set_mode(mode, server_url):
     data = {"mode": mode}
-    response = requests.post("{}{}".format(server_url, SET_MODE_PATH), json=data)
+    response = http_session().post("{}{}".format(server_url, SET_MODE_PATH), json=data)
     return response.json()
 
 
@@ -92,22 +242,24 @@ class PromptRequest:
 
 
 def client():
+    asyncio.run(client_async())
+
+
+async def client_async():
     messages = []
     while True:
-        userInput = input()
+        userInput = await asyncio.to_thread(input)
         messages.append({"role": "user", "content": userInput})
+        # fresh id per request so a stored verdict is never mistaken for this one
+        user_id = str(uuid.uuid4())
         to_send = InternalRequest(
             original=f'{{"messages": {json.dumps(messages)}}}',
-            uuid="id 1",
+            uuid=user_id,
             model="a",
         )
 
+        # subscribe to the verdict while the prompt is being answered
+        verdict = asyncio.create_task(get_verdict_async(user_id, "a"))
         print("client sending initial request")
-        print("client received from server", send_prompt_request(to_send))
-        print(
-            "client received tmb response",
-            requests.post(
-                f"http://localhost:{get_port_no('tmb')}/clientRequest",
-                json={"userID": "id 1", "model": "gpt5"},
-            ).content,
-        )
+        print("client received from server", await send_prompt_request_async(to_send))
+        print("client received tmb response", await verdict)
@@ -0,0 +1,73 @@
+"""
+Attestation of the exported audit log against the hash IMA measured.
+
+IMA records the sha256 of /var/log/audit/audit.log at some point in time, and
+the exported copy has grown since, so the check is that some line-aligned
+prefix of the copy hashes to the measured value. The previous verification's
+match (offset and digest) is kept so the next run hashes that prefix in one
+pass, confirming the copy still starts with it, and only finalises a digest
+at the line ends of the appended tail.
+
+Resuming does not make a run O(appended bytes): hashlib cannot export or restore
+a sha256 state, so the saved prefix is hashed again from its first byte every
+run. What resuming saves is the digest() at each of its line ends, the prefix
+costs one bulk sha256 pass instead of a finalised copy per line.
+"""
+import hashlib
+import io
+from typing import Optional
+
+CHUNK_SIZE = 1 << 20
+
+
+class AuditLogError(ValueError):
+    """No line-aligned prefix of the audit log hashes to the measured value."""
+
+
+def find_attested_prefix(audit_log, attested_hash: bytes, start: int = 0, hasher=None) -> int:
+    """
+    Length of the first line-aligned prefix of audit_log from start on whose
+    sha256 is attested_hash, -1 if there is none. hasher must already hold
+    audit_log[:start].
+    """
+    view = memoryview(audit_log)
+    length = len(view)
+    hasher = hashlib.sha256() if hasher is None else hasher
+    if start and hasher.digest() == attested_hash:
+        return start
+
+    position = start
+    while position < length:
+        chunk = view[position : min(position + CHUNK_SIZE, length)].tobytes()
+        # complete lines are candidates, a line cut by the chunk end is carried into the next one
+        complete = chunk.rfind(b"\n") + 1
+        lines = io.BytesIO(chunk[:complete])
+        for line in lines:
+            hasher.update(line)
+            # digest() finalises a copy of the state, hashing carries on
+            if hasher.digest() == attested_hash:
+                return position + lines.tell()
+        hasher.update(chunk[complete:])
+        position += len(chunk)
+        if position == length and complete < len(chunk) and hasher.digest() == attested_hash:
+            return position
+    return -1
+
+
+def verify_audit_log(audit_log, attested_hash: bytes, previous: Optional[dict] = None) -> dict:
+    """
+    Check that a line-aligned prefix of audit_log hashes to attested_hash, resuming
+    after the prefix previous matched when the log still starts with it. That
+    prefix is still hashed in full, so the cost stays linear in the log size.
+    Returns the state to resume from next time, raises AuditLogError otherwise.
+    """
+    end = -1
+    if previous is not None and previous["offset"] <= len(audit_log):
+        hasher = hashlib.sha256(memoryview(audit_log)[:previous["offset"]])
+        if hasher.hexdigest() == previous["digest"]:
+            end = find_attested_prefix(audit_log, attested_hash, previous["offset"], hasher)
+    if end < 0:
+        end = find_attested_prefix(audit_log, attested_hash)
+    if end < 0:
+        raise AuditLogError("audit log is not attested to!")
+    return {"offset": end, "digest": attested_hash.hex()}
@@ -1,87 +1,41 @@
 #!/usr/bin/env python3
 
-import hashlib
 import yaml
 from typing import Dict
 
-class PCRVerifier:
-    def __init__(self):
-        self.pcr_banks = {
-            'sha1': {},
-            'sha256': {},
-            'sha384': {},
-            'sha512': {}
-        }
-        self.initialize_pcrs()
+from pcr import PCRVerifier
 
-    def initialize_pcrs(self):
-        """Initialize all PCRs to zero for each hash algorithm."""
-        for bank in self.pcr_banks.keys():
-            for pcr in range(24):  # TPM typically has PCRs 0-23
-                if bank == 'sha1':
-                    self.pcr_banks[bank][pcr] = b'\x00' * 20
-                elif bank == 'sha256':
-                    self.pcr_banks[bank][pcr] = b'\x00' * 32
-                elif bank == 'sha384':
-                    self.pcr_banks[bank][pcr] = b'\x00' * 48
-                elif bank == 'sha512':
-                    self.pcr_banks[bank][pcr] = b'\x00' * 64
-
-    def extend_pcr(self, pcr_index: int, algorithm: str, digest: str) -> None:
-        """
-        Extend a PCR with a new measurement.
-        
-        Args:
-            pcr_index: The index of the PCR to extend
-            algorithm: The hash algorithm to use (sha1, sha256, sha384, or sha512)
-            digest: The hex string of the digest to extend with
-        """
-        if algorithm not in self.pcr_banks:
-            raise ValueError(f"Unsupported hash algorithm: {algorithm}")
-        
-        current_value = self.pcr_banks[algorithm][pcr_index]
-        digest_bytes = bytes.fromhex(digest)
-        
-        # Create a new hash object of the specified algorithm
-        hasher = getattr(hashlib, algorithm)()
-        # Extend is defined as: PCRnew = Hash(PCRold || digest)
-        hasher.update(current_value + digest_bytes)
+def verify_boot_log(verifier: PCRVerifier, log_file: str) -> Dict[str, Dict[int, bytes]]:
+    """
+    Verify a boot log file by simulating PCR extensions and comparing results.
+    
+    Args:
+        verifier: The PCR banks to extend
+        log_file: Path to the YAML boot log file
         
-        # Update the PCR with the new value
-        self.pcr_banks[algorithm][pcr_index] = hasher.digest()
+    Returns:
+        Dictionary mapping hash algorithms to PCR values
+    """
+    with open(log_file, 'r') as f:
+        log_data = yaml.safe_load(f)
 
-    def verify_boot_log(self, log_file: str) -> Dict[str, Dict[int, bytes]]:
-        """
-        Verify a boot log file by simulating PCR extensions and comparing results.
+    # Collect the digest chain of every PCR, per algorithm
+    chains = {algo: {} for algo in verifier.pcr_banks}
+    for event in log_data['events']:
+        pcr_index = event['PCRIndex']
         
-        Args:
-            log_file: Path to the YAML boot log file
-            
-        Returns:
-            Dictionary mapping hash algorithms to PCR values
-        """
-        with open(log_file, 'r') as f:
-            log_data = yaml.safe_load(f)
-
-        # Process each event in the log
-        for event in log_data['events']:
-            pcr_index = event['PCRIndex']
-            
-            # Handle different digest formats in the log
-            if 'DigestCount' in event:
-                # Multiple digests per event
-                for digest_entry in event['Digests']:
-                    algo = digest_entry['AlgorithmId'].lower()
-                    if algo in self.pcr_banks:
-                        self.extend_pcr(pcr_index, algo, digest_entry['Digest'])
+        # Handle different digest formats in the log
+        if 'DigestCount' in event:
+            # Multiple digests per event
+            for digest_entry in event['Digests']:
+                algo = digest_entry['AlgorithmId'].lower()
+                if algo in chains:
+                    chains[algo].setdefault(pcr_index, []).append(bytes.fromhex(digest_entry['Digest']))
 
-        return self.pcr_banks
+    for algo, algo_chains in chains.items():
+        verifier.replay(algo, algo_chains)
 
-    def get_pcr_value(self, pcr_index: int, algorithm: str) -> str:
-        """Get the current value of a PCR as a hex string."""
-        if algorithm not in self.pcr_banks:
-            raise ValueError(f"Unsupported hash algorithm: {algorithm}")
-        return self.pcr_banks[algorithm][pcr_index].hex()
+    return {algo: verifier.get_bank(algo) for algo in verifier.pcr_banks}
 
 def main():
     verifier = PCRVerifier()
@@ -91,7 +45,7 @@ def main():
     
     try:
         # Verify the boot log
-        final_pcrs = verifier.verify_boot_log(boot_log_file)
+        final_pcrs = verify_boot_log(verifier, boot_log_file)
         
         # Print the final PCR values
         print("Final PCR values after processing boot log:")
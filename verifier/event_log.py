@@ -0,0 +1,153 @@
+"""
+Readers for the binary TPM event logs in an attestation bundle.
+
+Both logs are walked in place with struct.unpack_from over a memoryview of
+the bundle member (or any other buffer), so records are not copied until a
+field is actually used. Malformed logs raise EventLogError.
+
+    secure_boot   TCG2 firmware event log (/sys/kernel/security/tpm0/binary_bios_measurements)
+    measurements  IMA binary measurement list (/sys/kernel/security/ima/binary_runtime_measurements)
+"""
+import struct
+from typing import Iterator, NamedTuple
+
+# TPM2_ALG_ID of the banks PCRVerifier knows
+ALGORITHMS = {
+    0x0004: "sha1",
+    0x000B: "sha256",
+    0x000C: "sha384",
+    0x000D: "sha512",
+}
+EV_NO_ACTION = 0x00000003
+SPEC_ID_SIGNATURE = b"Spec ID Event03\x00"
+
+_u16 = struct.Struct("<H")
+_u32 = struct.Struct("<I")
+_event_header = struct.Struct("<II")
+_agile_header = struct.Struct("<III")
+
+
+class EventLogError(ValueError):
+    """An event log that is truncated or does not follow its format."""
+
+
+class BootEvent(NamedTuple):
+    pcr_index: int
+    event_type: int
+    # (algorithm name or TPM2_ALG_ID when unknown, digest)
+    digests: tuple
+    event_data: memoryview
+
+
+class ImaRecord(NamedTuple):
+    # byte offset just past this record, usable as a resume point
+    end: int
+    pcr_index: int
+    template_hash: bytes
+    template_name: bytes
+    template_data: memoryview
+
+
+def _parse_spec_id(event_data: memoryview) -> dict:
+    """Digest size per TPM2_ALG_ID from a Spec ID Event03 (TCG PC Client PFP, TCG_EfiSpecIDEvent)."""
+    # signature[16], platformClass u32, versions and uintnSize u8 x 4
+    count = _u32.unpack_from(event_data, 24)[0]
+    sizes = {}
+    for i in range(count):
+        algorithm_id = _u16.unpack_from(event_data, 28 + 4 * i)[0]
+        sizes[algorithm_id] = _u16.unpack_from(event_data, 30 + 4 * i)[0]
+    return sizes
+
+
+def iter_boot_events(buf) -> Iterator[BootEvent]:
+    """
+    Walk a firmware event log. The first event always uses the SHA1 TCG 1.2
+    layout; when it is a Spec ID Event03 the rest are crypto-agile events with
+    one digest per bank listed in it.
+    """
+    view = memoryview(buf)
+    length = len(view)
+    if not length:
+        return
+
+    start = 0
+    try:
+        pcr_index, event_type = _event_header.unpack_from(view, 0)
+        event_size = _u32.unpack_from(view, 28)[0]
+        event_data = view[32 : 32 + event_size]
+        offset = 32 + event_size
+        if offset > length:
+            raise EventLogError(f"truncated boot event at offset {start}")
+        yield BootEvent(pcr_index, event_type, (("sha1", bytes(view[8:28])),), event_data)
+
+        digest_sizes = None
+        if event_type == EV_NO_ACTION and bytes(event_data[:16]) == SPEC_ID_SIGNATURE:
+            digest_sizes = _parse_spec_id(event_data)
+
+        while offset < length:
+            start = offset
+            if digest_sizes is None:
+                pcr_index, event_type = _event_header.unpack_from(view, offset)
+                digests = (("sha1", bytes(view[offset + 8 : offset + 28])),)
+                offset += 28
+            else:
+                pcr_index, event_type, digest_count = _agile_header.unpack_from(view, offset)
+                offset += 12
+                digests = []
+                for _ in range(digest_count):
+                    algorithm_id = _u16.unpack_from(view, offset)[0]
+                    size = digest_sizes.get(algorithm_id)
+                    if size is None:
+                        raise EventLogError(
+                            f"boot event at offset {start} has a digest of algorithm 0x{algorithm_id:04x}, "
+                            "which the Spec ID event does not list"
+                        )
+                    digests.append((ALGORITHMS.get(algorithm_id, algorithm_id), bytes(view[offset + 2 : offset + 2 + size])))
+                    offset += 2 + size
+                digests = tuple(digests)
+            event_size = _u32.unpack_from(view, offset)[0]
+            event_data = view[offset + 4 : offset + 4 + event_size]
+            offset += 4 + event_size
+            if offset > length:
+                raise EventLogError(f"truncated boot event at offset {start}")
+            yield BootEvent(pcr_index, event_type, digests, event_data)
+    except struct.error as error:
+        raise EventLogError(f"truncated boot event at offset {start}") from error
+
+
+def iter_ima_records(buf, offset: int = 0) -> Iterator[ImaRecord]:
+    """Walk an IMA binary measurement list (SHA1 template hashes) from offset."""
+    view = memoryview(buf)
+    length = len(view)
+    while offset < length:
+        start = offset
+        try:
+            pcr_index = _u32.unpack_from(view, offset)[0]
+            template_hash = bytes(view[offset + 4 : offset + 24])
+            name_length = _u32.unpack_from(view, offset + 24)[0]
+            template_name = bytes(view[offset + 28 : offset + 28 + name_length])
+            offset += 28 + name_length
+            data_length = _u32.unpack_from(view, offset)[0]
+        except struct.error as error:
+            raise EventLogError(f"truncated IMA record at offset {start}") from error
+        template_data = view[offset + 4 : offset + 4 + data_length]
+        offset += 4 + data_length
+        if offset > length:
+            raise EventLogError(f"truncated IMA record at offset {start}")
+        yield ImaRecord(offset, pcr_index, template_hash, template_name, template_data)
+
+
+def parse_ima_ng(template_data) -> tuple[bytes, bytes]:
+    """File data hash and file name of an ima-ng template (d-ng|n-ng)."""
+    try:
+        hash_length = _u32.unpack_from(template_data, 0)[0]
+        name_length = _u32.unpack_from(template_data, 4 + hash_length)[0]
+    except struct.error as error:
+        raise EventLogError("truncated ima-ng template data") from error
+    if 8 + hash_length + name_length > len(template_data):
+        raise EventLogError("truncated ima-ng template data")
+    hash_field = bytes(template_data[4 : 4 + hash_length])
+    algorithm_length = hash_field.find(b"\x00")
+    data_hash = hash_field[algorithm_length + 1 :] if algorithm_length >= 0 else b""
+    name = bytes(template_data[8 + hash_length : 8 + hash_length + name_length - 1])
+    return data_hash, name
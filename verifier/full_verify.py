@@ -2,285 +2,276 @@
 
 import argparse
 import hashlib
-import yaml
-import struct
 import ecdsa
-import os
+import io
 import re
 import tempfile
+import uuid
 import zipfile
-import shutil
-
-class PCRVerifier:
-    def __init__(self):
-        self.pcr_banks = {
-            'sha1': {},
-            'sha256': {},
-            'sha384': {},
-            'sha512': {}
-        }
-        self.initialize_pcrs()
-
-    def initialize_pcrs(self):
-        """Initialize all PCRs to zero for each hash algorithm."""
-        for bank in self.pcr_banks.keys():
-            for pcr in range(24):  # TPM typically has PCRs 0-23
-                if bank == 'sha1':
-                    self.pcr_banks[bank][pcr] = b'\x00' * 20
-                elif bank == 'sha256':
-                    self.pcr_banks[bank][pcr] = b'\x00' * 32
-                elif bank == 'sha384':
-                    self.pcr_banks[bank][pcr] = b'\x00' * 48
-                elif bank == 'sha512':
-                    self.pcr_banks[bank][pcr] = b'\x00' * 64
-
-    def extend_pcr(self, pcr_index: int, algorithm: str, digest: str) -> None:
-        """
-        Extend a PCR with a new measurement.
-        
-        Args:
-            pcr_index: The index of the PCR to extend
-            algorithm: The hash algorithm to use (sha1, sha256, sha384, or sha512)
-            digest: The hex string of the digest to extend with
-        """
-        if algorithm not in self.pcr_banks:
-            raise ValueError(f"Unsupported hash algorithm: {algorithm}")
-        
-        current_value = self.pcr_banks[algorithm][pcr_index]
-        digest_bytes = bytes.fromhex(digest)
-        
-        # Create a new hash object of the specified algorithm
-        hasher = getattr(hashlib, algorithm)()
-        # Extend is defined as: PCRnew = Hash(PCRold || digest)
-        hasher.update(current_value + digest_bytes)
-        
-        # Update the PCR with the new value
-        self.pcr_banks[algorithm][pcr_index] = hasher.digest()
-
-    def get_pcr_value(self, pcr_index: int, algorithm: str) -> bytes:
-        """Get the current value of a PCR as a hex string."""
-        if algorithm not in self.pcr_banks:
-            raise ValueError(f"Unsupported hash algorithm: {algorithm}")
-        return self.pcr_banks[algorithm][pcr_index]
-
-def parse_ima_ng(data_bytes: bytes):
-    data_hash_length = struct.unpack("<I", data_bytes[:4])[0]
-    data_hash_algorithm = data_bytes[4 : 4 + data_hash_length].split(b"\x00")[0]
-    data_hash = data_bytes[4 + len(data_hash_algorithm) + 1 : 4 + data_hash_length]
-    name_length = struct.unpack("<I", data_bytes[4 + data_hash_length : 4 + data_hash_length + 4])[0]
-    name = data_bytes[4 + data_hash_length + 4 : 4 + data_hash_length + 4 + name_length - 1]
-    return data_hash, name
+from typing import Dict, Optional
+
+from audit_log import verify_audit_log
+from event_log import EV_NO_ACTION, iter_boot_events, iter_ima_records, parse_ima_ng
+from pcr import PCRVerifier
+from verify_cache import DEFAULT_CACHE_PATH, boot_key, get_cache, members_digest, quote_key
+
+
+class VerificationError(ValueError):
+    """A bundle that fails one of the checks (raised rather than asserted, python -O strips asserts)."""
+
+
+def verify_boot_log(secure_boot: bytes, expected_pcr_values: list) -> None:
+    """Check the kernel command line in the binary boot log and replay it against PCR 0-9."""
+    # only the sha1 bank is quoted, the other banks are not replayed
+    verifier = PCRVerifier(["sha1"])
+    chains = {}
+
+    # this is a terrible business logic but this is a hackathon
+    secure = False
+    events = iter_boot_events(secure_boot)
+    # the first event is the Spec ID header, never extended
+    next(events, None)
+    for event in events:
+        if not secure:
+            event_data = bytes(event.event_data)
+            if event_data.isascii() and SECURE_CMDLINE.search(event_data):
+                secure = True
+        if event.event_type == EV_NO_ACTION:
+            continue
+        for algo, digest in event.digests:
+            if algo == "sha1":
+                chains.setdefault(event.pcr_index, []).append(digest)
+    if not secure:
+        raise VerificationError("secure boot logs did not indicate lsm=integrity ima_policy=tcb")
+
+    verifier.replay("sha1", chains)
+    for i in range(10):
+        calculated_pcr_value = verifier.get_pcr_value(i, "sha1")
+        expected_pcr_value = expected_pcr_values[i]
+        if calculated_pcr_value != expected_pcr_value:
+            raise VerificationError(f"PCR{i:02d} does not match the boot log")
+
+    print("PCR is consistent with boot log")
 
 proof_file_location = None
 rofiles = [b"/etc/audit/rules.d/audit.rules",
            b"/var/log/audit/audit.log"]
+SECURE_CMDLINE = re.compile(rb"/boot/vmlinuz.*lsm=integrity ima_policy=tcb")
+IMA_PCRS = range(10, 13)
+
+def replay_measurements(measurements: bytes, expected_pcr_values: list, checkpoint: dict = None):
+    """
+    Replay the IMA measurement log until PCR 10-12 match the quote.
+
+    Only PCRs that have not matched yet are compared, and only after a record
+    extends them; the replay stops at the record that makes the last one
+    match. When checkpoint covers a prefix of measurements, replay resumes
+    after it instead of starting from all-zero PCRs.
+
+    Returns latest_file_hashes, the checkpoint for the next run (taken where
+    the last PCR matched) and, per PCR, the index of the last record its
+    quoted value includes (-1 when it includes none).
+    """
+    verifier = PCRVerifier(["sha1"])
+    latest_file_hashes = dict()
+    offset = 0
+    count = 0
+
+    if checkpoint is not None:
+        prefix = memoryview(measurements)[:checkpoint["offset"]]
+        if len(prefix) == checkpoint["offset"] and hashlib.sha256(prefix).hexdigest() == checkpoint["prefix_hash"]:
+            offset = checkpoint["offset"]
+            count = checkpoint["count"]
+            for i, value in checkpoint["pcrs"].items():
+                verifier.set_pcr_value(int(i), "sha1", bytes.fromhex(value))
+            latest_file_hashes = {bytes.fromhex(name): bytes.fromhex(value) for name, value in checkpoint["file_hashes"].items()}
+            print(f"Resuming measurement log after record {count}")
+        else:
+            print("Measurement log does not extend the checkpoint, replaying in full")
+
+    # PCRs without (new) records may already hold the quoted value
+    matched_at = {}
+    unmatched = {}
+    for i in IMA_PCRS:
+        if verifier.get_pcr_value(i, "sha1") == expected_pcr_values[i]:
+            matched_at[i] = count - 1
+        else:
+            unmatched[i] = expected_pcr_values[i]
+    if not unmatched:
+        return latest_file_hashes, checkpoint, matched_at
+
+    for record in iter_ima_records(measurements, offset):
+        pcr_index = record.pcr_index
+        template_data_hash = record.template_hash
+        template_data = record.template_data
+        count += 1
+
+        if pcr_index in matched_at:
+            continue
+
+        if record.template_name == b"ima-ng":
+            file_data_hash, file_name = parse_ima_ng(template_data)
+            if file_data_hash != b"\x00" * 20:
+                latest_file_hashes[file_name] = file_data_hash
+            if pcr_index == 11 and file_name in rofiles:
+                raise VerificationError(f"Illegal edit detected! {file_name.decode(errors='replace')}")
+
+        hash_algorithm = hashlib.sha1()
+        hash_algorithm.update(template_data)
+        actual_hash = hash_algorithm.digest()
+        if template_data_hash != actual_hash and template_data_hash != b"\x00" * 20:
+            raise VerificationError(f"template hash of measurement record {count - 1} does not match its data")
+
+        # This is an important undocumented quirk I found when looking at 
+        actual_extension = b"\xff" * 20 if template_data_hash == b"\x00" * 20 else template_data_hash
+        verifier.extend(pcr_index, "sha1", actual_extension)
+
+        expected_pcr_value = unmatched.get(pcr_index)
+        if expected_pcr_value is None or verifier.get_pcr_value(pcr_index, "sha1") != expected_pcr_value:
+            continue
+        matched_at[pcr_index] = count - 1
+        del unmatched[pcr_index]
+        if not unmatched:
+            next_checkpoint = {
+                "offset": record.end,
+                "count": count,
+                "prefix_hash": hashlib.sha256(memoryview(measurements)[:record.end]).hexdigest(),
+                "pcrs": {i: verifier.get_pcr_value(i, "sha1").hex() for i in IMA_PCRS},
+                "file_hashes": {name.hex(): value.hex() for name, value in latest_file_hashes.items()},
+            }
+            return latest_file_hashes, next_checkpoint, matched_at
+
+    raise VerificationError(f"measurement log does not reproduce PCRs {sorted(unmatched)}")
+
+BUNDLE_MEMBERS = (
+    "tpm2_pcr_data",
+    "tpm2_pcr_message",
+    "tpm2_pcr_signature",
+    "signing_key.pem",
+    "secure_boot",
+    "measurements",
+    "audit.rules",
+    "audit_log.txt",
+)
+
+
+def read_bundle(source) -> Dict[str, bytes]:
+    """Members of a bundle given as a zip path, the zip as bytes or an open ZipFile, read without extracting."""
+    if isinstance(source, zipfile.ZipFile):
+        return {member: source.read(member) for member in BUNDLE_MEMBERS}
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    with zipfile.ZipFile(source, "r") as zf:
+        return read_bundle(zf)
+
+
+def verify_bundle(source, cache_path: Optional[str] = DEFAULT_CACHE_PATH) -> dict:
+    """
+    Verify an attestation bundle produced by export_signature.sh, raising on
+    the first failed check. Every call works on its own in-memory copy of the
+    members, so bundles can be verified in parallel threads. Pass
+    cache_path=None to run every check.
+    """
+    bundle_id = uuid.uuid4().hex
+    members = read_bundle(source)
+    print(f"===Bundle {bundle_id}===")
+
+    pcr_data = members["tpm2_pcr_data"]
+    expected_pcr_values = []
+    print("===PCR Report===")
+    for i in range(13):
+        print(f"PCR{i:02d}: {pcr_data[20 * i: 20 * i + 20].hex()}")
+        expected_pcr_values.append(pcr_data[20 * i: 20 * i + 20])
+    print("===END PCR Report===")
+
+    pcr_summary = members["tpm2_pcr_message"]
+
+    quote_hash_algorithm = hashlib.sha256
+    calculated_pcr_hash = quote_hash_algorithm()
+    calculated_pcr_hash.update(pcr_data)
+    calculated_pcr_hash = calculated_pcr_hash.digest()
+
+    expected_pcr_hash = pcr_summary[-len(calculated_pcr_hash):]
+    if calculated_pcr_hash != expected_pcr_hash:
+        raise VerificationError("PCR data does not match the digest in the quote")
+    print("PCR banks match quote")
+
+    cache = None if cache_path is None else get_cache(cache_path)
+    quote = quote_key(pcr_summary, pcr_data)
+    unsigned_members = members_digest(*(
+        members[member]
+        for member in ("tpm2_pcr_signature", "signing_key.pem", "measurements", "audit.rules", "audit_log.txt")
+    ))
+    if cache is not None and cache.verdict(quote, unsigned_members):
+        print("Quote and bundle already verified, reusing verdict")
+        return {"bundle": bundle_id, "cached": True, "matched_at": None}
+
+    verifying_key = ecdsa.VerifyingKey.from_pem(members["signing_key.pem"])
+    signature = members["tpm2_pcr_signature"]
+
+    verifying_key.verify(signature, pcr_summary, hashfunc=quote_hash_algorithm, sigdecode=ecdsa.util.sigdecode_der)
+    print("signature of quote verified against key")
+
+    if cache is not None and cache.boot_verified(boot_key(pcr_data)):
+        print("Boot PCRs unchanged since a verified boot log, skipping replay")
+    else:
+        verify_boot_log(members["secure_boot"], expected_pcr_values)
+        if cache is not None:
+            cache.add_boot(boot_key(pcr_data))
+
+    # Validate Measurement Log, resuming from the last verified prefix when the log still starts with it
+    host = hashlib.sha256(members["signing_key.pem"]).hexdigest()
+    checkpoint = cache.checkpoint(host) if cache is not None else None
+    latest_file_hashes, checkpoint, matched_at = replay_measurements(members["measurements"], expected_pcr_values, checkpoint)
+
+    print("Measurement log hash values match!")
+    for i, index in sorted(matched_at.items()):
+        print(f"PCR{i:02d} matched at record {index}")
+
+    audit_rules_hash = hashlib.sha256()
+    audit_rules_hash.update(members["audit.rules"])
+    audit_rules_hash = audit_rules_hash.digest()
+    if audit_rules_hash != latest_file_hashes.get(b"/etc/audit/rules.d/audit.rules"):
+        raise VerificationError("audit rules do not match their measurement")
+    
+    print("Audit rules verified")
+
+    previous_audit_log = cache.audit_log(host) if cache is not None else None
+    audit_log_hash = latest_file_hashes.get(b"/var/log/audit/audit.log")
+    if audit_log_hash is None:
+        raise VerificationError("audit log was never measured")
+    audit_log_state = verify_audit_log(members["audit_log.txt"], audit_log_hash, previous_audit_log)
+    print("Audit log verified!")
+
+    if cache is not None:
+        cache.add_checkpoint(host, checkpoint)
+        cache.add_audit_log(host, audit_log_state)
+        cache.add_verdict(quote, unsigned_members)
+        # one write for the boot state, checkpoint, audit log state and verdict
+        cache.save()
+
+    # TODO add business logic
+
+    print(f"{verifying_key=}")
+    return {"bundle": bundle_id, "cached": False, "matched_at": matched_at}
+
+
 def main():
     parser = argparse.ArgumentParser(description="Verify a measurement archive produced by export_signature.sh")
     parser.add_argument("zipfile", help="Path to the measurements zip file")
-    parser.add_argument("--keep", action="store_true", help="Keep extracted temporary folder (for debugging)")
+    parser.add_argument("--keep", action="store_true", help="Also extract the archive to a temporary folder (for debugging)")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="Verification cache file")
+    parser.add_argument("--no-cache", action="store_true", help="Always run every check")
     args = parser.parse_args()
 
-    # create temporary extraction directory
-    tempdir = tempfile.mkdtemp(prefix="full_verify_")
-    try:
-        # safely extract zip into tempdir
+    if args.keep:
+        tempdir = tempfile.mkdtemp(prefix="full_verify_")
         with zipfile.ZipFile(args.zipfile, 'r') as zf:
             zf.extractall(path=tempdir)
+        print(f"Kept extracted folder: {tempdir}")
 
-        bootroot = tempdir
-
-        verifier = PCRVerifier()
-
-        pcr_data = open(f"{bootroot}/tpm2_pcr_data", "rb").read()
-        expected_pcr_values = []
-        print("===PCR Report===")
-        for i in range(13):
-            print(f"PCR{i:02d}: {pcr_data[20 * i: 20 * i + 20].hex()}")
-            expected_pcr_values.append(pcr_data[20 * i: 20 * i + 20])
-        print("===END PCR Report===")
-
-        pcr_summary = open(f"{bootroot}/tpm2_pcr_message", "rb").read()
-
-        quote_hash_algorithm = hashlib.sha256
-        calculated_pcr_hash = quote_hash_algorithm()
-        calculated_pcr_hash.update(pcr_data)
-        calculated_pcr_hash = calculated_pcr_hash.digest()
-
-        expected_pcr_hash = pcr_summary[-len(calculated_pcr_hash):]
-        assert(calculated_pcr_hash == expected_pcr_hash)
-        print("PCR banks match quote")
-
-        verifying_key = open(f"{bootroot}/signing_key.pem", "rb").read()
-        verifying_key = ecdsa.VerifyingKey.from_pem(verifying_key)
-
-        signature = open(f"{bootroot}/tpm2_pcr_signature", "rb").read()
-
-        verifying_key.verify(signature, pcr_summary, hashfunc=quote_hash_algorithm, sigdecode=ecdsa.util.sigdecode_der)
-        print("signature of quote verified against key")
-
-        # Ensure boot logs have valid hashes and such
-        with open(f"{bootroot}/secure_boot", "rb") as secure_boot:
-            pcr_index = struct.unpack("<I", secure_boot.read(4))[0]
-            # print(f"{pcr_index=}")
-            event_type = struct.unpack("<I", secure_boot.read(4))[0]
-            # print(f"{event_type=}")
-            initial_digest =  secure_boot.read(20)
-            # print(f"{initial_digest=}")
-            event_size = struct.unpack("<I", secure_boot.read(4))[0]
-            # print(f"{event_size=}")
-            event_data = secure_boot.read(event_size)
-            # print(f"{event_data.hex()=}")
-
-            secure = False
-            while secure_boot.read(1):
-                secure_boot.seek(-1, os.SEEK_CUR)
-                pcr_index = struct.unpack("<I", secure_boot.read(4))[0]
-                # print(f"{pcr_index=}")
-                event_type = struct.unpack("<I", secure_boot.read(4))[0]
-                # print(f"{event_type=}")
-                digest_count = struct.unpack("<I", secure_boot.read(4))[0]
-                # print(f"{digest_count=}")
-                digest_dump = secure_boot.read(172)
-                # print(f"{digest_dump.hex()=}")
-                event_size = struct.unpack("<I", secure_boot.read(4))[0]
-                # print(f"{event_size=}")
-                event_data = secure_boot.read(event_size)
-                # this is a terrible business logic but this is a hackathon
-                try:
-                    if re.search("/boot/vmlinuz.*lsm=integrity ima_policy=tcb", event_data.decode(encoding="ascii")):
-                        secure = True
-                except:
-                    pass
-            assert secure, "secure boot logs did not indicate lsm=integrity ima_policy=tcb"
-
-
-        # Ensure that signature corresponds to data
-
-        secure_boot_logs = open(f"{bootroot}/secure_boot.yaml", "rb")
-        secure_boot_logs = yaml.safe_load(secure_boot_logs)
-
-        # Process each event in the log
-        for event in secure_boot_logs['events']:
-            pcr_index = event['PCRIndex']
-            
-            # Handle different digest formats in the log
-            if 'DigestCount' in event:
-                # Multiple digests per event
-                for digest_entry in event['Digests']:
-                    algo = digest_entry['AlgorithmId'].lower()
-                    if algo in verifier.pcr_banks:
-                        verifier.extend_pcr(pcr_index, algo, digest_entry['Digest'])
-        
-        for i in range(10):
-            calculated_pcr_value = verifier.get_pcr_value(i, "sha1")
-            expected_pcr_value = expected_pcr_values[i]
-            assert calculated_pcr_value == expected_pcr_value
-        
-        print("PCR is consistent with boot log")
-
-        # Validate Measurement Log
-        matches = set()
-        latest_file_hashes = dict()
-        with open(f"{bootroot}/measurements", "rb") as measurements_file:
-            # TODO add crypto business logic
-            while measurements_file.read(1):
-                measurements_file.seek(-1, os.SEEK_CUR)
-
-                pcr_index = struct.unpack("<I", measurements_file.read(4))[0]
-                template_data_hash = measurements_file.read(20)
-                template_name_length = struct.unpack("<I", measurements_file.read(4))[0]
-                template_name = measurements_file.read(template_name_length)
-                template_data_length = struct.unpack("<I", measurements_file.read(4))[0]
-                template_data = measurements_file.read(template_data_length)
-
-                if pcr_index in matches:
-                    continue
-
-                if template_name == b"ima-ng":
-                    file_data_hash, file_name = parse_ima_ng(template_data)
-                    # print(f"{file_data_hash.hex()=}")
-                    # print(f"{file_name=}")
-                    if file_data_hash != b"\x00" * 20:
-                        latest_file_hashes[file_name] = file_data_hash
-                    assert not (pcr_index == 11 and file_name in rofiles), "Illegal edit detected!"
-
-                hash_algorithm = hashlib.sha1()
-                hash_algorithm.update(template_data)
-                actual_hash = hash_algorithm.digest()
-
-                # print(f"{actual_hash.hex()=}")
-
-                # print(f"expected digest={template_data_hash}")
-                # print(f"actual   digest={actual_hash}")
-                assert template_data_hash == actual_hash or template_data_hash == b"\x00" * 20
-
-                # This is an important undocumented quirk I found when looking at 
-                actual_extension = b"\xff" * 20 if template_data_hash == b"\x00" * 20 else template_data_hash
-                verifier.extend_pcr(pcr_index, "sha1", actual_extension.hex())
-        
-                for i in range(10, 13):
-                    calculated_pcr_value = verifier.get_pcr_value(i, "sha1")
-                    expected_pcr_value = expected_pcr_values[i]
-                    if calculated_pcr_value == expected_pcr_value:
-                        matches.add(i)
-
-        assert matches == set(range(10, 13)), set(range(10, 13)) - matches
-
-        print("Measurement log hash values match!")
-
-        audit_rules = open(f"{bootroot}/audit.rules", "rb")
-        audit_rules = audit_rules.read()
-        audit_rules_hash = hashlib.sha256()
-        audit_rules_hash.update(audit_rules)
-        audit_rules_hash = audit_rules_hash.digest()
-        assert audit_rules_hash == latest_file_hashes[b"/etc/audit/rules.d/audit.rules"]
-        
-        print("Audit rules verified")
-
-        audit_log_hash = hashlib.sha256()
-        with open(f"{bootroot}/audit_log.txt", "rb") as audit_log_file:
-            while line := audit_log_file.readline():
-                audit_log_hash.update(line)
-                current_audit_log_hash = audit_log_hash.digest()
-                if current_audit_log_hash == latest_file_hashes[b"/var/log/audit/audit.log"]:
-                    break
-            else:
-                assert False, "audit log is not attested to!"
-        print("Audit log verified!")
-
-        # TODO add business logic
-
-        # print(verifier.get_pcr_value(1, "sha1"))
-        # print(verifier.get_pcr_value(2, "sha1"))
-        # print(verifier.get_pcr_value(3, "sha1"))
-        # print(verifier.get_pcr_value(4, "sha1"))
-        # print(verifier.get_pcr_value(5, "sha1"))
-        # print(verifier.get_pcr_value(6, "sha1"))
-        # print(verifier.get_pcr_value(7, "sha1"))
-        # print(verifier.get_pcr_value(8, "sha1"))
-        # print(verifier.get_pcr_value(9, "sha1"))
-
-        # with open("shared/imalog.txt", "r") as ima_log:
-        #     while line := ima_log.readline():
-        #         pcr_index, digest = line.split(" ")[:2]
-        #         pcr_index = int(pcr_index)
-        #         # digest = bytes.fromhex(digest)
-        #         verifier.extend_pcr(pcr_index, "sha1", digest)
-        # print(verifier.get_pcr_value(10, "sha1"))
-        # print(verifier.get_pcr_value(11, "sha1"))
-        # print(verifier.get_pcr_value(12, "sha1"))
-
-    # cleanup unless requested otherwise
-        print(f"{verifying_key=}")
-    finally:
-        if 'args' in locals() and getattr(args, 'keep', False):
-            print(f"Kept extracted folder: {tempdir}")
-        else:
-            try:
-                shutil.rmtree(tempdir)
-            except Exception:
-                pass
+    verify_bundle(args.zipfile, None if args.no_cache else args.cache)
 
 
 if __name__ == "__main__":
-    exit(main())
\ No newline at end of file
+    exit(main())
@@ -0,0 +1,174 @@
+"""
+Software PCR banks shared by the verifier scripts.
+
+Each bank is one bytearray holding every PCR of that algorithm back to back,
+hash constructors are looked up once, and digests are extended as raw bytes.
+extend_many() keeps a PCR's running value in a local while folding in a whole
+chain of digests, which is where replaying long logs spends its time.
+"""
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional
+
+DIGEST_SIZES = {
+    'sha1': 20,
+    'sha256': 32,
+    'sha384': 48,
+    'sha512': 64,
+}
+PCR_COUNT = 24  # TPM typically has PCRs 0-23
+
+
+class PCRVerifier:
+    def __init__(self, algorithms: Iterable[str] = DIGEST_SIZES, pcr_count: int = PCR_COUNT):
+        self.pcr_count = pcr_count
+        self.pcr_banks = {}
+        self._views = {}
+        self._sizes = {}
+        self._constructors = {}
+        for algorithm in algorithms:
+            if algorithm not in DIGEST_SIZES:
+                raise ValueError(f"Unsupported hash algorithm: {algorithm}")
+            self._sizes[algorithm] = DIGEST_SIZES[algorithm]
+            self._constructors[algorithm] = getattr(hashlib, algorithm)
+        self.initialize_pcrs()
+
+    def initialize_pcrs(self):
+        """Initialize all PCRs to zero for each hash algorithm."""
+        for algorithm, size in self._sizes.items():
+            self.pcr_banks[algorithm] = bytearray(size * self.pcr_count)
+            # fixed-size view, slice assignment through it never resizes the bank
+            self._views[algorithm] = memoryview(self.pcr_banks[algorithm])
+
+    def _slot(self, pcr_index: int, algorithm: str) -> slice:
+        if algorithm not in self.pcr_banks:
+            raise ValueError(f"Unsupported hash algorithm: {algorithm}")
+        if not 0 <= pcr_index < self.pcr_count:
+            raise IndexError(f"PCR index out of range: {pcr_index}")
+        size = self._sizes[algorithm]
+        return slice(pcr_index * size, (pcr_index + 1) * size)
+
+    def extend(self, pcr_index: int, algorithm: str, digest: bytes) -> None:
+        """Extend a PCR with one raw digest: PCRnew = Hash(PCRold || digest)."""
+        if algorithm not in self._sizes:
+            raise ValueError(f"Unsupported hash algorithm: {algorithm}")
+        if not 0 <= pcr_index < self.pcr_count:
+            raise IndexError(f"PCR index out of range: {pcr_index}")
+        size = self._sizes[algorithm]
+        start = pcr_index * size
+        view = self._views[algorithm]
+        hasher = self._constructors[algorithm](view[start : start + size])
+        hasher.update(digest)
+        view[start : start + size] = hasher.digest()
+
+    def extend_many(self, pcr_index: int, algorithm: str, digests: Iterable[bytes]) -> None:
+        """Extend a PCR with a chain of raw digests, in order."""
+        slot = self._slot(pcr_index, algorithm)
+        constructor = self._constructors[algorithm]
+        value = bytes(self._views[algorithm][slot])
+        for digest in digests:
+            value = constructor(value + digest).digest()
+        self._views[algorithm][slot] = value
+
+    def replay(self, algorithm: str, chains: Dict[int, Iterable[bytes]], workers: int = 0) -> None:
+        """
+        Extend several PCRs, each with its own chain of digests. Chains of
+        different PCRs are independent, so with workers > 0 they are replayed
+        on a thread pool. hashlib only drops the GIL for inputs of 2 KiB and up,
+        so this pays off for large digest chains spread over several PCRs
+        rather than for a single long chain.
+        """
+        if workers and len(chains) > 1:
+            with ThreadPoolExecutor(max_workers=min(workers, len(chains))) as pool:
+                for future in [pool.submit(self.extend_many, pcr_index, algorithm, digests) for pcr_index, digests in chains.items()]:
+                    future.result()
+            return
+        for pcr_index, digests in chains.items():
+            self.extend_many(pcr_index, algorithm, digests)
+
+    def get_pcr_value(self, pcr_index: int, algorithm: str) -> bytes:
+        """Get the current value of a PCR."""
+        return bytes(self.pcr_banks[algorithm][self._slot(pcr_index, algorithm)])
+
+    def set_pcr_value(self, pcr_index: int, algorithm: str, value: bytes) -> None:
+        """Load a PCR with a known intermediate value, e.g. from a checkpoint."""
+        slot = self._slot(pcr_index, algorithm)
+        if len(value) != slot.stop - slot.start:
+            raise ValueError(f"{algorithm} PCR values are {slot.stop - slot.start} bytes, got {len(value)}")
+        self._views[algorithm][slot] = value
+
+    def get_bank(self, algorithm: str) -> Dict[int, bytes]:
+        """All PCR values of one algorithm, by index."""
+        return {pcr_index: self.get_pcr_value(pcr_index, algorithm) for pcr_index in range(self.pcr_count)}
+
+
+def _benchmark_digests(count: int, size: int) -> list:
+    return [hashlib.sha512(i.to_bytes(8, "little")).digest()[:size] for i in range(count)]
+
+
+class _LegacyPCRVerifier:
+    """The dict-of-dicts, hex-digest PCRVerifier the verifier scripts used to copy."""
+
+    def __init__(self):
+        self.pcr_banks = {bank: {pcr: b"\x00" * size for pcr in range(PCR_COUNT)} for bank, size in DIGEST_SIZES.items()}
+
+    def extend_pcr(self, pcr_index: int, algorithm: str, digest: str) -> None:
+        if algorithm not in self.pcr_banks:
+            raise ValueError(f"Unsupported hash algorithm: {algorithm}")
+        current_value = self.pcr_banks[algorithm][pcr_index]
+        digest_bytes = bytes.fromhex(digest)
+        hasher = getattr(hashlib, algorithm)()
+        hasher.update(current_value + digest_bytes)
+        self.pcr_banks[algorithm][pcr_index] = hasher.digest()
+
+
+def benchmark(count: int = 200_000, algorithm: str = "sha1", pcrs: int = 3, workers: Optional[int] = 4) -> Dict[str, float]:
+    """Extends per second of the legacy per-call path and of the engine's APIs."""
+    import time
+
+    digests = _benchmark_digests(count, DIGEST_SIZES[algorithm])
+    hex_digests = [digest.hex() for digest in digests]
+    results = {}
+
+    legacy = _LegacyPCRVerifier()
+    start = time.perf_counter()
+    for digest in hex_digests:
+        legacy.extend_pcr(10, algorithm, digest)
+    results["legacy hex extend_pcr"] = count / (time.perf_counter() - start)
+    value = legacy.pcr_banks[algorithm][10]
+
+    verifier = PCRVerifier([algorithm])
+    start = time.perf_counter()
+    for digest in digests:
+        verifier.extend(10, algorithm, digest)
+    results["extend"] = count / (time.perf_counter() - start)
+    expected = verifier.get_pcr_value(10, algorithm)
+    assert expected == value
+
+    verifier = PCRVerifier([algorithm])
+    start = time.perf_counter()
+    verifier.extend_many(10, algorithm, digests)
+    results["extend_many"] = count / (time.perf_counter() - start)
+    assert verifier.get_pcr_value(10, algorithm) == expected
+
+    chains = {10 + i: digests[i::pcrs] for i in range(pcrs)}
+    for label, pool in (("replay serial", 0), (f"replay {workers} threads", workers)):
+        verifier = PCRVerifier([algorithm])
+        start = time.perf_counter()
+        verifier.replay(algorithm, chains, workers=pool)
+        results[f"{label} ({pcrs} PCRs)"] = count / (time.perf_counter() - start)
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="PCR extend microbenchmark")
+    parser.add_argument("--count", type=int, default=200_000, help="Digests to extend")
+    parser.add_argument("--algorithm", default="sha1", choices=sorted(DIGEST_SIZES))
+    parser.add_argument("--pcrs", type=int, default=3, help="Independent PCR chains for replay")
+    parser.add_argument("--workers", type=int, default=4, help="Threads for the parallel replay")
+    args = parser.parse_args()
+
+    for name, rate in benchmark(args.count, args.algorithm, args.pcrs, args.workers).items():
+        print(f"{name:<32} {rate:>14,.0f} extends/s")
@@ -0,0 +1,154 @@
+"""
+Cache of full_verify results across runs.
+
+Boot state only changes on reboot, so once a boot log has replayed to a given
+set of PCR 0-9 values, later quotes with the same boot PCRs skip the boot log
+replay. A bundle whose quote, PCR 0-12 values and remaining members were
+already verified reuses the whole verdict, and the IMA replay of each host
+resumes from the checkpoint of its last verified log prefix, as does the
+audit log check. Entries are kept in an in-process LRU backed by a JSON
+file, only successful verifications are cached. The add_* methods only update
+memory, save() writes the file once for all of them.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "trust-me-bro", "verify_cache.json")
+MAX_ENTRIES = 256
+
+
+def quote_key(pcr_message: bytes, pcr_data: bytes) -> str:
+    """Quote message hash plus the PCR 0-12 values it covers."""
+    return f"{hashlib.sha256(pcr_message).hexdigest()}:{pcr_data[:20 * 13].hex()}"
+
+
+def boot_key(pcr_data: bytes) -> str:
+    """PCR 0-9 values, extended only by firmware and the boot loader."""
+    return pcr_data[:20 * 10].hex()
+
+
+def members_digest(*members: bytes) -> str:
+    """Digest of the bundle members the quote does not sign directly."""
+    digest = hashlib.sha256()
+    for member in members:
+        digest.update(len(member).to_bytes(8, "little"))
+        digest.update(member)
+    return digest.hexdigest()
+
+
+class VerifyCache:
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        # held from snapshot to replace, so an older snapshot never replaces a newer file
+        self.save_lock = threading.Lock()
+        # bumped by every add, the file holds saved_generation
+        self.generation = 0
+        self.saved_generation = 0
+        # boot key -> True, quote key -> members digest, host key -> IMA checkpoint and audit log state
+        self.boot_states = OrderedDict()
+        self.verdicts = OrderedDict()
+        self.checkpoints = OrderedDict()
+        self.audit_logs = OrderedDict()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "r") as cache_file:
+                stored = json.load(cache_file)
+        except (OSError, ValueError):
+            return
+        with self.lock:
+            self.boot_states.update((key, True) for key in stored.get("boot_states", []))
+            self.verdicts.update(stored.get("verdicts", {}))
+            self.checkpoints.update(stored.get("checkpoints", {}))
+            self.audit_logs.update(stored.get("audit_logs", {}))
+
+    def save(self):
+        """Write the file if anything was added since the last save."""
+        with self.save_lock:
+            with self.lock:
+                generation = self.generation
+                if generation == self.saved_generation:
+                    return
+                stored = {
+                    "boot_states": list(self.boot_states),
+                    "verdicts": dict(self.verdicts),
+                    "checkpoints": dict(self.checkpoints),
+                    "audit_logs": dict(self.audit_logs),
+                }
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w") as cache_file:
+                json.dump(stored, cache_file)
+            os.replace(tmp_path, self.path)
+            self.saved_generation = generation
+
+    def _touch(self, entries: OrderedDict, key: str, value):
+        entries[key] = value
+        entries.move_to_end(key)
+        self.generation += 1
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def boot_verified(self, key: str) -> bool:
+        with self.lock:
+            if key not in self.boot_states:
+                return False
+            self.boot_states.move_to_end(key)
+            return True
+
+    def add_boot(self, key: str):
+        with self.lock:
+            self._touch(self.boot_states, key, True)
+
+    def verdict(self, key: str, digest: str) -> bool:
+        with self.lock:
+            if self.verdicts.get(key) != digest:
+                return False
+            self.verdicts.move_to_end(key)
+            return True
+
+    def add_verdict(self, key: str, digest: str):
+        with self.lock:
+            self._touch(self.verdicts, key, digest)
+
+    def checkpoint(self, key: str):
+        with self.lock:
+            if key not in self.checkpoints:
+                return None
+            self.checkpoints.move_to_end(key)
+            return self.checkpoints[key]
+
+    def add_checkpoint(self, key: str, checkpoint: dict):
+        with self.lock:
+            self._touch(self.checkpoints, key, checkpoint)
+
+    def audit_log(self, key: str):
+        with self.lock:
+            if key not in self.audit_logs:
+                return None
+            self.audit_logs.move_to_end(key)
+            return self.audit_logs[key]
+
+    def add_audit_log(self, key: str, state: dict):
+        with self.lock:
+            self._touch(self.audit_logs, key, state)
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(path: str = DEFAULT_CACHE_PATH) -> VerifyCache:
+    """One VerifyCache per file, shared by every verification in this process."""
+    with _caches_lock:
+        if path not in _caches:
+            _caches[path] = VerifyCache(path)
+        return _caches[path]
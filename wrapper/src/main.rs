@@ -1,5 +1,6 @@
 use axum::{
     Router,
+    body::Body,
     extract::{Json as ExtractJson, State},
     response::{Response},
     routing::{get},
@@ -10,21 +11,21 @@ use hyper::{Request, Uri};
 use regex::Regex;
 use serde::{Deserialize};
 
-use std::process::Command;
+use std::net::SocketAddr;
 use std::sync::Arc;
-use std::{net::SocketAddr, process::Stdio};
 
 use hyper_util::rt::TokioIo;
 use tokio::net::TcpStream;
-use tokio::sync::Mutex;
 use tokio::sync::oneshot;
-use tokio::time::{Duration, sleep};
 use std::fs::OpenOptions;
 use std::io::Write;
 
 #[derive(Clone)]
 struct AppState {
     models: Arc<Vec<(String, u16)>>,
+    sampler_port: u16,
+    // llama-server for models missing from the models list
+    model_port: u16,
 }
 
 #[tokio::main]
@@ -32,8 +33,11 @@ async fn main() {
     // Get command-line args
     let models_str = std::env::args().nth(1).expect("no file name");
     let port_no = std::env::args().nth(2).expect("no port no");
+    // telemetry sampler and llama-server, the launcher passes them from config.py
+    let sampler_port: u16 = std::env::args().nth(3).unwrap_or(String::from("3824")).parse().expect("Invalid sampler port");
+    let model_port: u16 = std::env::args().nth(4).unwrap_or(String::from("3222")).parse().expect("Invalid model port");
 
-    let re = Regex::new(r"([a-zA-Z]+),([0-9]+);").unwrap();
+    let re = Regex::new(r"([^,;]+),([0-9]+);").unwrap();
     let mut models = vec![];
 
     for cap in re.captures_iter(&models_str) {
@@ -44,6 +48,8 @@ async fn main() {
 
     let state = AppState {
         models: Arc::new(models),
+        sampler_port,
+        model_port,
     };
 
     let app = Router::new()
@@ -70,44 +76,99 @@ struct PushData {
 async fn push_handler(
     State(state): State<AppState>,
     ExtractJson(payload): ExtractJson<PushData>,
-) -> Response<String> {
+) -> Response<Body> {
     let (stop_tx, stop_rx) = oneshot::channel::<()>();
-    let mut port_no = 0;
-    for (model, port) in state.models.iter() {
-        if model == &payload.model {
-            port_no = *port;
-        }
-    }
+    let port_no = model_port(&state, &payload.model);
 
     let model_request = tokio::spawn(call_model(payload.original.clone(), port_no));
-    let nvidia_thread = tokio::spawn(nvidia(stop_rx, payload.uuid, payload.model, port_no, payload.original));
+    let nvidia_thread = tokio::spawn(nvidia(
+        stop_rx,
+        payload.uuid,
+        payload.model,
+        port_no,
+        payload.original,
+        state.sampler_port,
+    ));
+
+    let res = match model_request.await {
+        Ok(Ok(res)) => res,
+        result => {
+            // model server unreachable (502), or the request task panicked (500)
+            let status = match result {
+                Ok(Err(err)) => {
+                    println!("Model on port {} failed: {}", port_no, err);
+                    502
+                }
+                _ => 500,
+            };
+            let _ = stop_tx.send(()); //kills nvidia thread
+            let _ = nvidia_thread.await;
+            return axum::response::Response::builder()
+                .status(status)
+                .body(Body::empty())
+                .unwrap();
+        }
+    };
+
+    // forward the body frame by frame (stream: true replies are SSE chunks) and
+    // keep sampling until the model is done writing, not just until the headers
+    let status = res.status().as_u16();
+    let content_type = res
+        .headers()
+        .get(hyper::header::CONTENT_TYPE)
+        .and_then(|value| value.to_str().ok())
+        .unwrap_or("application/json")
+        .to_string();
+    let (mut body_tx, body) = Body::channel();
+    tokio::spawn(async move {
+        let mut upstream = res.into_body();
+        while let Some(frame) = upstream.frame().await {
+            match frame {
+                Ok(frame) => {
+                    if let Ok(data) = frame.into_data() {
+                        if body_tx.send_data(data).await.is_err() {
+                            // client went away, nothing left to forward to
+                            break;
+                        }
+                    }
+                }
+                Err(err) => {
+                    println!("Model stream failed: {:?}", err);
+                    body_tx.abort();
+                    break;
+                }
+            }
+        }
+        //end when the model is done
+        let _ = stop_tx.send(()); //kills nvidia thread
+        let _ = nvidia_thread.await;
+    });
 
-    //end when we get network
-    let res = model_request.await;
-    let _ = stop_tx.send(()); //kills nvidia thread
-    let _ = nvidia_thread.await;
+    axum::response::Response::builder()
+        .status(status)
+        .header("Content-Type", content_type)
+        .body(body)
+        .unwrap()
+}
 
-    if let Ok(res) = res {
-        axum::response::Response::builder()
-            .header("Content-Type", "application/json")
-            .body(
-                String::from_utf8(res.into_body().collect().await.unwrap().to_bytes().to_vec())
-                    .unwrap(),
-            )
-            .unwrap()
-    } else {
-        axum::response::Response::builder()
-            .status(500)
-            .body(String::from(""))
-            .unwrap()
-    }
+/// Port of the llama-server serving model, from the "name,port;" models list.
+fn model_port(state: &AppState, model: &str) -> u16 {
+    state
+        .models
+        .iter()
+        .find(|(name, _)| name == model)
+        .map(|(_, port)| *port)
+        .unwrap_or(state.model_port)
 }
 
-async fn call_model(original: String, model_port: u16) -> hyper::Response<Incoming> {
-    //let stream = TcpStream::connect(format!("localhost:{}", model_port))
-    let stream = TcpStream::connect("localhost:3222").await.unwrap();
+async fn call_model(original: String, model_port: u16) -> Result<hyper::Response<Incoming>, String> {
+    let stream = TcpStream::connect(format!("localhost:{}", model_port))
+        .await
+        .map_err(|err| format!("connect: {:?}", err))?;
     let io = TokioIo::new(stream);
-    let (mut sender, conn) = hyper::client::conn::http1::handshake(io).await.unwrap();
+    let (mut sender, conn) = hyper::client::conn::http1::handshake(io)
+        .await
+        .map_err(|err| format!("handshake: {:?}", err))?;
     tokio::task::spawn(async move {
         if let Err(err) = conn.await {
             println!("Connection failed: {:?}", err);
@@ -126,164 +187,69 @@ async fn call_model(original: String, model_port: u16) -> hyper::Response<Incomi
         .unwrap();
 
     // Await the response...
-    let res = sender.send_request(req).await.unwrap();
+    let res = sender
+        .send_request(req)
+        .await
+        .map_err(|err| format!("request: {:?}", err))?;
 
     println!("Model Response status: {}", res.status());
-    res.into()
+    Ok(res)
 }
 
 async fn nvidia(
-    mut stop_rx: tokio::sync::oneshot::Receiver<()>,
+    stop_rx: tokio::sync::oneshot::Receiver<()>,
     uuid: String,
     model: String,
     _port: u16,
-    payload: String
+    payload: String,
+    sampler_port: u16,
 ) {
-    println!("started query for nvidia");
-
-    /*
-    let mut ss = Command::new("ss");
-    ss.arg("-lptn");
-    ss.arg(format!("'sport= :{}'", port));
-
-    // get pid
-    let output = ss.output().expect("couldn't find port");
-    let output_s = String::from_utf8(output.stdout).unwrap();
-    let re = Regex::new(r"pid=(\d+)").unwrap();
-    let pid = re
-        .captures_iter(&output_s)
-        .next()
-        .expect("no pid found")
-        .get(0)
-        .expect("no pid found")
-        .as_str();
-
-    let mut smi = Command::new("nvidia-smi");
-    smi.arg("--query-gpu=uuid,name,utilization.gpu,utilization.memory,memory.used,power.draw,temperature.gpu");
-    smi.arg("--format=csv,noheader,nounits");
-    smi.arg(format!("--query-compute-apps={}", pid));
-    */
-
-    let url = "http://localhost:3823/metrics".parse::<Uri>().unwrap();
-    let url_finished = "http://localhost:3823/finished".parse::<Uri>().unwrap();
-
-    let mutex = Mutex::new(0);
-
-    let test = async || {
-        println!("---profiling---");
-        let mut ts = Command::new("tegrastats")
-            .arg("--interval")
-            .arg("1")
-            .stdout(Stdio::piped())
-            .spawn().unwrap();
-        /*
-        let mut ts = Command::new("echo")
-            .arg("'11-09-2025 00:00:29 RAM 3058/7620MB (lfb 37x4MB) CPU [somestuff] GR 12% cpu soc soc gpu tj soc VDDIN 5080mW/5080mW VDD_CPU 603mW/603mW VDD_SOC 1449mW/1449mW'")
-            .stdout(Stdio::piped())
-            .spawn().unwrap();
-        */
-
-        let head = Command::new("head")
-            .arg("-n")
-            .arg("1")
-            .stdin(Stdio::from(ts.stdout.take().unwrap()))
-            .stdout(Stdio::piped())
-            .spawn()
-            .unwrap();
-
-        let output = head.wait_with_output().unwrap();
-        let ts_out = str::from_utf8(&output.stdout).unwrap();
-
-        let items: Vec<&str> = ts_out.split(" ").collect();
-        let rams_s: &str = items.get(3).unwrap();
-        let nums: Vec<f64> = rams_s[..rams_s.find('M').unwrap()]
-            .split('/')
-            .map(|x| x.parse::<f64>().unwrap())
-            .collect();
-        let ram = nums[0] / nums[1];
-        let gpu = items
-            .get(9)
-            .unwrap()
-            .trim_end_matches('%')
-            .parse::<f64>()
-            .unwrap()
-            / 100.0;
-        let draw_s: &str = items.get(21).unwrap();
-        let draw = draw_s[..draw_s.find('m').unwrap()].parse::<f64>().unwrap();
-
-        // 3 is ram
-        // 8 is GPU utilization
-        // 16 is VIN
-        // 20 is VDD_SOC
-
-        let stream = TcpStream::connect("localhost:3823").await.unwrap();
-        let io = TokioIo::new(stream);
-        let (mut sender, conn) = hyper::client::conn::http1::handshake(io).await.unwrap();
-        tokio::task::spawn(async move {
-            if let Err(err) = conn.await {
-                println!("Connection failed: {:?}", err);
-            }
-        });
-        let authority = url.authority().unwrap().clone();
-        let report = format!(
-            "{{\"gpuUtilization\": {}, \"vramUsage\": {}, \"powerDraw\": {}, \"uuid\": {{\"userID\": \"{}\", \"model\": \"{}\"}}}}",
-            gpu, ram, draw, uuid, model
-        );
-        write_trace_file(format!("{}", report)).unwrap();
-
-        println!("nvidia report: {}", report);
-
-        // Create an HTTP request with an empty body and a HOST header
-        let req = Request::builder()
-            .method("POST")
-            .uri("/metrics")
-            .header(hyper::header::HOST, authority.as_str())
-            .header(hyper::header::CONTENT_TYPE, "application/json")
-            .body(http_body_util::Full::new(Bytes::from(report)))
-            .unwrap();
-
-        // Await the response...
-        let mut lock = mutex.lock().await;
-        let res = sender.send_request(req).await.unwrap();
-
-        *lock += 1;
+    // the host-wide sampler reads the counters, this request only opens and
+    // closes its window, the sampler sends the rows in it to the tmb server
+    println!("opening telemetry window");
+    let start = serde_json::json!({"userID": uuid, "model": model}).to_string();
+    post_sampler(sampler_port, "/sessions/start", start).await;
+
+    let _ = stop_rx.await;
+    println!("closing telemetry window");
+
+    //writes stuff to file
+    write_trace_file(format!("{}", payload)).unwrap();
+    let finish = serde_json::json!({"userID": uuid}).to_string();
+    post_sampler(sampler_port, "/sessions/finish", finish).await;
+}
 
-        println!("Nvidia Response status: {}", res.status());
+async fn post_sampler(sampler_port: u16, path: &str, body: String) {
+    let stream = match TcpStream::connect(format!("localhost:{}", sampler_port)).await {
+        Ok(stream) => stream,
+        Err(err) => {
+            println!("Sampler unreachable: {:?}", err);
+            return;
+        }
     };
-
-    loop {
-        tokio::select! {
-            _ = &mut stop_rx => {
-                println!("killing nvidia query");
-                test().await;
-
-                let stream = TcpStream::connect("localhost:3823").await.unwrap();
-                let io = TokioIo::new(stream);
-                let (mut sender, conn) = hyper::client::conn::http1::handshake(io).await.unwrap();
-                tokio::task::spawn(async move {
-                    if let Err(err) = conn.await {
-                        println!("Connection failed: {:?}", err);
-                    }
-                });
-                let authority = url_finished.authority().unwrap().clone();
-                let req = Request::builder()
-                    .method("POST")
-                    .uri("/finished")
-                    .header(hyper::header::HOST, authority.as_str())
-                    .header(hyper::header::CONTENT_TYPE, "application/json")
-                    .body(http_body_util::Full::new(Bytes::from(format!("{{\"userID\": \"{}\"}}", uuid)))).unwrap();
-
-                //writes stuff to file 
-                write_trace_file(format!("{}", payload)).unwrap();
-                let mut lock = mutex.lock().await;
-                let _res = sender.send_request(req).await.unwrap();
-                *lock += 1;
-                break;
-            }
-            _ = sleep(Duration::from_secs(1)) => {
-                test().await;
-            }
+    let io = TokioIo::new(stream);
+    let (mut sender, conn) = match hyper::client::conn::http1::handshake(io).await {
+        Ok(handshake) => handshake,
+        Err(err) => {
+            println!("Sampler handshake failed: {:?}", err);
+            return;
+        }
+    };
+    tokio::task::spawn(async move {
+        if let Err(err) = conn.await {
+            println!("Connection failed: {:?}", err);
         }
+    });
+    let req = Request::builder()
+        .method("POST")
+        .uri(path)
+        .header(hyper::header::HOST, format!("localhost:{}", sampler_port))
+        .header(hyper::header::CONTENT_TYPE, "application/json")
+        .body(http_body_util::Full::new(Bytes::from(body)))
+        .unwrap();
+    match sender.send_request(req).await {
+        Ok(res) => println!("Sampler {} status: {}", path, res.status()),
+        Err(err) => println!("Sampler {} failed: {:?}", path, err),
     }
 }
 
@@ -294,6 +260,8 @@ fn write_trace_file(to_write : String) -> std::io::Result<()> {
         .create(true)
         .open("trace.txt")?;
     file.write_all(to_write.as_bytes())?;
+    // one record per line, so the trace can be replayed line by line
+    file.write_all(b"\n")?;
     Ok(())
 }
 